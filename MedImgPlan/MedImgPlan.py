@@ -22,12 +22,19 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+from MedImgPlanLib.UtilStartupTiming import startupTiming
+
+# cost of the imports below, reported once Slicer has started
+startupTiming("MedImgPlan").restart()
+
 import vtk, qt, ctk, slicer
 
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 from MedImgPlanLib.WidgetMedImg import MedImgPlanWidget
 
+startupTiming("MedImgPlan").mark("import")
+
 """
 Check CommandsConfig.json to get UDP messages.
 Check Config.json to get program settings.
@@ -44,6 +51,7 @@ class MedImgPlan(ScriptedLoadableModule):
     """
 
     def __init__(self, parent):
+        startupTiming("MedImgPlan").restart()
         ScriptedLoadableModule.__init__(self, parent)
         self.parent.title = "Medical Image Planning"
         self.parent.categories = ["RoTMS"]
@@ -63,8 +71,11 @@ class MedImgPlan(ScriptedLoadableModule):
 
         # Additional initialization step after application startup is complete
         slicer.app.connect("startupCompleted()", appStartUpPostAction)
+        startupTiming("MedImgPlan").mark("module")
 
 
 def appStartUpPostAction():
-    return
+    # The planning logic and the indicator models are only loaded when the
+    # module is entered, sessions that never open it do not pay for them
+    startupTiming("MedImgPlan").report("launch")
 
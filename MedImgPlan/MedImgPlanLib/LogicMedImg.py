@@ -22,31 +22,77 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import os, json, logging, math, random, yaml, numpy
+import os, json, logging, math, random, time, yaml, numpy
 import vtk, qt, ctk, slicer
 
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 
 from MedImgPlanLib.UtilFormat import utilNumStrFormat
+from MedImgPlanLib.UtilStartupTiming import startupTiming
 from MedImgPlanLib.UtilCalculations import (
     mat2quat,
     utilPosePlan,
+    utilPoseFromNormal,
     rotx,
     roty,
     rotz,
     quat2mat,
     computeScalarFromDistance,
+    HEATMAP_CUTOFF_DISTANCE,
 )
 from MedImgPlanLib.UtilMedImgConnections import MedImgConnections
+from MedImgPlanLib.UtilMeshCache import MeshCache
+from MedImgPlanLib.UtilNodeReferences import NodeReferenceCache
+from MedImgPlanLib.UtilConfig import ConfigService
+from MedImgPlanLib.UtilMEPStore import MEPSampleStore
+from MedImgPlanLib.UtilYAMLCache import (
+    loadLandmarks,
+    loadRegistration,
+    registrationToSlicer,
+)
+from MedImgPlanLib.UtilRegistrationQA import (
+    computeErrorsBatch,
+    readManifest,
+    stackPadded,
+    writeErrorTable,
+)
+from MedImgPlanLib.UtilRegistration import (
+    PointToPlaneICP,
+    compareRegistrations,
+    predictTRE,
+    registerPointsSVD,
+    transformPoints,
+)
+from MedImgPlanLib.UtilICPCloud import (
+    ICPPointCloud,
+    MeshResiduals,
+    computeResidualStatistics,
+)
+from MedImgPlanLib.UtilSkinProjection import SkinProjectionTable, utilMeshSignature
+from MedImgPlanLib.UtilComputeOffload import ComputeOffload
+from MedImgPlanLib.UtilOffloadKernels import (
+    kernelMEPMap,
+    kernelProjectOnMesh,
+    kernelUniformColoring,
+)
 
 from MedImgPlanLib.UtilSlicerFuncs import (
+    arrayFromVTKArray,
+    vtkDoubleArrayFromArray,
     drawAPlane,
     getRotAndPFromMatrix,
     initModelAndTransform,
+    loadIndicatorModel,
+    preloadIndicatorModel,
     setRotation,
     setTransform,
     setTranslation,
+    setModelScalars,
+    getModelScalarsDisplay,
+    restoreModelScalarsDisplay,
+    setPointCloudScalars,
+    showPointCloud,
 )
 
 #
@@ -71,11 +117,82 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         ScriptedLoadableModuleLogic.__init__(self)
         self._configPath = configPath
         self._connections = MedImgConnections(configPath, "MEDIMG")
-        self._connections.setup()
         self._parameterNode = self.getParameterNode()
+        self._nodes = NodeReferenceCache(self._parameterNode)
 
         with open(self._configPath + "CommandsConfig.json") as f:
             self._commandsData = (json.load(f))["MegImgCmd"]
+        # parsed and validated once, reloaded when the file changes
+        self._config = ConfigService(self._configPath)
+        self._config.configChanged = self.utilApplyConfig
+
+        smoothing = self._config["SURFACE_NORMAL_SMOOTHING_ITERATIONS"]
+        self._brainMeshCache = MeshCache(smoothing)
+        self._skinMeshCache = MeshCache(smoothing)
+        self._mepStore = MEPSampleStore()
+        self._skinProjectionTable = SkinProjectionTable()
+        self._skinProjectionSignature = (None, None)
+        self._icpCloud = ICPPointCloud()
+        self._icpResiduals = MeshResiduals()
+        self._icpAlignedPoints = None
+        self._icpResidualsValues = None
+        self._icpResidualsGeneration = 0
+        self._icpTransformObservation = None
+        self._localRegistration = None
+        self._predictedTREObservation = None
+        self._predictedTREGeneration = 0
+        # model node ID -> scalar display shown before the predicted TRE map
+        self._predictedTREPreviousScalars = {}
+        # Heavy mesh computations run in worker processes, the results are
+        # applied back on the main thread
+        self._offload = ComputeOffload(self._config["COMPUTE_OFFLOAD_WORKERS"])
+        self._meshPreparationPending = False
+
+    def utilApplyConfig(self):
+        """
+        Called when Config.json changes. The other settings are read where
+        they are used, the worker count only at module reload.
+        """
+        smoothing = self._config["SURFACE_NORMAL_SMOOTHING_ITERATIONS"]
+        self._brainMeshCache.setNormalSmoothingIterations(smoothing)
+        self._skinMeshCache.setNormalSmoothingIterations(smoothing)
+
+    def utilScheduleMeshPreparation(self):
+        """
+        Build the caches and locators of the selected brain and skin meshes
+        in idle time, instead of in the first planning or TRE query
+        """
+        if not self._meshPreparationPending:
+            self._meshPreparationPending = True
+            qt.QTimer.singleShot(0, self.utilPrepareMeshes)
+
+    def utilPrepareMeshes(self):
+        self._meshPreparationPending = False
+        for role, meshCache in (
+            ("InputMeshBrain", self._brainMeshCache),
+            ("InputMeshSkin", self._skinMeshCache),
+        ):
+            model = self._nodes.get(role)
+            if model and model.GetPolyData():
+                meshCache.prepare(model)
+
+    def utilPreloadIndicatorModels(self):
+        # Only a warm-up: whatever fails here is done again, and reported,
+        # when the models are used
+        timing = startupTiming("MedImgPlan")
+        timing.restart()
+        try:
+            for key in (
+                "POSE_INDICATOR_MODEL",
+                "POSE_INDICATOR_NOTAIL_MODEL",
+                "POINT_INDICATOR_MODEL",
+                "PLANE_INDICATOR_MODEL",
+            ):
+                preloadIndicatorModel(self._config.path(key))
+        except Exception as e:
+            logging.warning("MedImgPlan indicator model preloading failed: " + str(e))
+        timing.mark("indicator models")
+        timing.report("background")
 
     def setDefaultParameters(self, parameterNode):
         """
@@ -103,28 +220,44 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             parameterNode.SetParameter("PlanGridOnPerspPlane", "false")
         if not parameterNode.GetParameter("ToolRotOption"):
             parameterNode.SetParameter("ToolRotOption", "skinclosest")
+        if not parameterNode.GetParameter("HeatMapIncrementalUpdate"):
+            parameterNode.SetParameter("HeatMapIncrementalUpdate", "true")
+        if not parameterNode.GetParameter("PointCloudAsMarkups"):
+            parameterNode.SetParameter("PointCloudAsMarkups", "false")
+        if not parameterNode.GetParameter("UseSkinProjectionTable"):
+            parameterNode.SetParameter("UseSkinProjectionTable", "false")
+        if not parameterNode.GetParameter("HeatMapAggregation"):
+            parameterNode.SetParameter("HeatMapAggregation", "max")
+        if not parameterNode.GetParameter("PredictedTREFLE"):
+            parameterNode.SetParameter("PredictedTREFLE", "1.0")
+        if not parameterNode.GetParameter("PredictedTREOnBrain"):
+            parameterNode.SetParameter("PredictedTREOnBrain", "false")
+        if not parameterNode.GetParameter("PredictedTRELive"):
+            parameterNode.SetParameter("PredictedTRELive", "false")
 
     def processStartTRECalculation(self):
         """
         Called when click the start button
         """
-        inModel = self._parameterNode.GetNodeReference("InputMeshSkin")
+        inModel = self._nodes.get("InputMeshSkin")
         if not inModel:
             slicer.util.errorDisplay("Please select a image model first!")
             return
 
         self._parameterNode = self.getParameterNode()
         self._connections._parameterNode = self.getParameterNode()
-
-        with open(self._configPath + "Config.json") as f:
-            configData = json.load(f)
+        self._nodes.setParameterNode(self._parameterNode)
+        self._connections._nodes = self._nodes
+        self._connections._skinMeshCache = self._skinMeshCache
+        # the sockets are opened the first time the TRE calculation starts
+        self._connections.utilEnsureSetup()
 
         pointOnMeshIndicator = initModelAndTransform(
             self._parameterNode,
             "PointOnMeshTr",
             self._connections._transformMatrixPointOnMesh,
             "PointOnMeshIndicator",
-            self._configPath + configData["POINT_INDICATOR_MODEL"],
+            self._config.path("POINT_INDICATOR_MODEL"),
         )
 
         pointPtrtipIndicator = initModelAndTransform(
@@ -132,7 +265,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             "PointPtrtipTr",
             self._connections._transformMatrixPointPtrtip,
             "PointPtrtipIndicator",
-            self._configPath + configData["POINT_INDICATOR_MODEL"],
+            self._config.path("POINT_INDICATOR_MODEL"),
         )
 
         self._connections._pointOnMeshIndicator = pointOnMeshIndicator
@@ -153,100 +286,48 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         Visualization of the planned landmarks and the digitized landmarks
         """
 
-        # Load digitized landmarks. Convert ROS units to Slicer units
-        with open(pathDigLandmarks, "r") as stream:
-            try:
-                dig = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
-                return
-        numDig, dig_ = dig["NUM"], []
-        for i in range(numDig):
-            dig_.append(
-                [
-                    dig["DIGITIZED"]["d" + str(i)]["x"] * 1000.0,
-                    dig["DIGITIZED"]["d" + str(i)]["y"] * 1000.0,
-                    dig["DIGITIZED"]["d" + str(i)]["z"] * 1000.0,
-                ]
-            )
-        dig_ = numpy.array(dig_).transpose()
-
-        # Load registered results. Convert ROS units to Slicer units
-        with open(pathRegResult, "r") as stream:
-            try:
-                reg = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
-                return
-        rot = [
-            reg["ROTATION"]["x"],
-            reg["ROTATION"]["y"],
-            reg["ROTATION"]["z"],
-            reg["ROTATION"]["w"],
-        ]
-        rot = quat2mat(rot)
-        p = [reg["TRANSLATION"]["x"], reg["TRANSLATION"]["y"], reg["TRANSLATION"]["z"]]
-        rot_ = numpy.array(rot).transpose()
-        p_ = -numpy.matmul(rot_, numpy.array(p).reshape((3, 1))) * 1000.0
+        # Load digitized landmarks and registered results. Convert ROS units to
+        # Slicer units. Both are parsed once per file version.
+        try:
+            dig_ = loadLandmarks(pathDigLandmarks, "DIGITIZED", "d").transpose()
+            rot_, p_ = registrationToSlicer(loadRegistration(pathRegResult))
+        except yaml.YAMLError as exc:
+            print(exc)
+            return
 
         # Get aligned point cloud and visualize
         res = numpy.matmul(rot_, dig_) + p_
-        if self._parameterNode.GetNodeReference("AlignedLandmarks"):
-            markupsNode = self._parameterNode.GetNodeReference("AlignedLandmarks")
-            slicer.mrmlScene.RemoveNode(markupsNode)
-        markupsNode = slicer.mrmlScene.AddNewNodeByClass(
-            "vtkMRMLMarkupsFiducialNode", "Aligned"
+        showPointCloud(
+            self._parameterNode,
+            "AlignedLandmarks",
+            "Aligned",
+            res.transpose(),
+            (0, 1, 0),
+            self._parameterNode.GetParameter("PointCloudAsMarkups") == "true",
         )
-        self._parameterNode.SetNodeReferenceID("AlignedLandmarks", markupsNode.GetID())
-        slicer.modules.markups.logic().SetActiveList(markupsNode)
-
-        for i in res.transpose():
-            slicer.modules.markups.logic().AddControlPoint(i[0], i[1], i[2])
-
-        markupsNode.GetDisplayNode().SetSelectedColor(0, 1, 0)
-        markupsNode.GetDisplayNode().SetTextScale(0)
 
         # Load planned landmarks. Convert ROS units to Slicer units
         if pathDigLandmarks:
-            with open(pathPlanLandmarks, "r") as stream:
-                try:
-                    plan = yaml.safe_load(stream)
-                except yaml.YAMLError as exc:
-                    print(exc)
-                    return
-            numPlan, plan_ = plan["NUM"], []
-            if numDig != numPlan:
+            try:
+                plan_ = loadLandmarks(pathPlanLandmarks, "PLANNED", "p").transpose()
+            except yaml.YAMLError as exc:
+                print(exc)
+                return
+            if dig_.shape[1] != plan_.shape[1]:
                 slicer.util.errorDisplay(
                     "The number of digitized landmarks does not match the number of planned landmarks!"
                 )
                 return
-            for i in range(numPlan):
-                plan_.append(
-                    [
-                        plan["PLANNED"]["p" + str(i)]["x"] * 1000.0,
-                        plan["PLANNED"]["p" + str(i)]["y"] * 1000.0,
-                        plan["PLANNED"]["p" + str(i)]["z"] * 1000.0,
-                    ]
-                )
-            plan_ = numpy.array(plan_).transpose()
 
             # visualize
-            if self._parameterNode.GetNodeReference("AlignedLandmarksPlanned"):
-                markupsNode = self._parameterNode.GetNodeReference(
-                    "AlignedLandmarksPlanned"
-                )
-                slicer.mrmlScene.RemoveNode(markupsNode)
-            markupsNode = slicer.mrmlScene.AddNewNodeByClass(
-                "vtkMRMLMarkupsFiducialNode", "Plan"
-            )
-            self._parameterNode.SetNodeReferenceID(
-                "AlignedLandmarksPlanned", markupsNode.GetID()
+            showPointCloud(
+                self._parameterNode,
+                "AlignedLandmarksPlanned",
+                "Plan",
+                plan_.transpose(),
+                (0, 0, 1),
+                self._parameterNode.GetParameter("PointCloudAsMarkups") == "true",
             )
-            slicer.modules.markups.logic().SetActiveList(markupsNode)
-            markupsNode.GetDisplayNode().SetSelectedColor(0, 0, 1)
-            markupsNode.GetDisplayNode().SetTextScale(0)
-            for i in plan_.transpose():
-                slicer.modules.markups.logic().AddControlPoint(i[0], i[1], i[2])
 
         # Print FRE
         slicer.util.infoDisplay(
@@ -258,51 +339,344 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             "vtkMRMLInteractionNodeSingleton"
         ).SetPlaceModePersistence(0)
 
-    def processVisICP(self, pathICPPoints, pathICPReg, ignoreICP):
+    def processBatchFRE(self, pathManifest, pathTable, visualize=False):
         """
-        Visualization of the ICP digitization points
+        FRE (and TRE, for manifest rows with target files) of all the
+        registration results listed in the manifest, in one vectorized pass.
+        Writes one table row per registration. Only the worst registration
+        is visualized, and only if requested.
         """
+        try:
+            rows = readManifest(pathManifest)
+        except (OSError, ValueError) as exc:
+            slicer.util.errorDisplay(str(exc))
+            return
 
-        with open(pathICPPoints, "r") as stream:
+        kept, digs, plans, regs, digTargets, planTargets = [], [], [], [], [], []
+        for row in rows:
             try:
-                dig_dict = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
-                return
+                dig = loadLandmarks(row[0], "DIGITIZED", "d")
+                plan = loadLandmarks(row[1], "PLANNED", "p")
+                reg = loadRegistration(row[2])
+                if len(row) == 5:
+                    digTarget = loadLandmarks(row[3], "DIGITIZED", "d")
+                    planTarget = loadLandmarks(row[4], "PLANNED", "p")
+                else:
+                    digTarget = planTarget = numpy.zeros((0, 3))
+            except (OSError, KeyError, ValueError, TypeError, yaml.YAMLError) as exc:
+                # Malformed files raise ValueError or TypeError in the array
+                # conversion, they only cost their row
+                print("Skipping " + row[2] + ": " + str(exc))
+                continue
+            if dig.shape[0] != plan.shape[0] or digTarget.shape[0] != planTarget.shape[0]:
+                print(
+                    "Skipping " + row[2] + ": the number of digitized and planned points does not match"
+                )
+                continue
+            kept.append(row)
+            digs.append(dig)
+            plans.append(plan)
+            regs.append(reg)
+            digTargets.append(digTarget)
+            planTargets.append(planTarget)
+
+        if not kept:
+            slicer.util.errorDisplay("No valid registration result in the manifest!")
+            return
+
+        names = [
+            os.path.relpath(row[2], os.path.dirname(os.path.abspath(pathManifest)))
+            for row in kept
+        ]
+        regs = numpy.array(regs)
+        fre = computeErrorsBatch(stackPadded(digs), stackPadded(plans), regs)
+        tre = None
+        if any(len(row) == 5 for row in kept):
+            tre = computeErrorsBatch(
+                stackPadded(digTargets), stackPadded(planTargets), regs
+            )
+        stats = writeErrorTable(pathTable, names, fre, tre)
+        if numpy.all(numpy.isnan(stats["rms"])):
+            print(
+                "Batch FRE of "
+                + str(len(names))
+                + " registrations written to "
+                + pathTable
+                + ". No registration has a valid landmark."
+            )
+            return
+        print(
+            "Batch FRE of "
+            + str(len(names))
+            + " registrations written to "
+            + pathTable
+            + ". RMS (mm) min / median / max: "
+            + utilNumStrFormat(numpy.nanmin(stats["rms"]), 3, 0)
+            + " / "
+            + utilNumStrFormat(numpy.nanmedian(stats["rms"]), 3, 0)
+            + " / "
+            + utilNumStrFormat(numpy.nanmax(stats["rms"]), 3, 0)
+        )
+
+        if visualize:
+            worst = kept[int(numpy.nanargmax(stats["rms"]))]
+            self.processVisFRE(worst[0], worst[1], worst[2])
+
+    def processLocalLandmarkRegistration(self, pathDigLandmarks, pathRegResult=""):
+        """
+        In-process point based registration of the digitized landmarks onto
+        the planned LandmarksMarkups. Cross-checked with the remote
+        registration result if given.
+        """
+        inputMarkupsNode = self._nodes.get("LandmarksMarkups")
+        if not inputMarkupsNode:
+            slicer.util.errorDisplay("Input markup is invalid!")
+            return
+        try:
+            dig = loadLandmarks(pathDigLandmarks, "DIGITIZED", "d")
+        except yaml.YAMLError as exc:
+            print(exc)
+            return
+        plan = slicer.util.arrayFromMarkupsControlPoints(inputMarkupsNode)
+        if dig.shape[0] != plan.shape[0] or dig.shape[0] < 3:
+            slicer.util.errorDisplay(
+                "The number of digitized landmarks does not match the number of planned landmarks!"
+            )
+            return
 
-        dig = []
-        for k in dig_dict.keys():
-            # convert ROS m unit to mm
-            dig.extend([float(i) * 1000.0 for i in dig_dict[k].strip().split(",")[:-1]])
+        start = time.perf_counter()
+        R, t = registerPointsSVD(dig, plan)
+        fre = numpy.linalg.norm(transformPoints(dig, R, t) - plan, axis=1)
+        self._localRegistration = (R, t)
+        print(
+            "Local registration FRE: "
+            + str(fre)
+            + "mm, RMS "
+            + utilNumStrFormat(numpy.sqrt(numpy.mean(fre**2)), 3, 0)
+            + "mm ("
+            + utilNumStrFormat((time.perf_counter() - start) * 1000.0, 2, 0)
+            + "ms)"
+        )
+        if pathRegResult:
+            self.utilCrossCheckRegistration(R, t, pathRegResult, dig)
+        return R, t, fre
+
+    def processLocalICPRegistration(self, pathICPPoints, pathICPReg=""):
+        """
+        In-process point to plane ICP of the ICP point cloud against the skin
+        mesh. Starts from the local landmark registration, or from the remote
+        result if there is none. The result drives TransformICPReg.
+        """
+        skinModel = self._nodes.get("InputMeshSkin")
+        if not skinModel:
+            slicer.util.errorDisplay("Please select skin mesh first!")
+            return
+        try:
+            self._icpCloud.load(pathICPPoints)
+            reg = loadRegistration(pathICPReg) if pathICPReg else None
+        except yaml.YAMLError as exc:
+            print(exc)
+            return
+        if self._localRegistration:
+            R0, t0 = self._localRegistration
+        elif reg is not None:
+            R0, t0 = registrationToSlicer(reg)
+        else:
+            slicer.util.errorDisplay("Please register the landmarks first!")
+            return
 
-        dig_ = numpy.array(dig).reshape((-1, 3)).transpose()
+        start = time.perf_counter()
+        cellSize = self._config["LOCAL_ICP_GRID_CELL_SIZE"]
+        maxDistance = self._config["LOCAL_ICP_MAX_DISTANCE"]
+        maxIterations = self._config["LOCAL_ICP_MAX_ITERATIONS"]
+        self._skinMeshCache.update(skinModel)
+        icp = PointToPlaneICP(
+            self._skinMeshCache.pointGridIndex(cellSize),
+            self._skinMeshCache.smoothedPointNormals(),
+            maxDistance,
+            maxIterations,
+        )
+        try:
+            R, t, info = icp.run(self._icpCloud.points(), R0, t0)
+        except ValueError as exc:
+            slicer.util.errorDisplay(str(exc))
+            return
+        print(
+            "Local ICP residual: "
+            + utilNumStrFormat(info["rms"], 3, 0)
+            + "mm, inliers "
+            + utilNumStrFormat(info["inliers"] * 100.0, 1, 0)
+            + "%, "
+            + str(info["iterations"])
+            + " iterations ("
+            + utilNumStrFormat((time.perf_counter() - start) * 1000.0, 0, 0)
+            + "ms)"
+        )
+        if reg is not None:
+            self.utilCrossCheckRegistration(R, t, pathICPReg, self._icpCloud.points())
+
+        if not self._nodes.get("TransformICPReg"):
+            transformNode = slicer.vtkMRMLTransformNode()
+            slicer.mrmlScene.AddNode(transformNode)
+            self._parameterNode.SetNodeReferenceID(
+                "TransformICPReg", transformNode.GetID()
+            )
+        transformMatrix = vtk.vtkMatrix4x4()
+        setTransform(R, t, transformMatrix)
+        self._nodes.get("TransformICPReg").SetMatrixTransformToParent(transformMatrix)
+        self.utilShowICPPointCloud()
+        return R, t, info
+
+    def utilCrossCheckRegistration(self, R, t, pathRegResult, points):
+        """
+        Print how far a local registration is from the remote one
+        """
+        try:
+            rot_, p_ = registrationToSlicer(loadRegistration(pathRegResult))
+        except (OSError, KeyError, yaml.YAMLError) as exc:
+            print(exc)
+            return
+        angle, translation, displacement = compareRegistrations(
+            R, t, rot_, p_.ravel(), points
+        )
+        print(
+            "Local vs remote registration: rotation "
+            + utilNumStrFormat(angle, 3, 0)
+            + "deg, translation "
+            + utilNumStrFormat(translation, 3, 0)
+            + "mm, max point displacement "
+            + utilNumStrFormat(displacement, 3, 0)
+            + "mm"
+        )
+
+    def processPredictedTREMap(self, interactive=True):
+        """
+        Predicted TRE of the current LandmarksMarkups configuration at every
+        skin (or cortex) vertex, for an FLE of PredictedTREFLE mm, shown as
+        the PredictedTRE scalars of the mesh
+        """
+        inputMarkupsNode = self._nodes.get("LandmarksMarkups")
+        onBrain = self._parameterNode.GetParameter("PredictedTREOnBrain") == "true"
+        inModel = self._nodes.get("InputMeshBrain" if onBrain else "InputMeshSkin")
+        if not inputMarkupsNode or not inModel:
+            if interactive:
+                slicer.util.errorDisplay("Please select landmarks and mesh first!")
+            return
+        fiducials = slicer.util.arrayFromMarkupsControlPoints(inputMarkupsNode)
+        if fiducials.shape[0] < 3:
+            if interactive:
+                slicer.util.errorDisplay("Input landmarks are less than 3!")
+            return
+
+        meshCache = self._brainMeshCache if onBrain else self._skinMeshCache
+        meshCache.update(inModel)
+        tre = predictTRE(
+            fiducials,
+            meshCache.points(),
+            float(self._parameterNode.GetParameter("PredictedTREFLE")),
+        )
+        # Give back the scalars (e.g. the MEP heat map) of the other mesh, and
+        # remember the ones of this mesh before the map covers them
+        self.utilRestorePredictedTREScalars(exceptNode=inModel)
+        if inModel.GetDisplayNode().GetActiveScalarName() != "PredictedTRE":
+            self._predictedTREPreviousScalars[inModel.GetID()] = getModelScalarsDisplay(
+                inModel
+            )
+        setModelScalars(inModel, "PredictedTRE", tre, "Viridis", None)
+        if interactive:
+            colorLegendDisplayNode = (
+                slicer.modules.colors.logic().AddDefaultColorLegendDisplayNode(inModel)
+            )
+            colorLegendDisplayNode.SetLabelFormat("%4.2f mm")
+            colorLegendDisplayNode.SetTitleText("Predicted TRE")
+
+    def processHidePredictedTREMap(self):
+        """
+        Stop the live updates and show the meshes with the scalars they had
+        before the predicted TRE map
+        """
+        self.processSetPredictedTRELive(False)
+        self._predictedTREGeneration += 1
+        self.utilRestorePredictedTREScalars()
+
+    def utilRestorePredictedTREScalars(self, exceptNode=None):
+        for nodeID in list(self._predictedTREPreviousScalars):
+            if exceptNode and nodeID == exceptNode.GetID():
+                continue
+            state = self._predictedTREPreviousScalars.pop(nodeID)
+            node = slicer.mrmlScene.GetNodeByID(nodeID)
+            # Leave the meshes that show other scalars since
+            if (
+                node
+                and node.GetDisplayNode()
+                and node.GetDisplayNode().GetActiveScalarName() == "PredictedTRE"
+            ):
+                restoreModelScalarsDisplay(node, state)
+
+    def processSetPredictedTRELive(self, live):
+        """
+        Recompute the predicted TRE map whenever a landmark is added, moved or
+        removed
+        """
+        if self._predictedTREObservation:
+            node, tags = self._predictedTREObservation
+            for tag in tags:
+                node.RemoveObserver(tag)
+            self._predictedTREObservation = None
+        inputMarkupsNode = self._nodes.get("LandmarksMarkups")
+        if not live or not inputMarkupsNode:
+            return
+        tags = [
+            inputMarkupsNode.AddObserver(
+                event, lambda caller, event: self.utilSchedulePredictedTRE()
+            )
+            for event in (
+                slicer.vtkMRMLMarkupsNode.PointModifiedEvent,
+                slicer.vtkMRMLMarkupsNode.PointAddedEvent,
+                slicer.vtkMRMLMarkupsNode.PointRemovedEvent,
+            )
+        ]
+        self._predictedTREObservation = (inputMarkupsNode, tags)
+        self.processPredictedTREMap()
+
+    def utilSchedulePredictedTRE(self, delay=100):
+        # Dragging a landmark fires many events, only the last one is computed
+        self._predictedTREGeneration += 1
+        generation = self._predictedTREGeneration
+        qt.QTimer.singleShot(
+            delay,
+            lambda: generation == self._predictedTREGeneration
+            and self.processPredictedTREMap(interactive=False),
+        )
+
+    def processVisICP(self, pathICPPoints, pathICPReg, ignoreICP):
+        """
+        Visualization of the ICP digitization points
+        """
+
+        # The raw points are only parsed again if the file changed
+        try:
+            self._icpCloud.load(pathICPPoints)
+        except yaml.YAMLError as exc:
+            print(exc)
+            return
 
         # Load registered results. Convert ROS units to Slicer units
-        with open(pathICPReg, "r") as stream:
-            try:
-                reg = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
-                return
-        if int(reg["FLAG_ICP"]) != 1:
+        try:
+            reg = loadRegistration(pathICPReg)
+        except yaml.YAMLError as exc:
+            print(exc)
+            return
+        if reg[7] != 1:
             if ignoreICP:
                 pass
             else:
                 slicer.util.errorDisplay("ICP was not done yet!")
                 return
 
-        rot = [
-            reg["ROTATION"]["x"],
-            reg["ROTATION"]["y"],
-            reg["ROTATION"]["z"],
-            reg["ROTATION"]["w"],
-        ]
-        rot = quat2mat(rot)
-        p = [reg["TRANSLATION"]["x"], reg["TRANSLATION"]["y"], reg["TRANSLATION"]["z"]]
-        rot_ = numpy.array(rot).transpose()
-        p_ = -numpy.matmul(rot_, numpy.array(p).reshape((3, 1))) * 1000.0
+        rot_, p_ = registrationToSlicer(reg)
 
-        if not self._parameterNode.GetNodeReference("TransformICPReg"):
+        if not self._nodes.get("TransformICPReg"):
             transformNode = slicer.vtkMRMLTransformNode()
             slicer.mrmlScene.AddNode(transformNode)
             self._parameterNode.SetNodeReferenceID(
@@ -311,26 +685,11 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
 
         transformMatrix = vtk.vtkMatrix4x4()
         setTransform(rot_, p_, transformMatrix)
-        targetPoseTransform = self._parameterNode.GetNodeReference("TransformICPReg")
+        targetPoseTransform = self._nodes.get("TransformICPReg")
         targetPoseTransform.SetMatrixTransformToParent(transformMatrix)
 
-        # Get aligned point cloud and visualize
-        res = numpy.matmul(rot_, dig_) + p_
-        if self._parameterNode.GetNodeReference("AlignedICPPointClouds"):
-            markupsNode = self._parameterNode.GetNodeReference("AlignedICPPointClouds")
-            slicer.mrmlScene.RemoveNode(markupsNode)
-        markupsNode = slicer.mrmlScene.AddNewNodeByClass(
-            "vtkMRMLMarkupsFiducialNode", "AlignedICP"
-        )
-        self._parameterNode.SetNodeReferenceID(
-            "AlignedICPPointClouds", markupsNode.GetID()
-        )
-        slicer.modules.markups.logic().SetActiveList(markupsNode)
-        markupsNode.GetDisplayNode().SetSelectedColor(0, 1, 0)
-        markupsNode.GetDisplayNode().SetTextScale(0)
-
-        for i in res.transpose():
-            slicer.modules.markups.logic().AddControlPoint(i[0], i[1], i[2])
+        # Raw point cloud, aligned by the registration transform node
+        self.utilShowICPPointCloud()
 
         # Disable control point placement
         slicer.mrmlScene.GetNodeByID(
@@ -389,7 +748,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         drawAPlane(
             mat,
             p,
-            self._configPath,
+            self._config.path("PLANE_INDICATOR_MODEL"),
             "PlaneOnMeshIndicator",
             "PlaneOnMeshTransform",
             self._parameterNode,
@@ -403,6 +762,12 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             self.processToolPoseParameterNodeSet("TargetPoseTransformCortex", p, mat)
             # 2. Skin option (projected using cortex rot)
             pSkin, matSkin = self.processSearchForSkinProjection(p, mat)
+            if pSkin is None:
+                slicer.util.errorDisplay(
+                    "The cortex normal does not intersect the skin, "
+                    "the closest point on the skin is used instead!"
+                )
+                pSkin, matSkin = self.processSearchForSkinClosestProjection(p)
             # print(pSkin, matSkin)
             self.processToolPoseParameterNodeSet(
                 "TargetPoseTransformSkin", pSkin, matSkin
@@ -410,7 +775,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             drawAPlane(
                 matSkin,
                 pSkin,
-                self._configPath,
+                self._config.path("PLANE_INDICATOR_MODEL"),
                 "PlaneOnMeshSkinIndicator",
                 "PlaneOnMeshSkinTransform",
                 self._parameterNode,
@@ -424,7 +789,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             drawAPlane(
                 matSkinClosest,
                 pSkinClosest,
-                self._configPath,
+                self._config.path("PLANE_INDICATOR_MODEL"),
                 "PlaneOnMeshSkinClosestIndicator",
                 "PlaneOnMeshSkinClosestTransform",
                 self._parameterNode,
@@ -457,15 +822,15 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
 
     def processToolPosePlanMeshReCheck(self):
         if self._parameterNode.GetParameter("PlanOnBrain") == "true":
-            targetPoseTransform = self._parameterNode.GetNodeReference(
+            targetPoseTransform = self._nodes.get(
                 "TargetPoseTransformCortex"
             ).GetMatrixTransformToParent()
             p, mat = getRotAndPFromMatrix(targetPoseTransform)
-            targetPoseTransform = self._parameterNode.GetNodeReference(
+            targetPoseTransform = self._nodes.get(
                 "TargetPoseTransformSkin"
             ).GetMatrixTransformToParent()
             pSkin, matSkin = getRotAndPFromMatrix(targetPoseTransform)
-            targetPoseTransform = self._parameterNode.GetNodeReference(
+            targetPoseTransform = self._nodes.get(
                 "TargetPoseTransformSkinClosest"
             ).GetMatrixTransformToParent()
             pSkinClosest, matSkinClosest = getRotAndPFromMatrix(targetPoseTransform)
@@ -486,7 +851,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
 
     def processToolPoseParameterNodeSet(self, nodename, p, mat):
 
-        if not self._parameterNode.GetNodeReference(nodename):
+        if not self._nodes.get(nodename):
             transformNode = slicer.vtkMRMLTransformNode()
             transformNodeSingleton = slicer.vtkMRMLTransformNode()
             slicer.mrmlScene.AddNode(transformNode)
@@ -501,20 +866,18 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         transformMatrixSingleton = vtk.vtkMatrix4x4()
         setTransform(mat, p, transformMatrix)
         setTransform(mat, p, transformMatrixSingleton)
-        targetPoseTransform = self._parameterNode.GetNodeReference(nodename)
-        targetPoseTransformSingleton = self._parameterNode.GetNodeReference(
-            nodename + "Singleton"
-        )
+        targetPoseTransform = self._nodes.get(nodename)
+        targetPoseTransformSingleton = self._nodes.get(nodename + "Singleton")
         targetPoseTransform.SetMatrixTransformToParent(transformMatrix)
         targetPoseTransformSingleton.SetMatrixTransformToParent(
             transformMatrixSingleton
         )
 
     def processPushToolPosePlanRand(self):
-        if not self._parameterNode.GetNodeReference("TargetPoseTransform"):
+        if not self._nodes.get("TargetPoseTransform"):
             slicer.util.errorDisplay("Please plan tool pose first!")
             return
-        targetPoseTransform = self._parameterNode.GetNodeReference(
+        targetPoseTransform = self._nodes.get(
             "TargetPoseTransform"
         ).GetMatrixTransformToParent()
         temp = vtk.vtkMatrix4x4()
@@ -573,44 +936,26 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             inputMarkupsNode.GetNthFiducialPosition(1, override_y)
 
             if self._parameterNode.GetParameter("PlanOnBrain") == "true":
-                inModel = self._parameterNode.GetNodeReference("InputMeshBrain")
+                inModel = self._nodes.get("InputMeshBrain")
                 self._parameterNode.SetNodeReferenceID(
                     "BrainMeshOffsetTransform", inModel.GetParentTransformNode().GetID()
                 )
-                transformFilter = vtk.vtkTransformPolyDataFilter()
-                transformFilterTransform = vtk.vtkTransform()
-                transformFilterTransform.SetMatrix(
-                    self._parameterNode.GetNodeReference(
-                        "BrainMeshOffsetTransform"
-                    ).GetMatrixTransformToParent()
-                )
-                transformFilter.SetTransform(transformFilterTransform)
-                transformFilter.SetInputData(inModel.GetPolyData())
-                transformFilter.Update()
-                inModel = transformFilter.GetOutput()
+                meshCache = self._brainMeshCache
 
             if self._parameterNode.GetParameter("PlanOnBrain") == "false":
-                inModel = self._parameterNode.GetNodeReference("InputMeshSkin")
-                inModel = inModel.GetPolyData()
+                inModel = self._nodes.get("InputMeshSkin")
+                meshCache = self._skinMeshCache
             if not inModel:
                 slicer.util.errorDisplay("Please select a image model first!")
                 return
 
-            cellLocator1 = vtk.vtkCellLocator()
-            cellLocator1.SetDataSet(inModel)
-            cellLocator1.BuildLocator()
-            closestPoint = [0.0, 0.0, 0.0]
-            cellObj = vtk.vtkGenericCell()
-            cellId, subId, dist2 = vtk.mutable(0), vtk.mutable(0), vtk.mutable(0.0)
-            cellLocator1.FindClosestPoint(
-                p, closestPoint, cellObj, cellId, subId, dist2
-            )
-
-            cellObj.GetPoints().GetPoint(0, a)
-            cellObj.GetPoints().GetPoint(1, b)
-            cellObj.GetPoints().GetPoint(2, c)
-
-            mat = utilPosePlan(a, b, c, p, override_y)
+            # Surface frame at the closest point on the mesh, from the cached
+            # smoothed normals
+            meshCache.update(inModel)
+            closestPoint, cellId = meshCache.findClosestPointOnSurface(p)
+            mat = meshCache.surfaceFrames(
+                [cellId], [closestPoint], override_y, origins=[p]
+            )[0].tolist()
 
             self._override_y = override_y
 
@@ -619,14 +964,19 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
     def processSearchForSkinProjection(self, pcortex, matcortex):
         """
         Find the projection pose (pos & rot) on the skin. The rot will be
-        the tangential plane on theskin.
+        the tangential plane on theskin. Returns None, None if the ray along
+        the cortex normal misses the skin.
         """
-        inModel = self._parameterNode.GetNodeReference("InputMeshSkin")
+        if self.utilSkinProjectionTableReady():
+            # Interpolated from the table, the ray is along the cortex normal
+            pSkin, nSkin, _, _ = self._skinProjectionTable.query(
+                self._brainMeshCache, pcortex
+            )
+            if pSkin is not None:
+                return pSkin, utilPoseFromNormal(nSkin, pSkin, self._override_y)
 
-        # Construct cell locator
-        cellLocator = vtk.vtkCellLocator()
-        cellLocator.SetDataSet(inModel.GetPolyData())
-        cellLocator.BuildLocator()
+        inModel = self._nodes.get("InputMeshSkin")
+        self._skinMeshCache.update(inModel)
 
         # Construct a ray from cortex target point, along the perpendicular direction of cortex
         # at the cortex target point.
@@ -639,24 +989,19 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
 
         # Init some needed parameters.
         cl_pIntSect, cl_pcoords = [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
-        cl_t, cl_sub_id = vtk.mutable(0), vtk.mutable(0)
-        a, b, c = [0, 0, 0], [0, 0, 0], [0, 0, 0]
-        cellObj = vtk.vtkGenericCell()
-        cellId, subId, dist2 = vtk.mutable(0), vtk.mutable(0), vtk.mutable(0.0)
-        closestPoint = [0.0, 0.0, 0.0]
+        cl_t, cl_sub_id, cl_cell_id = vtk.mutable(0), vtk.mutable(0), vtk.mutable(0)
 
         # Search for the projected point on the skin.
-        cellLocator.IntersectWithLine(
-            pcortex, ray_point, 1e-6, cl_t, cl_pIntSect, cl_pcoords, cl_sub_id
-        )
+        if not self._skinMeshCache.cellLocator().IntersectWithLine(
+            pcortex, ray_point, 1e-6, cl_t, cl_pIntSect, cl_pcoords, cl_sub_id, cl_cell_id
+        ):
+            return None, None
         pSkin = [cl_pIntSect[0], cl_pIntSect[1], cl_pIntSect[2]]
 
-        # Search for the tangential plane on the skin
-        cellLocator.FindClosestPoint(pSkin, closestPoint, cellObj, cellId, subId, dist2)
-        cellObj.GetPoints().GetPoint(0, a)
-        cellObj.GetPoints().GetPoint(1, b)
-        cellObj.GetPoints().GetPoint(2, c)
-        matSkin = utilPosePlan(a, b, c, pSkin, self._override_y)
+        # Tangential plane on the skin, from the cached smoothed normals
+        matSkin = self._skinMeshCache.surfaceFrames(
+            [int(cl_cell_id)], [pSkin], self._override_y
+        )[0].tolist()
 
         return pSkin, matSkin
 
@@ -665,42 +1010,107 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         Find the closest point on the skin. The rot will be
         the tangential plane on the skin.
         """
-        inModel = self._parameterNode.GetNodeReference("InputMeshSkin")
+        if self.utilSkinProjectionTableReady():
+            _, _, pSkinClosest, nSkinClosest = self._skinProjectionTable.query(
+                self._brainMeshCache, pcortex
+            )
+            return pSkinClosest, utilPoseFromNormal(
+                nSkinClosest, pSkinClosest, self._override_y
+            )
 
-        # Construct cell locator
-        cellLocator = vtk.vtkCellLocator()
-        cellLocator.SetDataSet(inModel.GetPolyData())
-        cellLocator.BuildLocator()
-
-        # Init some needed parameters.
-        a, b, c = [0, 0, 0], [0, 0, 0], [0, 0, 0]
-        cellObj = vtk.vtkGenericCell()
-        cellId, subId, dist2 = vtk.mutable(0), vtk.mutable(0), vtk.mutable(0.0)
-        closestPoint = [0.0, 0.0, 0.0]
+        inModel = self._nodes.get("InputMeshSkin")
+        self._skinMeshCache.update(inModel)
 
         # Search for the tangential plane on the skin
-        cellLocator.FindClosestPoint(
-            pcortex, closestPoint, cellObj, cellId, subId, dist2
-        )
-        cellObj.GetPoints().GetPoint(0, a)
-        cellObj.GetPoints().GetPoint(1, b)
-        cellObj.GetPoints().GetPoint(2, c)
-        matSkinClosest = utilPosePlan(a, b, c, closestPoint, self._override_y)
+        closestPoint, cellId = self._skinMeshCache.findClosestPointOnSurface(pcortex)
+        matSkinClosest = self._skinMeshCache.surfaceFrames(
+            [cellId], [closestPoint], self._override_y
+        )[0].tolist()
 
         return closestPoint, matSkinClosest
 
-    def processToolPosePlanVisualizationInit(self):
-        if not self._parameterNode.GetNodeReference("TargetPoseIndicator"):
-            with open(self._configPath + "Config.json") as f:
-                configData = json.load(f)
-            inputModel = slicer.util.loadModel(
-                self._configPath + configData["POSE_INDICATOR_MODEL"]
+    def processBuildSkinProjectionTable(self):
+        """
+        Precompute the skin projections of all the cortex vertices. Runs in
+        chunks on the main thread, so that the GUI stays responsive.
+        """
+        signature = self.utilSkinProjectionSignature()
+        if signature is None:
+            slicer.util.errorDisplay("Please select brain and skin meshes first!")
+            return
+        self._skinProjectionTable.reset(
+            self._brainMeshCache.points().shape[0], signature
+        )
+        qt.QTimer.singleShot(0, self.utilBuildSkinProjectionTableChunk)
+
+    def utilBuildSkinProjectionTableChunk(self):
+        if self.utilSkinProjectionSignature() != self._skinProjectionTable.signature():
+            print("Meshes changed, skin projection table not built")
+            return
+        if self._skinProjectionTable.buildChunk(
+            self._brainMeshCache, self._skinMeshCache
+        ):
+            print("Skin projection table built")
+        else:
+            qt.QTimer.singleShot(0, self.utilBuildSkinProjectionTableChunk)
+
+    def processSaveSkinProjectionTable(self, path):
+        if not self._skinProjectionTable.isComplete():
+            slicer.util.errorDisplay("Please build the skin projection table first!")
+            return
+        try:
+            self._skinProjectionTable.save(path)
+        except OSError as exc:
+            slicer.util.errorDisplay("Cannot save the skin projection table: " + str(exc))
+
+    def processLoadSkinProjectionTable(self, path):
+        try:
+            self._skinProjectionTable.load(path)
+        except (OSError, ValueError, KeyError) as exc:
+            slicer.util.errorDisplay("Cannot load the skin projection table: " + str(exc))
+            return
+        if self._skinProjectionTable.signature() != self.utilSkinProjectionSignature():
+            slicer.util.errorDisplay(
+                "Skin projection table does not match the selected meshes!"
+            )
+
+    def utilSkinProjectionSignature(self):
+        """
+        Signature of the brain (with its offset) and skin meshes, recomputed
+        only when one of them changed
+        """
+        brainModel = self._nodes.get("InputMeshBrain")
+        skinModel = self._nodes.get("InputMeshSkin")
+        if not brainModel or not skinModel:
+            return None
+        self._brainMeshCache.update(brainModel)
+        self._skinMeshCache.update(skinModel)
+        key = (self._brainMeshCache.key(), self._skinMeshCache.key())
+        if self._skinProjectionSignature[0] != key:
+            self._skinProjectionSignature = (
+                key,
+                utilMeshSignature(
+                    self._brainMeshCache.points(), self._skinMeshCache.points()
+                ),
             )
+        return self._skinProjectionSignature[1]
+
+    def utilSkinProjectionTableReady(self):
+        return (
+            self._parameterNode.GetParameter("UseSkinProjectionTable") == "true"
+            and self._skinProjectionTable.isComplete()
+            and self._skinProjectionTable.signature()
+            == self.utilSkinProjectionSignature()
+        )
+
+    def processToolPosePlanVisualizationInit(self):
+        if not self._nodes.get("TargetPoseIndicator"):
+            inputModel = loadIndicatorModel(self._config.path("POSE_INDICATOR_MODEL"))
             self._parameterNode.SetNodeReferenceID(
                 "TargetPoseIndicator", inputModel.GetID()
             )
             inputModel.GetDisplayNode().SetColor(0, 1, 0)
-        if not self._parameterNode.GetNodeReference("TargetPoseIndicatingLine"):
+        if not self._nodes.get("TargetPoseIndicatingLine"):
             lineNode = slicer.mrmlScene.AddNewNodeByClass(
                 "vtkMRMLMarkupsLineNode", "TargetPoseIndicatingLine"
             )
@@ -710,16 +1120,12 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
 
     def processToolPosePlanVisualization(self):
         self.processToolPosePlanVisualizationInit()
-        targetPoseIndicator = self._parameterNode.GetNodeReference(
-            "TargetPoseIndicator"
-        )
+        targetPoseIndicator = self._nodes.get("TargetPoseIndicator")
         targetPoseIndicator.SetAndObserveTransformNodeID(
-            self._parameterNode.GetNodeReference("TargetPoseTransform").GetID()
+            self._nodes.get("TargetPoseTransform").GetID()
         )
-        lineNode = self._parameterNode.GetNodeReference("TargetPoseIndicatingLine")
-        transf = self._parameterNode.GetNodeReference(
-            "TargetPoseTransform"
-        ).GetMatrixTransformToParent()
+        lineNode = self._nodes.get("TargetPoseIndicatingLine")
+        transf = self._nodes.get("TargetPoseTransform").GetMatrixTransformToParent()
         if lineNode.GetNumberOfControlPoints() == 0:
             lineNode.AddControlPoint(0, 0, 0)
             lineNode.AddControlPoint(0, 0, 0)
@@ -765,7 +1171,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         """
         Utility function to recurrantly send landmarks (landmarks on medical image)
         """
-        inputMarkupsNode = self._parameterNode.GetNodeReference("LandmarksMarkups")
+        inputMarkupsNode = self._nodes.get("LandmarksMarkups")
         numOfFid = inputMarkupsNode.GetNumberOfFiducials()
 
         if curIdx == numOfFid:
@@ -803,11 +1209,11 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             self.utilSendLandmarks(curIdx)
 
     def processManualAdjustTool(self, arr):
-        if not self._parameterNode.GetNodeReference("TargetPoseTransform"):
+        if not self._nodes.get("TargetPoseTransform"):
             slicer.util.errorDisplay("Please plan tool pose first!")
             return
 
-        targetPoseTransform = self._parameterNode.GetNodeReference(
+        targetPoseTransform = self._nodes.get(
             "TargetPoseTransform"
         ).GetMatrixTransformToParent()
         temp = vtk.vtkMatrix4x4()
@@ -843,18 +1249,16 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         ### 2. Validate error each time it is done
 
         # check if registration result exists
-        if not self._parameterNode.GetNodeReference("TransformICPReg"):
+        if not self._nodes.get("TransformICPReg"):
             slicer.util.errorDisplay("Please show ICP results first!")
             return
 
-        # get the original registration result
-        targetPoseTransform = self._parameterNode.GetNodeReference(
-            "TargetPoseTransform"
-        ).GetMatrixTransformToParent()
+        # get the current registration result
+        regTransform = self._nodes.get("TransformICPReg").GetMatrixTransformToParent()
 
         # initialize an offset matrix
         temp = vtk.vtkMatrix4x4()
-        temp.DeepCopy(targetPoseTransform)
+        temp.DeepCopy(regTransform)
 
         # apply offset - translation
         tempOffset = vtk.vtkMatrix4x4()
@@ -873,60 +1277,119 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             setRotation(rotz(arr[5]), tempOffset)
         vtk.vtkMatrix4x4.Multiply4x4(temp, tempOffset, temp)
 
-        p, mat = getRotAndPFromMatrix(temp)
+        # Update transformation parameter. The point cloud is under this
+        # transform, so this is all it takes to move it.
+        self._nodes.get("TransformICPReg").SetMatrixTransformToParent(temp)
 
-        # Update transformation parameter
-        self._parameterNode.GetNodeReference(
-            "TransformICPReg"
-        ).SetMatrixTransformToParent(temp)
+        # make sure the displayed points are the ones of the selected file.
+        # The residual map follows the transform by itself.
+        try:
+            if self._icpCloud.load(pathICPPoints) or not self._nodes.get(
+                "AlignedICPPointClouds"
+            ):
+                self.utilShowICPPointCloud()
+        except yaml.YAMLError as exc:
+            print(exc)
+            return
 
-        # load digitized points
-        with open(pathICPPoints, "r") as stream:
-            try:
-                dig_dict = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
-                return
-        dig = []
-        for k in dig_dict.keys():
-            # convert ROS m unit to mm
-            dig.extend([float(i) * 1000.0 for i in dig_dict[k].strip().split(",")[:-1]])
-        dig_ = numpy.array(dig).reshape((-1, 3)).transpose()
-
-        # apply new position of the points
-
-        p = numpy.array(p).reshape((3, 1))
-        mat = numpy.array(mat)
-        res = numpy.matmul(mat, dig_) + p
-
-        # Method 1: change position point by point. Very slow
-        # markupsNode = self._parameterNode.GetNodeReference("AlignedICPPointClouds")
-        # for idx, i in enumerate(res.transpose()):
-        #     markupsNode.SetNthControlPointPosition(idx, i[0], i[1], i[2])
-
-        # Method 2: Remove old and visualize again
-        if self._parameterNode.GetNodeReference("AlignedICPPointClouds"):
-            markupsNode = self._parameterNode.GetNodeReference("AlignedICPPointClouds")
-            slicer.mrmlScene.RemoveNode(markupsNode)
-        markupsNode = slicer.mrmlScene.AddNewNodeByClass(
-            "vtkMRMLMarkupsFiducialNode", "AlignedICP"
-        )
-        self._parameterNode.SetNodeReferenceID(
-            "AlignedICPPointClouds", markupsNode.GetID()
+    def utilShowICPPointCloud(self):
+        pointCloudNode = showPointCloud(
+            self._parameterNode,
+            "AlignedICPPointClouds",
+            "AlignedICP",
+            self._icpCloud.points(),
+            (0, 1, 0),
+            self._parameterNode.GetParameter("PointCloudAsMarkups") == "true",
         )
-        slicer.modules.markups.logic().SetActiveList(markupsNode)
-        markupsNode.GetDisplayNode().SetSelectedColor(0, 1, 0)
-        markupsNode.GetDisplayNode().SetTextScale(0)
+        regTransform = self._nodes.get("TransformICPReg")
+        pointCloudNode.SetAndObserveTransformNodeID(regTransform.GetID())
+
+        # Any change of the registration (manual nudges, Transforms module,
+        # local ICP) refreshes the residual map
+        if not self._icpTransformObservation or self._icpTransformObservation[0] != regTransform:
+            if self._icpTransformObservation:
+                self._icpTransformObservation[0].RemoveObserver(
+                    self._icpTransformObservation[1]
+                )
+            tag = regTransform.AddObserver(
+                slicer.vtkMRMLTransformableNode.TransformModifiedEvent,
+                lambda caller, event: self.utilScheduleICPResiduals(),
+            )
+            self._icpTransformObservation = (regTransform, tag)
+        self.utilScheduleICPResiduals()
 
-        for i in res.transpose():
-            slicer.modules.markups.logic().AddControlPoint(i[0], i[1], i[2])
+    def utilRemoveObservations(self):
+        """
+        Stop refreshing the ICP residual and predicted TRE maps, called when
+        the module is cleaned up (e.g. on reload)
+        """
+        if self._icpTransformObservation:
+            self._icpTransformObservation[0].RemoveObserver(
+                self._icpTransformObservation[1]
+            )
+            self._icpTransformObservation = None
+        if self._predictedTREObservation:
+            node, tags = self._predictedTREObservation
+            for tag in tags:
+                node.RemoveObserver(tag)
+            self._predictedTREObservation = None
+        # drop the updates already scheduled
+        self._icpResidualsGeneration += 1
+        self._predictedTREGeneration += 1
+
+    def utilScheduleICPResiduals(self, delay=50):
+        """
+        Recompute the residuals of the aligned ICP points against the skin
+        once the registration stopped changing for delay ms. A newer request
+        supersedes the pending one.
+        """
+        self._icpResidualsGeneration += 1
+        generation = self._icpResidualsGeneration
+        qt.QTimer.singleShot(delay, lambda: self.utilUpdateICPResiduals(generation))
 
-        # Disable control point placement
-        slicer.mrmlScene.GetNodeByID(
-            "vtkMRMLInteractionNodeSingleton"
-        ).SetPlaceModePersistence(0)
+    def utilUpdateICPResiduals(self, generation):
+        """
+        Signed distance of every aligned ICP point to the skin in one batched
+        call, shown as point scalars and summarized in ICPResidualStats
+        """
+        if generation != self._icpResidualsGeneration:
+            return
+        skinModel = self._nodes.get("InputMeshSkin")
+        regTransform = self._nodes.get("TransformICPReg")
+        pointCloudNode = self._nodes.get("AlignedICPPointClouds")
+        if not skinModel or not regTransform or not pointCloudNode:
+            return
+        self._skinMeshCache.update(skinModel)
+        self._icpResiduals.update(self._skinMeshCache)
+        mtx = slicer.util.arrayFromVTKMatrix(regTransform.GetMatrixTransformToParent())
+        self._icpAlignedPoints = self._icpCloud.points() @ mtx[:3, :3].T + mtx[:3, 3]
+        self._icpResidualsValues = self._icpResiduals.signedDistances(
+            self._icpAlignedPoints
+        )
+        if self._icpResidualsValues.shape[0] == 0:
+            return
 
-        slicer.util.infoDisplay("Alignment change complete")
+        setPointCloudScalars(
+            pointCloudNode,
+            "ICPResiduals",
+            self._icpResidualsValues,
+            self._config["ICP_RESIDUAL_COLOR_RANGE"],
+        )
+        stats = computeResidualStatistics(self._icpResidualsValues)
+        self._parameterNode.SetParameter(
+            "ICPResidualStats",
+            "RMS "
+            + utilNumStrFormat(stats["rms"], 2, 0)
+            + " | max "
+            + utilNumStrFormat(stats["max"], 2, 0)
+            + " | P50 "
+            + utilNumStrFormat(stats["p50"], 2, 0)
+            + " | P90 "
+            + utilNumStrFormat(stats["p90"], 2, 0)
+            + " | P95 "
+            + utilNumStrFormat(stats["p95"], 2, 0)
+            + " mm",
+        )
 
     def processGenerateGridIncrementDir(self, n):
         # Output the direction arr of a squre spiral pattern
@@ -964,11 +1427,11 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         arr = self.processGenerateGridIncrementDir(numOfGrid)
 
         if self._parameterNode.GetParameter("PlanOnBrain") == "true":
-            targetPoseTransform = self._parameterNode.GetNodeReference(
+            targetPoseTransform = self._nodes.get(
                 "TargetPoseTransformCortex"
             ).GetMatrixTransformToParent()
         else:
-            targetPoseTransform = self._parameterNode.GetNodeReference(
+            targetPoseTransform = self._nodes.get(
                 "TargetPoseTransform"
             ).GetMatrixTransformToParent()
 
@@ -1013,102 +1476,59 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
             for i in range(prevnum):
                 if i >= curnum:
                     slicer.mrmlScene.RemoveNode(
-                        self._parameterNode.GetNodeReference(
-                            "GridPlanTransformNum" + str(i)
-                        )
+                        self._nodes.get("GridPlanTransformNum" + str(i))
                     )
                     slicer.mrmlScene.RemoveNode(
-                        self._parameterNode.GetNodeReference(
-                            "GridPlanIndicatorNum" + str(i)
-                        )
+                        self._nodes.get("GridPlanIndicatorNum" + str(i))
                     )
 
     def processVisualizeAndLogPlanGrid(self, coor):
 
         self.processClearPrevGridPlan()
-        with open(self._configPath + "Config.json") as f:
-            configData = json.load(f)
-        idx = -1
 
         if self._parameterNode.GetParameter("PlanOnBrain") == "true":
-            inModel = self._parameterNode.GetNodeReference("InputMeshBrain")
+            inModel = self._nodes.get("InputMeshBrain")
             self._parameterNode.SetNodeReferenceID(
                 "BrainMeshOffsetTransform", inModel.GetParentTransformNode().GetID()
             )
-            transformFilter = vtk.vtkTransformPolyDataFilter()
-            transformFilterTransform = vtk.vtkTransform()
-            transformFilterTransform.SetMatrix(
-                self._parameterNode.GetNodeReference(
-                    "BrainMeshOffsetTransform"
-                ).GetMatrixTransformToParent()
-            )
-            transformFilter.SetTransform(transformFilterTransform)
-            transformFilter.SetInputData(inModel.GetPolyData())
-            transformFilter.Update()
-            inModel = transformFilter.GetOutput()
+            meshName, meshCache = "brain", self._brainMeshCache
         if self._parameterNode.GetParameter("PlanOnBrain") == "false":
-            inModel = self._parameterNode.GetNodeReference("InputMeshSkin")
-            inModel = inModel.GetPolyData()
+            inModel = self._nodes.get("InputMeshSkin")
+            meshName, meshCache = "skin", self._skinMeshCache
         if not inModel:
             slicer.util.errorDisplay("Please select a image model first!")
             return
+        meshCache.update(inModel)
+        meshKey = meshCache.key()
 
+        # Project all the grid poses on the mesh along their z axes, in the
+        # compute workers
+        origins, directions = [], []
         for i in coor:
-            idx += 1
-
             p, mat = getRotAndPFromMatrix(i)
-            cellLocator2 = vtk.vtkCellLocator()
-            cellLocator2.SetDataSet(inModel)
-            cellLocator2.BuildLocator()
-
-            ray_length = 0.0
-            cl_pIntSect = [float("nan"), float("nan"), float("nan")]
-            while math.isnan(sum(cl_pIntSect)) and ray_length < 1000:
-                ray_point1, ray_point2 = [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
-                ray_length += 5.0
-
-                ray_point1[0], ray_point1[1], ray_point1[2] = (
-                    p[0] + ray_length * mat[0][2],
-                    p[1] + ray_length * mat[1][2],
-                    p[2] + ray_length * mat[2][2],
-                )
-                ray_point2[0], ray_point2[1], ray_point2[2] = (
-                    p[0] - ray_length * mat[0][2],
-                    p[1] - ray_length * mat[1][2],
-                    p[2] - ray_length * mat[2][2],
-                )
-
-                cl_pIntSect, cl_pcoords = [float("nan"), float("nan"), float("nan")], [
-                    0.0,
-                    0.0,
-                    0.0,
-                ]
-                cellObj, cellId, cl_t, cl_sub_id = (
-                    vtk.vtkGenericCell(),
-                    vtk.mutable(0),
-                    vtk.mutable(0),
-                    vtk.mutable(0),
-                )
-                cellLocator2.IntersectWithLine(
-                    ray_point1,
-                    ray_point2,
-                    1e-6,
-                    cl_t,
-                    cl_pIntSect,
-                    cl_pcoords,
-                    cl_sub_id,
-                    cellId,
-                    cellObj,
-                )
-
-            p[0], p[1], p[2] = cl_pIntSect[0], cl_pIntSect[1], cl_pIntSect[2]
+            origins.append(p)
+            directions.append([mat[0][2], mat[1][2], mat[2][2]])
+        self._offload.exportMesh(meshName, meshCache)
+        self._offload.submit(
+            "gridprojection",
+            meshName,
+            kernelProjectOnMesh,
+            (numpy.array(origins), numpy.array(directions)),
+            lambda res: self.utilApplyPlanGridProjection(coor, meshCache, meshKey, *res),
+        )
 
-            a, b, c = [0, 0, 0], [0, 0, 0], [0, 0, 0]
-            cellObj.GetPoints().GetPoint(0, a)
-            cellObj.GetPoints().GetPoint(1, b)
-            cellObj.GetPoints().GetPoint(2, c)
+    def utilApplyPlanGridProjection(self, coor, meshCache, meshKey, hits, triangleIds):
+        if meshCache.key() != meshKey:
+            return
+        if numpy.any(triangleIds < 0):
+            slicer.util.errorDisplay("Grid points could not be projected on the mesh!")
+            return
 
-            mat = utilPosePlan(a, b, c, p, self._override_y)
+        # Surface frames of all the grid points in one call
+        mats = meshCache.surfaceFrames(triangleIds, hits, self._override_y)
+        for idx, i in enumerate(coor):
+            p = hits[idx].tolist()
+            mat = mats[idx].tolist()
 
             setTranslation(p, i)
             setRotation(mat, i)
@@ -1118,13 +1538,13 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
                 "GridPlanTransformNum" + str(idx),
                 i,
                 "GridPlanIndicatorNum" + str(idx),
-                self._configPath + configData["POSE_INDICATOR_NOTAIL_MODEL"],
+                self._config.path("POSE_INDICATOR_NOTAIL_MODEL"),
             )
-            self._parameterNode.GetNodeReference(
+            self._nodes.get(
                 "GridPlanIndicatorNum" + str(idx)
             ).GetDisplayNode().SetColor(0, 0, 1)
             if idx == 0:
-                self._parameterNode.GetNodeReference(
+                self._nodes.get(
                     "GridPlanIndicatorNum" + str(idx)
                 ).GetDisplayNode().SetColor(0, 1, 1)
         self._parameterNode.SetParameter(
@@ -1134,7 +1554,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
 
     def processPlanGrid(self):
 
-        if not self._parameterNode.GetNodeReference("TargetPoseTransform"):
+        if not self._nodes.get("TargetPoseTransform"):
             slicer.util.errorDisplay("Please plan tool pose first!")
             raise ValueError("Please plan tool pose first!")
 
@@ -1163,14 +1583,14 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
                 cur += 1
             self._parameterNode.SetParameter("GridPlanCurrentAt", str(cur))
             p, mat = getRotAndPFromMatrix(
-                self._parameterNode.GetNodeReference(
+                self._nodes.get(
                     "GridPlanTransformNum" + str(cur)
                 ).GetMatrixTransformToParent()
             )
             drawAPlane(
                 mat,
                 p,
-                self._configPath,
+                self._config.path("PLANE_INDICATOR_MODEL"),
                 "PlaneOnMeshIndicator",
                 "PlaneOnMeshTransform",
                 self._parameterNode,
@@ -1201,7 +1621,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
                     drawAPlane(
                         mat,
                         p,
-                        self._configPath,
+                        self._config.path("PLANE_INDICATOR_MODEL"),
                         "PlaneOnMeshIndicator",
                         "PlaneOnMeshTransform",
                         self._parameterNode,
@@ -1220,22 +1640,10 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         self._parameterNode.SetNodeReferenceID(
             "BrainMeshOffsetTransform", inmodel.GetParentTransformNode().GetID()
         )
-        transformFilter = vtk.vtkTransformPolyDataFilter()
-        transformFilterTransform = vtk.vtkTransform()
-        transformFilterTransform.SetMatrix(
-            self._parameterNode.GetNodeReference(
-                "BrainMeshOffsetTransform"
-            ).GetMatrixTransformToParent()
-        )
-        transformFilter.SetTransform(transformFilterTransform)
-        transformFilter.SetInputData(inmodel.GetPolyData())
-        transformFilter.Update()
-        poly_data = transformFilter.GetOutput()
-
-        # Create a OBB tree
-        obb_tree = vtk.vtkOBBTree()
-        obb_tree.SetDataSet(poly_data)
-        obb_tree.BuildLocator()
+        # Transformed mesh and its locators are only rebuilt if the brain mesh
+        # or its offset transform changed since the last stimulation
+        self._brainMeshCache.update(inmodel)
+        obb_tree = self._brainMeshCache.obbTree()
 
         # Define the ray from the target pose with a length of 50 mm
         ray_length = 50.0
@@ -1269,7 +1677,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
 
         # insert this closest point to the parameter node named "TargetPointOnCortex"
         # this node a vtkPoints node
-        if not self._parameterNode.GetNodeReference("TargetPointOnCortex"):
+        if not self._nodes.get("TargetPointOnCortex"):
             targetPointOnCortex = slicer.mrmlScene.AddNewNodeByClass(
                 "vtkMRMLMarkupsFiducialNode", "TargetPointOnCortex"
             )
@@ -1277,44 +1685,52 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
                 "TargetPointOnCortex", targetPointOnCortex.GetID()
             )
         else:
-            targetPointOnCortex = self._parameterNode.GetNodeReference("TargetPointOnCortex")
+            targetPointOnCortex = self._nodes.get("TargetPointOnCortex")
 
         targetPointOnCortex.InsertControlPoint(0, closest_point)
         targetPointOnCortex.SetNthControlPointVisibility(0, False)
 
-        POINT_COUNT = poly_data.GetNumberOfPoints()
-        distances = numpy.zeros(POINT_COUNT)
+        # keep the sample, so that the map can be rebuilt from all the samples
+        self._mepStore.append(closest_point, targetPoseTransform, mep)
+
+        mesh_points = self._brainMeshCache.points()
+        scalar_values = inmodel.GetPolyData().GetPointData().GetScalars()
 
-        for i in range(POINT_COUNT):
-            mesh_point = poly_data.GetPoint(i)
-            distance = math.sqrt(
+        if self._parameterNode.GetParameter("HeatMapIncrementalUpdate") == "true":
+            # Only the points within the cutoff distance (relative to the closest
+            # mesh point) of the hit point can change
+            closest_id = self._brainMeshCache.pointLocator().FindClosestPoint(
+                closest_point
+            )
+            min_distance = math.sqrt(
                 vtk.vtkMath.Distance2BetweenPoints(
-                    closest_point,
-                    mesh_point,
+                    closest_point, mesh_points[closest_id]
                 )
-            )  # distance from target pose to point
-            distances[i] = distance
+            )
+            ids = self._brainMeshCache.findPointsWithinRadius(
+                HEATMAP_CUTOFF_DISTANCE + min_distance, closest_point
+            )
+        else:
+            ids = numpy.arange(mesh_points.shape[0])
 
-        # print the range of distances
+        # distance from target pose to the mesh points, on a zero-copy view
+        # of the mesh points
+        distances = numpy.sqrt(
+            numpy.sum((mesh_points[ids] - numpy.array(closest_point)) ** 2, axis=1)
+        )
         scalars = computeScalarFromDistance(distances, mep, MAX_MEP=1.0)
-        scalar_values = poly_data.GetPointData().GetScalars()
 
         if not scalar_values:
-            scalar_values = vtk.vtkDoubleArray()
-            scalar_values.SetNumberOfComponents(1)
-            scalar_values.SetName("MEPHeatMapScalars")
-            scalar_values.SetNumberOfValues(POINT_COUNT)
-            for i in range(POINT_COUNT):
-                scalar_values.SetValue(i, scalars[i])
-
+            scalar_values = vtkDoubleArrayFromArray(
+                numpy.zeros(mesh_points.shape[0]), "MEPHeatMapScalars"
+            )
         else:
             print("scalar values already exist, adding new values ...")
-            for i in range(POINT_COUNT):
-                curr_value = scalar_values.GetValue(i)
-                scalar_values.SetValue(
-                    i, max(curr_value, scalars[i])
-                )  # using max value logic
-                # but using average is also valid
+
+        # using max value logic, but using average is also valid
+        scalar_view = arrayFromVTKArray(scalar_values)
+        scalar_view[ids] = numpy.maximum(scalar_view[ids], scalars)
+        scalar_values.Modified()
 
         # poly_data.GetPointData().SetScalars(scalar_values)
         inmodel.GetPolyData().GetPointData().SetScalars(scalar_values)
@@ -1377,18 +1793,79 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         labelProperties.SetShadow(True)
         labelProperties.SetFontFamilyToArial()
 
+    def processRecomputeHeatMap(self, inModel):
+        """
+        Rebuild the whole heatmap from the stored samples in one batched pass,
+        with the aggregation selected in the parameter node
+        """
+        if len(self._mepStore) == 0:
+            slicer.util.errorDisplay("No MEP samples recorded yet!")
+            return
+
+        self._parameterNode.SetNodeReferenceID(
+            "BrainMeshOffsetTransform", inModel.GetParentTransformNode().GetID()
+        )
+        self._brainMeshCache.update(inModel)
+        meshKey = self._brainMeshCache.key()
+        self._offload.exportMesh("brain", self._brainMeshCache)
+        self._offload.submit(
+            "heatmap",
+            "brain",
+            kernelMEPMap,
+            (
+                self._mepStore.hitPoints().copy(),
+                self._mepStore.meps().copy(),
+                self._parameterNode.GetParameter("HeatMapAggregation"),
+                1.0,
+                HEATMAP_CUTOFF_DISTANCE,
+            ),
+            lambda scalars: self.utilApplyHeatMap(inModel, meshKey, scalars),
+        )
+
+    def utilApplyHeatMap(self, inModel, meshKey, scalars):
+        if self._brainMeshCache.key() != meshKey:
+            return
+        scalar_values = inModel.GetPolyData().GetPointData().GetScalars()
+        if not scalar_values or scalar_values.GetNumberOfTuples() != scalars.shape[0]:
+            scalar_values = vtkDoubleArrayFromArray(scalars, "MEPHeatMapScalars")
+        else:
+            arrayFromVTKArray(scalar_values)[:] = scalars
+            scalar_values.Modified()
+
+        inModel.GetPolyData().GetPointData().SetScalars(scalar_values)
+        inModel.GetDisplayNode().SetActiveScalarName(scalar_values.GetName())
+        inModel.GetDisplayNode().SetScalarVisibility(True)
+        inModel.GetDisplayNode().AutoScalarRangeOff()
+        inModel.GetDisplayNode().SetScalarRange(0.0, 1.0)
+        self.processConfigModelLegend(inModel)
+        slicer.app.processEvents()
+        slicer.util.setSliceViewerLayers(background=inModel)
+
+    def processSaveMEPSamples(self, path):
+        try:
+            self._mepStore.save(path)
+        except OSError as exc:
+            slicer.util.errorDisplay("Cannot save the MEP samples: " + str(exc))
+
+    def processLoadMEPSamples(self, path, inModel):
+        try:
+            self._mepStore.load(path)
+        except (OSError, ValueError, KeyError) as exc:
+            slicer.util.errorDisplay("Cannot load the MEP samples: " + str(exc))
+            return
+        self.processRecomputeHeatMap(inModel)
+
     def processResetCortex(self, inModel):
         scalar_values = inModel.GetPolyData().GetPointData().GetScalars()
-        POINT_COUNT = inModel.GetPolyData().GetNumberOfPoints()
-        for i in range(POINT_COUNT):
-            scalar_values.SetValue(i, 0.0)
+        scalar_values.Fill(0.0)
+        self._mepStore.clear()
 
         inModel.GetPolyData().GetPointData().SetScalars(scalar_values)
         inModel.GetDisplayNode().AutoScalarRangeOn()
         inModel.GetDisplayNode().ScalarVisibilityOff()
 
         # destory the target point on cortex node
-        targetPointOnCortex = self._parameterNode.GetNodeReference("TargetPointOnCortex")
+        targetPointOnCortex = self._nodes.get("TargetPointOnCortex")
         targetPointOnCortex.RemoveAllMarkups()
 
         slicer.app.processEvents()
@@ -1396,7 +1873,7 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
 
     def processUniformColoring(self, inModel):
         # calculate the tool pose from the given grid
-        if not self._parameterNode.GetNodeReference("TargetPoseTransform"):
+        if not self._nodes.get("TargetPoseTransform"):
             slicer.util.errorDisplay("Please plan tool pose first!")
             raise ValueError("Please plan tool pose first!")
 
@@ -1410,58 +1887,44 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         self._parameterNode.SetNodeReferenceID(
             "BrainMeshOffsetTransform", inModel.GetParentTransformNode().GetID()
         )
-        transformFilter = vtk.vtkTransformPolyDataFilter()
-        transformFilterTransform = vtk.vtkTransform()
-        transformFilterTransform.SetMatrix(
-            self._parameterNode.GetNodeReference(
-                "BrainMeshOffsetTransform"
-            ).GetMatrixTransformToParent()
-        )
-        transformFilter.SetTransform(transformFilterTransform)
-        transformFilter.SetInputData(inModel.GetPolyData())
-        transformFilter.Update()
-        poly_data = transformFilter.GetOutput()
+        self._brainMeshCache.update(inModel)
+        point_locator = self._brainMeshCache.pointLocator()
 
-        point_locator = vtk.vtkPointLocator() # Point locator object for finding closest points
-        point_locator.SetDataSet(poly_data)
-        point_locator.BuildLocator()
+        scalar_values = inModel.GetPolyData().GetPointData().GetScalars()
+        if not scalar_values:
+            slicer.util.errorDisplay("Please overlay the heatmap first!")
+            return
 
-        closest_points = []
         indices = []
-        targetPointOnCortex = self._parameterNode.GetNodeReference("TargetPointOnCortex")
+        targetPointOnCortex = self._nodes.get("TargetPointOnCortex")
         for i in range(targetPointOnCortex.GetNumberOfFiducials()):
             ras = [0, 0, 0]
             targetPointOnCortex.GetNthFiducialPosition(i, ras)
-            closest_id = point_locator.FindClosestPoint(ras)
-            closest_point = poly_data.GetPoint(closest_id)
-            closest_points.append(closest_point)
-            indices.append(closest_id)
-
-        # get the neighbors of the closest points
-        neighbors = {}
-        search_radius = 2.5 # [Feature Requested]: A value that can be loaded from the config
-
-        for i in range(len(closest_points)):
-            closestIDs = vtk.vtkIdList()
-            point_locator.FindPointsWithinRadius(search_radius, closest_points[i], closestIDs)
-            neighbors[indices[i]] = [closestIDs.GetId(j) for j in range(closestIDs.GetNumberOfIds())]
-        
-        grid_neighbor = set()
-        for value in neighbors.values():
-            grid_neighbor.update(value)
-        
-        scalar_values = poly_data.GetPointData().GetScalars()
-        grid_points_values = [scalar_values.GetValue(i) for i in indices]
+            indices.append(point_locator.FindClosestPoint(ras))
+        indices = numpy.unique(numpy.array(indices, dtype=numpy.int64))
 
-        for scalar_id in range(poly_data.GetNumberOfPoints()):
-            if scalar_id in grid_neighbor:
-                matching_keys = [key for key, value in neighbors.items() if scalar_id in value]
-                scalar_values.SetValue(scalar_id,numpy.mean([scalar_values.GetValue(key) for key in matching_keys]))
-            else:
-                scalar_values.SetValue(scalar_id, 0.0)
-        
-        for grid_point_id, scalar in zip(indices, grid_points_values):
-            scalar_values.SetValue(grid_point_id, scalar)
+        search_radius = self._config["UNIFORM_COLORING_SEARCH_RADIUS"]
+
+        # Each mesh point gets the mean of the grid points it is a neighbor of,
+        # computed in the workers on the exported mesh and current scalars
+        meshKey = self._brainMeshCache.key()
+        self._offload.exportMesh(
+            "brain", self._brainMeshCache, arrayFromVTKArray(scalar_values)
+        )
+        self._offload.submit(
+            "uniformcoloring",
+            "brain",
+            kernelUniformColoring,
+            (indices, search_radius),
+            lambda scalars: self.utilApplyUniformColoring(inModel, meshKey, scalars),
+        )
+
+    def utilApplyUniformColoring(self, inModel, meshKey, scalars):
+        scalar_values = inModel.GetPolyData().GetPointData().GetScalars()
+        if self._brainMeshCache.key() != meshKey or not scalar_values:
+            return
+        arrayFromVTKArray(scalar_values)[:] = scalars
+        scalar_values.Modified()
 
         inModel.GetPolyData().GetPointData().SetScalars(scalar_values)
         inModel.GetDisplayNode().AutoScalarRangeOn()
@@ -1469,4 +1932,4 @@ class MedImgPlanLogic(ScriptedLoadableModuleLogic):
         inModel.GetDisplayNode().SetScalarRange(0.0, 1.0)
             
         slicer.app.processEvents()
-        slicer.util.setSliceViewerLayers(background=inModel)
\ No newline at end of file
+        slicer.util.setSliceViewerLayers(background=inModel)
@@ -25,6 +25,10 @@ SOFTWARE.
 import math
 import numpy
 
+# Beyond this distance (mm, relative to the closest mesh point) a stimulation
+# does not contribute to the MEP heat map
+HEATMAP_CUTOFF_DISTANCE = 3.8
+
 
 def mat2quat(R):
     if R[0][0] + R[1][1] + R[2][2] > 0:
@@ -141,12 +145,19 @@ def utilPosePlan(a, b, c, p, override_y=None):
     )
     nrm = normvec3(n)
     n = [-n[0] / nrm, -n[1] / nrm, -n[2] / nrm]
-    if override_y is not None:
-        x = crossProduct(
-            [override_y[0] - p[0], override_y[1] - p[1], override_y[2] - p[2]], n
-        )
-    else:
-        x = crossProduct([c[0] - p[0], c[1] - p[1], c[2] - p[2]], n)
+    return utilPoseFromNormal(n, p, override_y if override_y is not None else c)
+
+
+def utilPoseFromNormal(n, p, override_y):
+    """
+    Orientation whose z-axis is the unit normal n, with the x-axis
+    perpendicular to n and to the direction from p to override_y, like
+    utilPosePlan does for the normal of a triangle.
+    Output is a rotation matrix.
+    """
+    x = crossProduct(
+        [override_y[0] - p[0], override_y[1] - p[1], override_y[2] - p[2]], n
+    )
     nrm = normvec3(x)
     x = [x[0] / nrm, x[1] / nrm, x[2] / nrm]
     y = crossProduct(n, x)
@@ -155,7 +166,47 @@ def utilPosePlan(a, b, c, p, override_y=None):
     return transp([x, y, n])
 
 
-def computeScalarFromDistance(distances, mep, MAX_MEP):
+def utilPosesFromNormals(normals, points, override_y):
+    """
+    Batched utilPoseFromNormal. normals and points are N x 3 numpy arrays,
+    override_y is a single point or N x 3.
+    Output is the N x 3 x 3 rotation matrices.
+    """
+    n = normals / numpy.linalg.norm(normals, axis=1)[:, None]
+    x = numpy.cross(numpy.asarray(override_y, dtype=numpy.float64) - points, n)
+    x = x / numpy.linalg.norm(x, axis=1)[:, None]
+    y = numpy.cross(n, x)
+    y = y / numpy.linalg.norm(y, axis=1)[:, None]
+    return numpy.stack([x, y, n], axis=2)
+
+
+def computeBarycentricWeights(points, triangles):
+    """
+    Barycentric weights (N x 3) of the points (N x 3) in the triangles
+    (N x 3 x 3), for the points projected on the triangle planes and
+    clamped to the triangles.
+    """
+    v0 = triangles[:, 1] - triangles[:, 0]
+    v1 = triangles[:, 2] - triangles[:, 0]
+    v2 = points - triangles[:, 0]
+    d00 = numpy.einsum("ij,ij->i", v0, v0)
+    d01 = numpy.einsum("ij,ij->i", v0, v1)
+    d11 = numpy.einsum("ij,ij->i", v1, v1)
+    d20 = numpy.einsum("ij,ij->i", v2, v0)
+    d21 = numpy.einsum("ij,ij->i", v2, v1)
+    denom = d00 * d11 - d01 * d01
+    degenerate = denom == 0.0
+    denom[degenerate] = 1.0
+    v = (d11 * d20 - d01 * d21) / denom
+    w = (d00 * d21 - d01 * d20) / denom
+    weights = numpy.clip(numpy.stack([1.0 - v - w, v, w], axis=1), 0.0, None)
+    weights[degenerate] = 1.0
+    return weights / weights.sum(axis=1)[:, None]
+
+
+def computeScalarFromDistance(
+    distances, mep, MAX_MEP, cutoff_distance=HEATMAP_CUTOFF_DISTANCE
+):
     """
     Compute a scalar value from a distance value based on the maximum distance.
     The scalar value is normalized to the range [0, 1].
@@ -165,18 +216,29 @@ def computeScalarFromDistance(distances, mep, MAX_MEP):
     distances (numpy.ndarray): The distance values.
     mep (float): The current MEP responce.
     MAX_MEP (float): The maximum poissible MEP response.
+    cutoff_distance (float): Distance (mm) beyond which the scalar is 0.
 
     Returns:
     ---
     scalars (numpy.ndarray): The normalized scalar values.
     """
-    cutoff_distance = 3.8  # set a cutoff distance as 5 mm above the minimum distance
-    distances = distances - numpy.min(distances)
+    return computeMEPKernel(
+        distances - numpy.min(distances), mep, MAX_MEP, cutoff_distance
+    )
+
 
+def computeMEPKernel(
+    shifted_distances, mep, MAX_MEP, cutoff_distance=HEATMAP_CUTOFF_DISTANCE
+):
+    """
+    Kernel of computeScalarFromDistance, on distances already shifted by the
+    minimum distance. mep can be a scalar or an array broadcastable against
+    shifted_distances, so many stimulations can be evaluated at once.
+    """
     scalars = (mep / MAX_MEP) * numpy.exp(
-        -(distances**2) / (2 * (cutoff_distance / 2) ** 2)
+        -(shifted_distances**2) / (2 * (cutoff_distance / 2) ** 2)
     )
     # for the out-of-range distances, set the scalar to 0
-    scalars[distances > cutoff_distance] = 0.0
+    scalars = numpy.where(shifted_distances > cutoff_distance, 0.0, scalars)
 
     return scalars
@@ -0,0 +1,212 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, sys, shutil, logging, multiprocessing
+import concurrent.futures
+import numpy, qt
+from MedImgPlanLib.UtilOffloadKernels import SharedArray, MeshState, runKernel
+
+#
+# Compute offload
+#
+
+
+class ComputeOffload():
+    """
+    Runs the mesh kernels of UtilOffloadKernels in a pool of worker
+    processes, so that the GUI (and the tracking view) stays responsive.
+    Meshes are exported once to shared memory and attached by the workers.
+    Results are handed to the callbacks on the main thread, polled with a
+    QTimer. Without workers, or if the pool cannot be started, the kernels
+    run inline.
+    A re-exported mesh keeps its old shared memory blocks until the jobs
+    that were submitted on them are done. Scalars are never written into a
+    block a job may be reading: each export of scalars gets a new block.
+    """
+
+    def __init__(self, numWorkers=2, pollInterval=50):
+        self._numWorkers = numWorkers
+        self._pool = None
+        self._poolFailed = False
+        # name -> (mesh key, [points, triangles, scalars] SharedArray, MeshState)
+        self._meshes = {}
+        # tag -> (future, callback, mesh entry, kernel, args)
+        self._jobs = {}
+        # entries of released meshes still used by pending jobs
+        self._retired = []
+        # (future, mesh entry) of superseded jobs that could not be cancelled
+        self._orphans = []
+        self._timer = qt.QTimer()
+        self._timer.setInterval(pollInterval)
+        self._timer.connect("timeout()", self.utilPollJobs)
+
+    def exportMesh(self, name, meshCache, scalars=None):
+        """
+        Export the mesh of a MeshCache to shared memory under name. The
+        points and triangles are only copied when the mesh changed, the
+        scalars (if given) on every call, to a new block.
+        """
+        entry = self._meshes.get(name)
+        changed = entry is None or entry[0] != meshCache.key()
+        if not changed and scalars is None:
+            return
+        numPoints = meshCache.points().shape[0]
+        if scalars is None:
+            scalarBlock = SharedArray((numPoints,), "float64")
+        else:
+            scalarBlock = SharedArray.fromArray(
+                numpy.asarray(scalars, dtype=numpy.float64).reshape(numPoints))
+        if changed:
+            shared = [
+                SharedArray.fromArray(meshCache.points()),
+                SharedArray.fromArray(meshCache.triangles()),
+                scalarBlock,
+            ]
+            mesh = MeshState(*[a.array() for a in shared])
+        else:
+            # same geometry, the search structures carry over
+            shared = entry[1][:2] + [scalarBlock]
+            mesh = entry[2].withScalars(scalarBlock.array())
+        self._meshes[name] = (meshCache.key(), shared, mesh)
+        if entry is not None:
+            self._retired.append(entry)
+            self.utilCloseRetired()
+
+    def submit(self, tag, meshName, kernel, args, callback):
+        """
+        Run kernel(mesh, *args) on the exported mesh meshName, and call
+        callback(result) on the main thread once done. A newer job with the
+        same tag supersedes a pending one, whose result is dropped.
+        """
+        entry = self._meshes[meshName]
+        pool = self.utilPool()
+        if pool is None:
+            self._jobs.pop(tag, None)
+            callback(kernel(entry[2], *args))
+            return
+        handles = [a.handle() for a in entry[1]]
+        future = pool.submit(runKernel, handles, kernel, args)
+        if tag in self._jobs:
+            superseded = self._jobs[tag]
+            if not superseded[0].cancel():
+                # already running, its blocks stay alive until it is done
+                self._orphans.append((superseded[0], superseded[2]))
+        self._jobs[tag] = (future, callback, entry, kernel, args)
+        self.utilCloseRetired()
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def isBusy(self, tag=None):
+        return bool(self._jobs) if tag is None else tag in self._jobs
+
+    def shutdown(self):
+        self._timer.stop()
+        self._jobs.clear()
+        self._orphans = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        for name in list(self._meshes):
+            self.utilReleaseMesh(name)
+
+    def utilPollJobs(self):
+        for tag, (future, callback, entry, kernel, args) in list(
+            self._jobs.items()
+        ):
+            if not future.done():
+                continue
+            del self._jobs[tag]
+            try:
+                result = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                logging.warning("Compute workers died, running inline from now on")
+                self._pool = None
+                self._poolFailed = True
+                result = kernel(entry[2], *args)
+            except Exception as e:
+                logging.error("Offloaded computation failed: " + str(e))
+                continue
+            callback(result)
+        self.utilCloseRetired()
+        if not self._jobs and not self._orphans:
+            self._timer.stop()
+
+    def utilPool(self):
+        if self._pool is None and not self._poolFailed and self._numWorkers > 0:
+            try:
+                context = multiprocessing.get_context("spawn")
+                context.set_executable(utilWorkerExecutable())
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    self._numWorkers, mp_context=context
+                )
+            except Exception as e:
+                logging.warning("Cannot start compute workers: " + str(e))
+                self._poolFailed = True
+        return self._pool
+
+    def utilReleaseMesh(self, name):
+        entry = self._meshes.pop(name, None)
+        if entry is not None:
+            self._retired.append(entry)
+            self.utilCloseRetired()
+
+    def utilCloseRetired(self):
+        """
+        Close the blocks of the released meshes no pending job refers to.
+        A block still shared with an exported mesh stays open.
+        """
+        self._orphans = [o for o in self._orphans if not o[0].done()]
+        inUse = [job[2] for job in self._jobs.values()]
+        inUse += [o[1] for o in self._orphans]
+        liveBlocks = [a for e in inUse + list(self._meshes.values()) for a in e[1]]
+        closing = []
+        retired, self._retired = self._retired, []
+        while retired:
+            entry = retired.pop()
+            if any(entry is e for e in inUse):
+                self._retired.append(entry)
+                continue
+            closing += [
+                a for a in entry[1]
+                if not any(a is b for b in liveBlocks + closing)
+            ]
+        # drop the MeshStates (and their views on the buffers) first
+        entry = None
+        for a in closing:
+            a.close()
+
+
+def utilWorkerExecutable():
+    """
+    Python interpreter for the worker processes. Inside Slicer this is
+    PythonSlicer, the application executable itself cannot run them.
+    """
+    if os.path.basename(sys.executable).lower().startswith("pythonslicer"):
+        return sys.executable
+    candidate = os.path.join(os.path.dirname(sys.executable), "PythonSlicer")
+    if sys.platform.startswith("win"):
+        candidate += ".exe"
+    if os.path.exists(candidate):
+        return candidate
+    return shutil.which("PythonSlicer") or sys.executable
@@ -35,6 +35,7 @@ class UtilConnections():
     """
     Connection class.
     Blocking send and receive
+    The sockets are opened on first use (or by an explicit setup())
     """
 
     def __init__(self, configPath, modulesufx):
@@ -51,6 +52,7 @@ class UtilConnections():
 
         self._sock_receive = None
         self._sock_send = None
+        self._isSetup = False
 
     def setup(self):
         self._sock_receive = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -59,17 +61,31 @@ class UtilConnections():
             (self._sock_ip_receive, self._sock_port_receive))
         self._sock_receive.settimeout(0.5)
 
+    def utilEnsureSetup(self):
+        if not self._isSetup:
+            try:
+                self.setup()
+            except Exception:
+                # e.g. port already in use, do not leave half opened sockets
+                self.clear()
+                raise
+            self._isSetup = True
+
     def clear(self):
+        self._isSetup = False
         if self._sock_receive:
             self._sock_receive.close()
+            self._sock_receive = None
         if self._sock_send:
             self._sock_send.close()
+            self._sock_send = None
 
     def utilSendCommand(self, msg, errorMsg="Failed to send command ", res=False):
         msg = msg + self._eom
         if len(msg) > 256:
             raise RuntimeError("Command contains too many characters.")
         try:
+            self.utilEnsureSetup()
             self._sock_send.sendto(
                 msg.encode('UTF-8'), (self._sock_ip_send, self._sock_port_send))
             try:
@@ -85,6 +101,7 @@ class UtilConnections():
             return data
 
     def receiveMsg(self):
+        self.utilEnsureSetup()
         try:
             data = self._sock_receive.recvfrom(256)
         except socket.error:
@@ -59,6 +59,7 @@ class UtilConnectionsWtNnBlcRcv(UtilConnections):
         self._flag_receiving_nnblc = False
         if self._sock_receive_nnblc:
             self._sock_receive_nnblc.close()
+            self._sock_receive_nnblc = None
 
     def handleReceivedData(self):
         """
@@ -68,6 +69,9 @@ class UtilConnectionsWtNnBlcRcv(UtilConnections):
 
     def receiveTimerCallBack(self):
         if self._flag_receiving_nnblc:
+            # outside the try, a socket that cannot be bound is reported
+            # to the caller that started receiving
+            self.utilEnsureSetup()
             try:
                 # self._data_buff = self._sock_receive_nnblc.recvfrom(256)
                 self._data_buff = self._sock_receive_nnblc.recv(256)
@@ -0,0 +1,96 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import vtk, numpy
+from vtk.util import numpy_support
+from MedImgPlanLib.UtilYAMLCache import loadICPPoints
+
+#
+# ICP point cloud and its residuals
+#
+
+
+class ICPPointCloud():
+    """
+    Raw digitized ICP point cloud (N x 3, mm), loaded from the points YAML
+    file only when the file changed since the last load
+    """
+
+    def __init__(self):
+        self._stamp = None
+        self._points = numpy.zeros((0, 3))
+
+    def load(self, path):
+        """
+        Returns True if the points were (re)loaded
+        """
+        stat = os.stat(path)
+        stamp = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        if stamp == self._stamp:
+            return False
+
+        self._points = loadICPPoints(path)
+        self._stamp = stamp
+        return True
+
+    def points(self):
+        return self._points
+
+
+class MeshResiduals():
+    """
+    Signed distances of points to a cached mesh, evaluated in batches
+    """
+
+    def __init__(self):
+        self._key = None
+        self._distance = vtk.vtkImplicitPolyDataDistance()
+
+    def update(self, meshCache):
+        if meshCache.key() != self._key:
+            self._distance.SetInput(meshCache.polyData())
+            self._key = meshCache.key()
+
+    def signedDistances(self, points):
+        points = numpy.ascontiguousarray(points, dtype=numpy.float64).reshape((-1, 3))
+        output = vtk.vtkDoubleArray()
+        self._distance.FunctionValue(numpy_support.numpy_to_vtk(points, deep=True), output)
+        return numpy_support.vtk_to_numpy(output).copy()
+
+
+def computeResidualStatistics(residuals):
+    """
+    Summary of signed residuals (mm): rms, max of the magnitude, and the
+    50/90/95 percentiles of the magnitude
+    """
+    magnitude = numpy.abs(numpy.asarray(residuals, dtype=numpy.float64))
+    p50, p90, p95 = numpy.percentile(magnitude, [50.0, 90.0, 95.0])
+    return {
+        "rms": float(numpy.sqrt(numpy.mean(magnitude**2))),
+        "max": float(magnitude.max()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p95": float(p95),
+    }
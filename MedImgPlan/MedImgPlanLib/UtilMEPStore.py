@@ -0,0 +1,197 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+import numpy
+from MedImgPlanLib.UtilCalculations import computeMEPKernel, HEATMAP_CUTOFF_DISTANCE
+
+MEP_AGGREGATIONS = ("max", "mean", "weightedsum", "weightedmean")
+
+#
+# Columnar store of the stimulation samples of a session
+#
+
+
+class MEPSampleStore():
+    """
+    Stimulation samples of a session (hit point on cortex, tool pose, MEP
+    response and time), held column-wise in numpy arrays that grow by
+    doubling. The accessors return views of the valid rows.
+    """
+
+    def __init__(self, capacity=256):
+        self._num = 0
+        self._hitPoints = numpy.zeros((capacity, 3))
+        self._poses = numpy.zeros((capacity, 4, 4))
+        self._meps = numpy.zeros(capacity)
+        self._times = numpy.zeros(capacity)
+
+    def __len__(self):
+        return self._num
+
+    def append(self, hitPoint, pose, mep, t=None):
+        """
+        Add one sample. pose is a 4x4 (nested list, numpy array or
+        vtkMatrix4x4).
+        """
+        if self._num == self._meps.shape[0]:
+            self.utilGrow(2 * self._meps.shape[0])
+        if hasattr(pose, "GetElement"):
+            pose = [[pose.GetElement(i, j) for j in range(4)] for i in range(4)]
+        i = self._num
+        self._hitPoints[i] = hitPoint
+        self._poses[i] = pose
+        self._meps[i] = mep
+        self._times[i] = time.time() if t is None else t
+        self._num += 1
+
+    def clear(self):
+        self._num = 0
+
+    def hitPoints(self):
+        return self._hitPoints[: self._num]
+
+    def poses(self):
+        return self._poses[: self._num]
+
+    def meps(self):
+        return self._meps[: self._num]
+
+    def times(self):
+        return self._times[: self._num]
+
+    def save(self, path):
+        numpy.savez_compressed(
+            utilNpzPath(path),
+            hit_points=self.hitPoints(),
+            poses=self.poses(),
+            meps=self.meps(),
+            times=self.times(),
+        )
+
+    def load(self, path):
+        """
+        Replace the content of the store with the samples saved in path.
+        The store is left unchanged if the file cannot be read.
+        """
+        with numpy.load(utilNpzPath(path)) as data:
+            hitPoints = data["hit_points"]
+            poses = data["poses"]
+            meps = data["meps"]
+            times = data["times"]
+        num = meps.shape[0]
+        self.clear()
+        self.utilGrow(max(num, self._meps.shape[0]))
+        self._hitPoints[:num] = hitPoints
+        self._poses[:num] = poses
+        self._meps[:num] = meps
+        self._times[:num] = times
+        self._num = num
+
+    def utilGrow(self, capacity):
+        if capacity <= self._meps.shape[0]:
+            return
+        for name in ("_hitPoints", "_poses", "_meps", "_times"):
+            old = getattr(self, name)
+            new = numpy.zeros((capacity,) + old.shape[1:])
+            new[: self._num] = old[: self._num]
+            setattr(self, name, new)
+
+
+def utilNpzPath(path):
+    """
+    path with the .npz suffix numpy.savez adds when it is missing, so that
+    the same path can be used to save and to load
+    """
+    return path if path.endswith(".npz") else path + ".npz"
+
+
+def computeMEPMap(
+    gridIndex,
+    hitPoints,
+    meps,
+    aggregation="max",
+    MAX_MEP=1.0,
+    cutoff_distance=HEATMAP_CUTOFF_DISTANCE,
+):
+    """
+    Rebuild a full cortical MEP map from all the samples in one vectorized
+    pass. gridIndex is a PointGridIndex over the mesh points.
+
+    Aggregation of the samples reaching a mesh point:
+    "max" - maximum of the kernel values (same as the interactive overlay),
+    "mean" - mean of the kernel values of the contributing samples,
+    "weightedsum" - sum of the MEPs weighted by the kernel, which grows
+        with the number of samples and is not bounded by 1,
+    "weightedmean" - the weighted sum normalized by the sum of the kernel
+        weights.
+
+    Returns the scalars (numpy array, one value per mesh point).
+    """
+    if aggregation not in MEP_AGGREGATIONS:
+        raise ValueError("Unknown MEP aggregation: " + str(aggregation))
+
+    numPoints = gridIndex.points().shape[0]
+    res = numpy.zeros(numPoints)
+    if len(meps) == 0:
+        return res
+
+    # The kernel is relative to the mesh point closest to the hit point, which
+    # is within the cutoff on any reasonable mesh, so twice the cutoff is enough
+    sampleIds, pointIds, distances = gridIndex.queryRadius(
+        hitPoints, 2.0 * cutoff_distance
+    )
+    if sampleIds.shape[0] == 0:
+        return res
+
+    minDistances = numpy.full(len(meps), numpy.inf)
+    numpy.minimum.at(minDistances, sampleIds, distances)
+    shifted = distances - minDistances[sampleIds]
+    keep = shifted <= cutoff_distance
+    sampleIds, pointIds, shifted = sampleIds[keep], pointIds[keep], shifted[keep]
+
+    meps = numpy.asarray(meps, dtype=numpy.float64)
+    if aggregation == "max":
+        values = computeMEPKernel(shifted, meps[sampleIds], MAX_MEP, cutoff_distance)
+        order = numpy.argsort(pointIds, kind="stable")
+        pointIds, values = pointIds[order], values[order]
+        starts = numpy.flatnonzero(numpy.r_[True, pointIds[1:] != pointIds[:-1]])
+        res[pointIds[starts]] = numpy.maximum.reduceat(values, starts)
+    elif aggregation == "mean":
+        values = computeMEPKernel(shifted, meps[sampleIds], MAX_MEP, cutoff_distance)
+        sums = numpy.bincount(pointIds, weights=values, minlength=numPoints)
+        counts = numpy.bincount(pointIds, minlength=numPoints)
+        covered = counts > 0
+        res[covered] = sums[covered] / counts[covered]
+    else:
+        weights = computeMEPKernel(shifted, 1.0, 1.0, cutoff_distance)
+        sums = numpy.bincount(
+            pointIds, weights=weights * meps[sampleIds] / MAX_MEP, minlength=numPoints
+        )
+        if aggregation == "weightedsum":
+            return sums
+        totals = numpy.bincount(pointIds, weights=weights, minlength=numPoints)
+        covered = totals > 0
+        res[covered] = sums[covered] / totals[covered]
+    return res
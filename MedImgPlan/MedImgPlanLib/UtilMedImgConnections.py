@@ -39,6 +39,9 @@ class MedImgConnections(UtilConnectionsWtNnBlcRcv):
         self._pointOnMeshIndicator = None
         self._transformMatrixPointPtrtip = None
         self._pointPtrtipIndicator = None
+        # set by the logic when the TRE calculation starts
+        self._nodes = None
+        self._skinMeshCache = None
 
     def setup(self):
         super().setup()
@@ -88,19 +91,17 @@ class MedImgConnections(UtilConnectionsWtNnBlcRcv):
         """
         Called each time when a valid point message is received
         """
-        inModel = self._parameterNode.GetNodeReference("InputMeshSkin")
-        pointLocator = vtk.vtkPointLocator()
-        pointLocator.SetDataSet(inModel.GetPolyData())
-        pointLocator.BuildLocator()
-        closest_point = pointLocator.FindClosestPoint(p)
-        p_closest = inModel.GetPolyData().GetPoint(closest_point)
+        # the locator is only rebuilt when the skin mesh changes
+        self._skinMeshCache.update(self._nodes.get("InputMeshSkin"))
+        closest_point = self._skinMeshCache.pointLocator().FindClosestPoint(p)
+        p_closest = self._skinMeshCache.polyData().GetPoint(closest_point)
 
         setTranslation(p, self._transformMatrixPointPtrtip)
         setTranslation(p_closest, self._transformMatrixPointOnMesh)
 
-        self._parameterNode.GetNodeReference(
+        self._nodes.get(
             "PointPtrtipTr").SetMatrixTransformToParent(self._transformMatrixPointPtrtip)
-        self._parameterNode.GetNodeReference(
+        self._nodes.get(
             "PointOnMeshTr").SetMatrixTransformToParent(self._transformMatrixPointOnMesh)
 
         setColorTextByDistance(
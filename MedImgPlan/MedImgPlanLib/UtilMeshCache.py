@@ -0,0 +1,350 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import vtk, numpy
+from MedImgPlanLib.UtilSlicerFuncs import (
+    arrayFromPolyDataPoints,
+    arrayFromPolyDataTriangles,
+    arrayFromVTKArray,
+)
+from MedImgPlanLib.UtilNeighborhoods import PointGridIndex
+from MedImgPlanLib.UtilCalculations import (
+    computeBarycentricWeights,
+    utilPosesFromNormals,
+)
+
+#
+# Mesh cache
+#
+
+
+class MeshCache():
+    """
+    Cache of a model node's mesh in the parent transform's coordinates,
+    together with the search structures built on it.
+    Everything is built lazily and rebuilt only when the mesh geometry or
+    the parent transform of the model changes. Scalar changes on the model
+    do not invalidate the cache.
+    """
+
+    def __init__(self, normalSmoothingIterations=2):
+        self._normalSmoothingIterations = normalSmoothingIterations
+        self._key = None
+        self._polyData = None
+        self._points = None
+        self._triangles = None
+        self._pointNormals = None
+        self._smoothedPointNormals = None
+        self._pointLocator = None
+        self._cellLocator = None
+        self._obbTree = None
+        self._pointGridIndex = None
+        self._vertexNeighbors = None
+
+    def setNormalSmoothingIterations(self, normalSmoothingIterations):
+        if normalSmoothingIterations != self._normalSmoothingIterations:
+            self._normalSmoothingIterations = normalSmoothingIterations
+            self._smoothedPointNormals = None
+
+    def update(self, modelNode):
+        """
+        Make sure the cache reflects modelNode. Returns the cached polydata.
+        """
+        key = self.utilGeometryKey(modelNode)
+        if key != self._key:
+            self._key = key
+            self._polyData = self.utilTransformedPolyData(modelNode)
+            self._points = None
+            self._triangles = None
+            self._pointNormals = None
+            self._smoothedPointNormals = None
+            self._pointLocator = None
+            self._cellLocator = None
+            self._obbTree = None
+            self._pointGridIndex = None
+            self._vertexNeighbors = None
+        return self._polyData
+
+    def prepare(self, modelNode):
+        """
+        Build the cache of modelNode and its locators ahead of their first use
+        """
+        self.update(modelNode)
+        self.points()
+        self.triangles()
+        self.pointLocator()
+        self.cellLocator()
+
+    def clear(self):
+        self._key = None
+        self._polyData = None
+        self._points = None
+        self._triangles = None
+        self._pointNormals = None
+        self._smoothedPointNormals = None
+        self._pointLocator = None
+        self._cellLocator = None
+        self._obbTree = None
+        self._pointGridIndex = None
+        self._vertexNeighbors = None
+
+    def key(self):
+        return self._key
+
+    def polyData(self):
+        return self._polyData
+
+    def points(self):
+        """
+        Zero-copy numpy view (N x 3) of the cached mesh points
+        """
+        if self._points is None:
+            self._points = arrayFromPolyDataPoints(self._polyData)
+        return self._points
+
+    def triangles(self):
+        """
+        Triangles (M x 3 numpy array of point ids) of the cached mesh. For
+        triangle surfaces (e.g. from STL) the row is the cell id.
+        """
+        if self._triangles is None:
+            self._triangles = arrayFromPolyDataTriangles(self._polyData)
+        return self._triangles
+
+    def pointNormals(self):
+        """
+        Point normals (N x 3 numpy array) of the cached mesh, following the
+        triangle winding like utilPosePlan does
+        """
+        if self._pointNormals is None:
+            normals = vtk.vtkPolyDataNormals()
+            normals.SetInputData(self._polyData)
+            normals.ComputePointNormalsOn()
+            normals.ComputeCellNormalsOff()
+            normals.SplittingOff()
+            normals.ConsistencyOff()
+            normals.AutoOrientNormalsOff()
+            normals.Update()
+            self._pointNormals = numpy.array(
+                arrayFromVTKArray(normals.GetOutput().GetPointData().GetNormals())
+            )
+        return self._pointNormals
+
+    def smoothedPointNormals(self):
+        """
+        Point normals averaged over the neighboring triangles, repeated
+        normalSmoothingIterations times
+        """
+        if self._smoothedPointNormals is None:
+            normals = self.pointNormals()
+            triangles = self.triangles()
+            numPoints = normals.shape[0]
+            for _ in range(self._normalSmoothingIterations):
+                faceNormals = normals[triangles].sum(axis=1)
+                summed = numpy.stack(
+                    [
+                        sum(
+                            numpy.bincount(
+                                triangles[:, k],
+                                weights=faceNormals[:, j],
+                                minlength=numPoints,
+                            )
+                            for k in range(3)
+                        )
+                        for j in range(3)
+                    ],
+                    axis=1,
+                )
+                norms = numpy.linalg.norm(summed, axis=1)
+                valid = norms > 0.0
+                normals = normals.copy()
+                normals[valid] = summed[valid] / norms[valid][:, None]
+            self._smoothedPointNormals = normals
+        return self._smoothedPointNormals
+
+    def surfaceNormals(self, cellIds, points):
+        """
+        Smoothed normals at points (N x 3) lying on the cells cellIds,
+        interpolated from the smoothed point normals
+        """
+        ids = self.triangles()[numpy.asarray(cellIds, dtype=numpy.int64)]
+        points = numpy.asarray(points, dtype=numpy.float64).reshape((-1, 3))
+        weights = computeBarycentricWeights(points, self.points()[ids])
+        normals = numpy.einsum("ij,ijk->ik", weights, self.smoothedPointNormals()[ids])
+        return normals / numpy.linalg.norm(normals, axis=1)[:, None]
+
+    def surfaceFrames(self, cellIds, points, override_y, origins=None):
+        """
+        Orientations (N x 3 x 3) of the surface at points on the cells
+        cellIds, in one vectorized call. The z-axis is the smoothed normal,
+        the x-axis is set by override_y as in utilPosePlan, from origins
+        (the points by default).
+        """
+        points = numpy.asarray(points, dtype=numpy.float64).reshape((-1, 3))
+        origins = points if origins is None else origins
+        return utilPosesFromNormals(
+            self.surfaceNormals(cellIds, points),
+            numpy.asarray(origins, dtype=numpy.float64).reshape((-1, 3)),
+            override_y,
+        )
+
+    def pointLocator(self):
+        if self._pointLocator is None:
+            self._pointLocator = vtk.vtkStaticPointLocator()
+            self._pointLocator.SetDataSet(self._polyData)
+            self._pointLocator.BuildLocator()
+        return self._pointLocator
+
+    def cellLocator(self):
+        if self._cellLocator is None:
+            # answers closest point queries faster than vtkStaticCellLocator
+            self._cellLocator = vtk.vtkCellLocator()
+            self._cellLocator.SetDataSet(self._polyData)
+            self._cellLocator.BuildLocator()
+        return self._cellLocator
+
+    def obbTree(self):
+        if self._obbTree is None:
+            self._obbTree = vtk.vtkOBBTree()
+            self._obbTree.SetDataSet(self._polyData)
+            self._obbTree.BuildLocator()
+        return self._obbTree
+
+    def pointGridIndex(self, cellSize):
+        """
+        Numpy uniform grid index over the cached mesh points, for batched
+        fixed radius queries
+        """
+        if self._pointGridIndex is None or self._pointGridIndex[0] != cellSize:
+            self._pointGridIndex = (cellSize, PointGridIndex(self.points(), cellSize))
+        return self._pointGridIndex[1]
+
+    def findPointsWithinRadius(self, radius, p):
+        """
+        Ids (numpy int64 array) of the cached mesh points within radius of p
+        """
+        idList = vtk.vtkIdList()
+        self.pointLocator().FindPointsWithinRadius(radius, p, idList)
+        return numpy.array(
+            [idList.GetId(i) for i in range(idList.GetNumberOfIds())],
+            dtype=numpy.int64,
+        )
+
+    def vertexNeighbors(self):
+        """
+        Neighbors of each vertex along the triangle edges, in CSR form: the
+        neighbors of vertex v are neighbors[indptr[v]:indptr[v + 1]]
+        """
+        if self._vertexNeighbors is None:
+            triangles = self.triangles()
+            edges = numpy.concatenate(
+                [triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]]
+            )
+            edges = numpy.concatenate([edges, edges[:, ::-1]])
+            order = numpy.argsort(edges[:, 0], kind="stable")
+            indptr = numpy.concatenate(
+                ([0], numpy.cumsum(numpy.bincount(edges[:, 0], minlength=self.points().shape[0])))
+            )
+            self._vertexNeighbors = (indptr, edges[order, 1])
+        return self._vertexNeighbors
+
+    def descendToNearestVertices(self, points, startVertices, maxSteps=200):
+        """
+        For all the points (N x 3) at once, walk from startVertices along the
+        mesh edges to the neighbor closest to the point, until none is
+        closer. Returns the vertex ids reached and their distances, which
+        bound the distances of the points to the surface.
+        """
+        points = numpy.asarray(points, dtype=numpy.float64).reshape((-1, 3))
+        vertexIds = numpy.array(startVertices, dtype=numpy.int64)
+        distances = numpy.linalg.norm(self.points()[vertexIds] - points, axis=1)
+        indptr, neighbors = self.vertexNeighbors()
+        walking = numpy.arange(points.shape[0])
+        for _ in range(maxSteps):
+            starts = indptr[vertexIds[walking]]
+            counts = indptr[vertexIds[walking] + 1] - starts
+            walking, starts, counts = walking[counts > 0], starts[counts > 0], counts[counts > 0]
+            if walking.shape[0] == 0:
+                break
+            owners = numpy.repeat(numpy.arange(walking.shape[0]), counts)
+            within = numpy.arange(int(counts.sum())) - numpy.repeat(
+                numpy.cumsum(counts) - counts, counts
+            )
+            candidates = neighbors[numpy.repeat(starts, counts) + within]
+            candidateDistances = numpy.linalg.norm(
+                self.points()[candidates] - points[walking[owners]], axis=1
+            )
+            # closest neighbor of each point, first after sorting by (point, distance)
+            order = numpy.lexsort((candidateDistances, owners))
+            first = order[
+                numpy.flatnonzero(numpy.r_[True, owners[order][1:] != owners[order][:-1]])
+            ]
+            closer = candidateDistances[first] < distances[walking]
+            walking, first = walking[closer], first[closer]
+            vertexIds[walking] = candidates[first]
+            distances[walking] = candidateDistances[first]
+        return vertexIds, distances
+
+    def findClosestPointOnSurface(self, p, radius=None):
+        """
+        Closest point on the cached mesh surface to p, and the id of its cell.
+        Given a radius, only that far from p is searched, which is faster;
+        the cell id is then -1 if the surface is further away.
+        """
+        closestPoint = [0.0, 0.0, 0.0]
+        cellId, subId, dist2 = vtk.mutable(0), vtk.mutable(0), vtk.mutable(0.0)
+        if radius is None:
+            self.cellLocator().FindClosestPoint(p, closestPoint, cellId, subId, dist2)
+        elif not self.cellLocator().FindClosestPointWithinRadius(
+            p, radius, closestPoint, cellId, subId, dist2
+        ):
+            return closestPoint, -1
+        return closestPoint, int(cellId)
+
+    def utilGeometryKey(self, modelNode):
+        polyData = modelNode.GetPolyData()
+        transformNode = modelNode.GetParentTransformNode()
+        matrix = None
+        if transformNode:
+            mtx = transformNode.GetMatrixTransformToParent()
+            matrix = tuple(mtx.GetElement(i, j) for i in range(4) for j in range(4))
+        return (
+            modelNode.GetID(),
+            polyData.GetAddressAsString("vtkPolyData"),
+            polyData.GetPoints().GetMTime(),
+            polyData.GetPolys().GetMTime(),
+            matrix,
+        )
+
+    def utilTransformedPolyData(self, modelNode):
+        transformNode = modelNode.GetParentTransformNode()
+        if not transformNode:
+            return modelNode.GetPolyData()
+        transformFilter = vtk.vtkTransformPolyDataFilter()
+        transformFilterTransform = vtk.vtkTransform()
+        transformFilterTransform.SetMatrix(transformNode.GetMatrixTransformToParent())
+        transformFilter.SetTransform(transformFilterTransform)
+        transformFilter.SetInputData(modelNode.GetPolyData())
+        transformFilter.Update()
+        return transformFilter.GetOutput()
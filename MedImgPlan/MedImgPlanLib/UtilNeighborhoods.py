@@ -0,0 +1,198 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import numpy
+
+#
+# Numpy-only neighborhood structures. No vtk / slicer imports here, so that
+# they can also be used outside of the Slicer main thread.
+#
+
+
+class PointGridIndex():
+    """
+    Uniform grid (spatial hash) over a fixed set of points. Answers fixed
+    radius queries for many centers at once, fully vectorized.
+    """
+
+    def __init__(self, points, cellSize):
+        self._points = numpy.asarray(points, dtype=numpy.float64)
+        self._cellSize = float(cellSize)
+        self._origin = self._points.min(axis=0)
+        ijk = numpy.floor((self._points - self._origin) / self._cellSize).astype(
+            numpy.int64
+        )
+        self._dims = ijk.max(axis=0) + 1
+        keys = self.utilCellKeys(ijk)
+        self._order = numpy.argsort(keys, kind="stable")
+        self._sortedKeys = keys[self._order]
+
+    def points(self):
+        return self._points
+
+    def utilCellKeys(self, ijk):
+        return (ijk[:, 0] * self._dims[1] + ijk[:, 1]) * self._dims[2] + ijk[:, 2]
+
+    def queryRadius(self, centers, radius):
+        """
+        All (center, point) pairs with distance <= radius.
+        radius is a scalar or one value per center.
+        Returns centerIds, pointIds, distances (numpy arrays of equal length).
+        """
+        centers = numpy.asarray(centers, dtype=numpy.float64).reshape((-1, 3))
+        radius = numpy.broadcast_to(
+            numpy.asarray(radius, dtype=numpy.float64), (centers.shape[0],)
+        )
+        if centers.shape[0] == 0:
+            empty = numpy.zeros(0, dtype=numpy.int64)
+            return empty, empty, numpy.zeros(0)
+
+        # Candidate cells: the block of cells around each center's cell, without
+        # the cells that cannot hold a point within radius of that cell
+        span = int(numpy.ceil(radius.max() / self._cellSize))
+        rng = numpy.arange(-span, span + 1)
+        offsets = numpy.stack(numpy.meshgrid(rng, rng, rng, indexing="ij"), -1)
+        offsets = offsets.reshape((-1, 3))
+        gap = numpy.maximum(numpy.abs(offsets) - 1, 0) * self._cellSize
+        offsets = offsets[numpy.sqrt(numpy.sum(gap**2, axis=1)) <= radius.max()]
+        centerIjk = numpy.floor((centers - self._origin) / self._cellSize).astype(
+            numpy.int64
+        )
+        cellIjk = (centerIjk[:, None, :] + offsets[None, :, :]).reshape((-1, 3))
+        cellCenter = numpy.repeat(numpy.arange(centers.shape[0]), offsets.shape[0])
+        valid = numpy.all((cellIjk >= 0) & (cellIjk < self._dims), axis=1)
+        cellIjk, cellCenter = cellIjk[valid], cellCenter[valid]
+
+        # Range of sorted points falling in each candidate cell
+        keys = self.utilCellKeys(cellIjk)
+        lo = numpy.searchsorted(self._sortedKeys, keys, side="left")
+        hi = numpy.searchsorted(self._sortedKeys, keys, side="right")
+        counts = hi - lo
+        total = int(counts.sum())
+        centerIds = numpy.repeat(cellCenter, counts)
+        within = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        pointIds = self._order[numpy.repeat(lo, counts) + within]
+
+        distances = numpy.sqrt(
+            numpy.sum((self._points[pointIds] - centers[centerIds]) ** 2, axis=1)
+        )
+        keep = distances <= radius[centerIds]
+        return centerIds[keep], pointIds[keep], distances[keep]
+
+    def queryNearest(self, centers, maxDistance):
+        """
+        Nearest point of each center, searched within maxDistance.
+        Returns pointIds (-1 if none) and distances (inf if none).
+        """
+        centers = numpy.asarray(centers, dtype=numpy.float64).reshape((-1, 3))
+        pointIds = numpy.full(centers.shape[0], -1, dtype=numpy.int64)
+        distances = numpy.full(centers.shape[0], numpy.inf)
+
+        # Growing search radius, only for the centers still without a point.
+        # A point found within the radius is the nearest one.
+        pending = numpy.arange(centers.shape[0])
+        radius = min(self._cellSize, maxDistance)
+        while pending.shape[0]:
+            centerIds, candidates, candidateDistances = self.queryRadius(
+                centers[pending], radius
+            )
+            if centerIds.shape[0]:
+                # first pair of each center after sorting by (center, distance)
+                order = numpy.lexsort((candidateDistances, centerIds))
+                centerIds = centerIds[order]
+                first = numpy.flatnonzero(
+                    numpy.r_[True, centerIds[1:] != centerIds[:-1]]
+                )
+                found = pending[centerIds[first]]
+                pointIds[found] = candidates[order[first]]
+                distances[found] = candidateDistances[order[first]]
+            if radius >= maxDistance:
+                break
+            pending = pending[pointIds[pending] < 0]
+            radius = min(2.0 * radius, maxDistance)
+        return pointIds, distances
+
+
+class NeighborhoodIncidence():
+    """
+    Sparse incidence between a set of sources (e.g. grid points) and the
+    vertices of a mesh, stored in both directions in CSR form:
+    source -> vertices in its neighborhood, and the inverse index
+    vertex -> contributing sources.
+    """
+
+    def __init__(self, sourceIds, vertexIds, numSources, numVertices):
+        sourceIds = numpy.asarray(sourceIds, dtype=numpy.int64)
+        vertexIds = numpy.asarray(vertexIds, dtype=numpy.int64)
+        self._numSources = numSources
+        self._numVertices = numVertices
+        self._sourceIds = sourceIds
+        self._vertexIds = vertexIds
+
+        order = numpy.argsort(sourceIds, kind="stable")
+        self._sourceIndptr = numpy.concatenate(
+            ([0], numpy.cumsum(numpy.bincount(sourceIds, minlength=numSources)))
+        )
+        self._sourceIndices = vertexIds[order]
+
+        order = numpy.argsort(vertexIds, kind="stable")
+        self._vertexIndptr = numpy.concatenate(
+            ([0], numpy.cumsum(numpy.bincount(vertexIds, minlength=numVertices)))
+        )
+        self._vertexIndices = sourceIds[order]
+
+    def sourceNeighbors(self, i):
+        """
+        Vertices in the neighborhood of source i
+        """
+        return self._sourceIndices[self._sourceIndptr[i] : self._sourceIndptr[i + 1]]
+
+    def vertexSources(self, v):
+        """
+        Sources whose neighborhood contains vertex v
+        """
+        return self._vertexIndices[self._vertexIndptr[v] : self._vertexIndptr[v + 1]]
+
+    def coveredVertices(self):
+        """
+        Boolean mask of the vertices covered by at least one source
+        """
+        return numpy.diff(self._vertexIndptr) > 0
+
+    def mean(self, sourceValues, fill=0.0):
+        """
+        Per vertex mean of the values of the contributing sources, in one
+        sparse reduction. Vertices not covered by any source get fill.
+        """
+        sourceValues = numpy.asarray(sourceValues, dtype=numpy.float64)
+        sums = numpy.bincount(
+            self._vertexIds,
+            weights=sourceValues[self._sourceIds],
+            minlength=self._numVertices,
+        )
+        counts = numpy.diff(self._vertexIndptr)
+        res = numpy.full(self._numVertices, fill, dtype=numpy.float64)
+        covered = counts > 0
+        res[covered] = sums[covered] / counts[covered]
+        return res
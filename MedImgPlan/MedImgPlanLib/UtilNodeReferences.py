@@ -0,0 +1,89 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import slicer
+
+#
+# Node reference cache
+#
+
+
+class NodeReferenceCache():
+    """
+    Node references of a parameter node, resolved once per role. The cache
+    is emptied whenever a node is added to or removed from the scene, or a
+    reference of the parameter node is added, changed or removed, so that
+    streaming handlers do a dict lookup instead of a reference lookup.
+    """
+
+    def __init__(self, parameterNode=None):
+        self._parameterNode = None
+        self._nodes = {}
+        self._observations = []
+        self.setParameterNode(parameterNode)
+
+    def setParameterNode(self, parameterNode):
+        if parameterNode is self._parameterNode:
+            return
+        self.release()
+        self._parameterNode = parameterNode
+        if parameterNode is None:
+            return
+        for event in (
+            slicer.vtkMRMLNode.ReferenceAddedEvent,
+            slicer.vtkMRMLNode.ReferenceModifiedEvent,
+            slicer.vtkMRMLNode.ReferenceRemovedEvent,
+        ):
+            self._observations.append(
+                (parameterNode, parameterNode.AddObserver(event, self.onInvalidate)))
+        scene = slicer.mrmlScene
+        for event in (
+            slicer.vtkMRMLScene.NodeAddedEvent,
+            slicer.vtkMRMLScene.NodeRemovedEvent,
+        ):
+            self._observations.append(
+                (scene, scene.AddObserver(event, self.onInvalidate)))
+
+    def get(self, role):
+        """
+        Node referenced as role by the parameter node, or None
+        """
+        node = self._nodes.get(role)
+        if node is None:
+            node = self._parameterNode.GetNodeReference(role)
+            if node is not None:
+                self._nodes[role] = node
+        return node
+
+    def clear(self):
+        self._nodes.clear()
+
+    def release(self):
+        for caller, tag in self._observations:
+            caller.RemoveObserver(tag)
+        self._observations = []
+        self._nodes.clear()
+
+    def onInvalidate(self, caller=None, event=None):
+        self._nodes.clear()
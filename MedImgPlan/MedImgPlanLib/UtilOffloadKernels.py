@@ -0,0 +1,235 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import numpy
+from multiprocessing import shared_memory
+from MedImgPlanLib.UtilNeighborhoods import PointGridIndex, NeighborhoodIncidence
+from MedImgPlanLib.UtilMEPStore import computeMEPMap
+
+#
+# Kernels run by the compute offload (see UtilComputeOffload). Numpy only, no
+# vtk / qt / slicer imports here, this module is imported by the worker
+# processes.
+#
+
+
+class SharedArray():
+    """
+    Numpy array backed by a named shared memory block. The process that
+    creates the block owns it and unlinks it on close, the other processes
+    attach to it by handle.
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        dtype = numpy.dtype(dtype)
+        if name is None:
+            size = max(int(numpy.prod(shape)) * dtype.itemsize, 1)
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            # Workers share the resource tracker of the main process, which
+            # unlinks the block if the main process dies without doing it
+            self._owner = False
+        self._array = numpy.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+
+    @classmethod
+    def fromArray(cls, arr):
+        shared = cls(arr.shape, arr.dtype)
+        shared.array()[...] = arr
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        name, shape, dtype = handle
+        return cls(shape, dtype, name)
+
+    def handle(self):
+        """
+        Picklable (name, shape, dtype) description of the array
+        """
+        return (self._shm.name, self._array.shape, self._array.dtype.str)
+
+    def array(self):
+        return self._array
+
+    def close(self):
+        self._array = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # a view is still alive somewhere, the mapping goes with it
+            pass
+        if self._owner:
+            self._shm.unlink()
+
+
+class MeshState():
+    """
+    Mesh arrays (points, triangles, point scalars) as seen by the kernels,
+    together with the search structures built on them. The structures are
+    kept for as long as the mesh is, so repeated jobs on the same mesh only
+    pay for them once.
+    """
+
+    def __init__(self, points, triangles, scalars):
+        self.points = points
+        self.triangles = triangles
+        self.scalars = scalars
+        self._gridIndices = {}
+        self._incidence = (None, None)
+        self._edges = None
+
+    def withScalars(self, scalars):
+        """
+        The same mesh with other scalars, sharing the search structures
+        """
+        mesh = MeshState(self.points, self.triangles, scalars)
+        mesh._gridIndices = self._gridIndices
+        mesh._incidence = self._incidence
+        mesh._edges = self._edges
+        return mesh
+
+    def gridIndex(self, cellSize):
+        if cellSize not in self._gridIndices:
+            self._gridIndices[cellSize] = PointGridIndex(self.points, cellSize)
+        return self._gridIndices[cellSize]
+
+    def incidence(self, indices, radius):
+        """
+        Incidence between the points indices and the points within radius of
+        them. Only the last one is kept.
+        """
+        key = (indices.tobytes(), radius)
+        if self._incidence[0] != key:
+            sourceIds, pointIds, _ = self.gridIndex(radius).queryRadius(
+                self.points[indices], radius
+            )
+            self._incidence = (
+                key,
+                NeighborhoodIncidence(
+                    sourceIds, pointIds, len(indices), self.points.shape[0]
+                ),
+            )
+        return self._incidence[1]
+
+    def edges(self):
+        """
+        First vertex and the two edge vectors of every triangle
+        """
+        if self._edges is None:
+            v0 = self.points[self.triangles[:, 0]]
+            self._edges = (
+                v0,
+                self.points[self.triangles[:, 1]] - v0,
+                self.points[self.triangles[:, 2]] - v0,
+            )
+        return self._edges
+
+
+# Mesh attached by this worker process: (handles, shared arrays, MeshState)
+_workerMesh = (None, [], None)
+
+
+def runKernel(meshHandles, kernel, args):
+    """
+    Entry point of the worker processes. Attaches to the shared mesh (only
+    when it changed since the last job) and runs kernel(mesh, *args). When
+    only the scalars changed, the search structures are kept.
+    """
+    global _workerMesh
+    handles, shared, mesh = _workerMesh
+    if handles is not None and list(handles[:2]) == list(meshHandles[:2]):
+        if handles[2] != meshHandles[2]:
+            shared[2].close()
+            scalars = SharedArray.attach(meshHandles[2])
+            _workerMesh = (
+                meshHandles, shared[:2] + [scalars], mesh.withScalars(scalars.array()))
+    else:
+        for a in shared:
+            a.close()
+        shared = [SharedArray.attach(handle) for handle in meshHandles]
+        _workerMesh = (meshHandles, shared, MeshState(*[a.array() for a in shared]))
+    return kernel(_workerMesh[2], *args)
+
+
+def kernelMEPMap(mesh, hitPoints, meps, aggregation, MAX_MEP, cutoff_distance):
+    """
+    Full MEP heatmap from all the samples, see computeMEPMap
+    """
+    return computeMEPMap(
+        mesh.gridIndex(cutoff_distance),
+        hitPoints,
+        meps,
+        aggregation,
+        MAX_MEP,
+        cutoff_distance,
+    )
+
+
+def kernelUniformColoring(mesh, indices, search_radius):
+    """
+    Each mesh point gets the mean of the scalars of the grid points (indices)
+    it is within search_radius of, the rest is zeroed out. The grid points
+    keep their values.
+    """
+    grid_values = mesh.scalars[indices].copy()
+    scalars = mesh.incidence(indices, search_radius).mean(grid_values, fill=0.0)
+    scalars[indices] = grid_values
+    return scalars
+
+
+def kernelProjectOnMesh(mesh, origins, directions, step=5.0, max_length=1000.0):
+    """
+    Project points on the mesh along directions (both ways). As in the
+    interactive planning, the search segment grows by step until it hits
+    the mesh, and the hit furthest along the direction is used.
+    Returns the hit points (nan if none) and the hit triangle ids (-1 if none).
+    """
+    v0, e1, e2 = mesh.edges()
+    hits = numpy.full((len(origins), 3), numpy.nan)
+    triangleIds = numpy.full(len(origins), -1, dtype=numpy.int64)
+    for i, (o, d) in enumerate(zip(origins, directions)):
+        # Moller-Trumbore against all the triangles, for the infinite line
+        pvec = numpy.cross(d, e2)
+        det = numpy.einsum("ij,ij->i", e1, pvec)
+        valid = numpy.abs(det) > 1e-12
+        inv = numpy.zeros_like(det)
+        inv[valid] = 1.0 / det[valid]
+        tvec = o - v0
+        u = numpy.einsum("ij,ij->i", tvec, pvec) * inv
+        qvec = numpy.cross(tvec, e1)
+        v = (qvec @ d) * inv
+        t = numpy.einsum("ij,ij->i", e2, qvec) * inv
+        hit = numpy.flatnonzero(valid & (u >= 0) & (v >= 0) & (u + v <= 1))
+        if hit.shape[0] == 0:
+            continue
+        length = step * max(1.0, numpy.ceil(numpy.abs(t[hit]).min() / step))
+        if length > max_length:
+            continue
+        hit = hit[numpy.abs(t[hit]) <= length]
+        best = hit[numpy.argmax(t[hit])]
+        hits[i] = o + t[best] * d
+        triangleIds[i] = best
+    return hits, triangleIds
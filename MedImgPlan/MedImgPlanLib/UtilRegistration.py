@@ -0,0 +1,186 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy
+
+#
+# In-process registration: closed form point based registration and point to
+# plane ICP. Numpy only, all the transforms map source points (digitized,
+# mm) to the image frame: x' = R x + t.
+#
+
+
+def registerPointsSVD(source, target, weights=None):
+    """
+    Least squares rigid transform taking source onto target (both N x 3,
+    corresponding rows), closed form via SVD (Arun / Umeyama, no scaling).
+    Returns R (3 x 3), t (3)
+    """
+    source = numpy.asarray(source, dtype=numpy.float64).reshape((-1, 3))
+    target = numpy.asarray(target, dtype=numpy.float64).reshape((-1, 3))
+    if source.shape != target.shape or source.shape[0] < 3:
+        raise ValueError("At least 3 corresponding point pairs are needed")
+    w = (
+        numpy.ones(source.shape[0])
+        if weights is None
+        else numpy.asarray(weights, dtype=numpy.float64)
+    )
+    w = w / w.sum()
+
+    sourceMean = w @ source
+    targetMean = w @ target
+    H = (source - sourceMean).T @ ((target - targetMean) * w[:, None])
+    U, _, Vt = numpy.linalg.svd(H)
+    # no reflection
+    D = numpy.diag([1.0, 1.0, numpy.sign(numpy.linalg.det(Vt.T @ U.T))])
+    R = Vt.T @ D @ U.T
+    return R, targetMean - R @ sourceMean
+
+
+def transformPoints(points, R, t):
+    return numpy.asarray(points, dtype=numpy.float64).reshape((-1, 3)) @ R.T + t
+
+
+def rotationFromAxisAngle(w):
+    """
+    Rotation matrix of the rotation vector w (Rodrigues)
+    """
+    theta = numpy.linalg.norm(w)
+    if theta < 1e-12:
+        return numpy.eye(3)
+    k = w / theta
+    K = numpy.array([[0, -k[2], k[1]], [k[2], 0, -k[0]], [-k[1], k[0], 0]])
+    return numpy.eye(3) + numpy.sin(theta) * K + (1 - numpy.cos(theta)) * K @ K
+
+
+def compareRegistrations(R1, t1, R2, t2, points=None):
+    """
+    Difference of two registrations: rotation angle (deg), translation (mm),
+    and the largest displacement of points (mm) if given
+    """
+    cos = (numpy.trace(R1.T @ R2) - 1.0) / 2.0
+    angle = numpy.degrees(numpy.arccos(numpy.clip(cos, -1.0, 1.0)))
+    translation = numpy.linalg.norm(numpy.asarray(t1) - numpy.asarray(t2))
+    displacement = None
+    if points is not None and len(points):
+        displacement = numpy.linalg.norm(
+            transformPoints(points, R1, t1) - transformPoints(points, R2, t2), axis=1
+        ).max()
+    return angle, translation, displacement
+
+
+class PointToPlaneICP():
+    """
+    Point to plane ICP of a point cloud against a mesh. The mesh is given by
+    a PointGridIndex over its vertices and the vertex normals; the
+    correspondence of each point is the plane of its closest vertex, searched
+    for all points at once. Pairs farther than maxDistance are rejected.
+    """
+
+    def __init__(self, gridIndex, normals, maxDistance=10.0, maxIterations=50, tolerance=1e-4):
+        self._gridIndex = gridIndex
+        self._normals = numpy.asarray(normals, dtype=numpy.float64)
+        self._maxDistance = maxDistance
+        self._maxIterations = maxIterations
+        self._tolerance = tolerance
+
+    def correspondences(self, points):
+        """
+        Closest vertex ids (-1 if rejected) and signed point to plane distances
+        """
+        ids, _ = self._gridIndex.queryNearest(points, self._maxDistance)
+        valid = ids >= 0
+        residuals = numpy.full(points.shape[0], numpy.nan)
+        residuals[valid] = numpy.sum(
+            (points[valid] - self._gridIndex.points()[ids[valid]])
+            * self._normals[ids[valid]],
+            axis=1,
+        )
+        return ids, residuals
+
+    def run(self, source, R=None, t=None):
+        """
+        Refine the initial transform (R, t) of the source points.
+        Returns R, t and a dict with rms, inliers and iterations.
+        """
+        source = numpy.asarray(source, dtype=numpy.float64).reshape((-1, 3))
+        R = numpy.eye(3) if R is None else numpy.array(R, dtype=numpy.float64)
+        t = numpy.zeros(3) if t is None else numpy.array(t, dtype=numpy.float64).ravel()
+
+        iteration = 0
+        for iteration in range(1, self._maxIterations + 1):
+            moved = transformPoints(source, R, t)
+            ids, residuals = self.correspondences(moved)
+            valid = ids >= 0
+            if numpy.count_nonzero(valid) < 6:
+                raise ValueError("Not enough ICP correspondences within the search distance")
+
+            # Linearized small motion: minimize sum((w x p + dt) . n + r)^2
+            p, n, r = moved[valid], self._normals[ids[valid]], residuals[valid]
+            A = numpy.hstack((numpy.cross(p, n), n))
+            x = numpy.linalg.lstsq(A, -r, rcond=None)[0]
+
+            dR = rotationFromAxisAngle(x[:3])
+            R = dR @ R
+            t = dR @ t + x[3:]
+            if numpy.linalg.norm(x[:3]) < self._tolerance and numpy.linalg.norm(x[3:]) < self._tolerance:
+                break
+
+        ids, residuals = self.correspondences(transformPoints(source, R, t))
+        valid = ids >= 0
+        return R, t, {
+            "rms": float(numpy.sqrt(numpy.mean(residuals[valid] ** 2))) if valid.any() else numpy.nan,
+            "inliers": float(numpy.mean(valid)),
+            "iterations": iteration,
+        }
+
+
+def predictTRE(fiducials, targets, fle):
+    """
+    Expected RMS target registration error of point based registration at
+    each target (Fitzpatrick, West & Maurer 1998):
+    TRE^2(r) = FLE^2 / N * (1 + 1/3 * sum_k d_k^2 / f_k^2)
+    d_k: distance of the target from the k-th principal axis of the
+    fiducial configuration, f_k: RMS distance of the fiducials from it.
+    fiducials N x 3, targets M x 3, fle RMS localization error (mm).
+    Returns M values (mm).
+    """
+    fiducials = numpy.asarray(fiducials, dtype=numpy.float64).reshape((-1, 3))
+    targets = numpy.asarray(targets, dtype=numpy.float64).reshape((-1, 3))
+    if fiducials.shape[0] < 3:
+        raise ValueError("At least 3 fiducials are needed")
+    centroid = fiducials.mean(axis=0)
+    X = fiducials - centroid
+    _, _, axes = numpy.linalg.svd(X, full_matrices=False)
+
+    # squared distances from each principal axis: |x|^2 - (x . a_k)^2
+    f2 = numpy.mean(
+        numpy.sum(X**2, axis=1)[:, None] - (X @ axes.T) ** 2, axis=0
+    )
+    T = targets - centroid
+    d2 = numpy.sum(T**2, axis=1)[:, None] - (T @ axes.T) ** 2
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        ratio = numpy.sum(d2 / f2, axis=1)
+    return fle * numpy.sqrt((1.0 + ratio / 3.0) / fiducials.shape[0])
@@ -0,0 +1,167 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import os, csv
+import numpy
+
+#
+# Batch registration QA: FRE / TRE of many registration results at once
+#
+
+ERROR_STATISTICS = ("mean", "rms", "max", "std")
+
+
+def quat2matBatch(q):
+    """
+    K x 4 quaternions (x, y, z, w) to K x 3 x 3 rotation matrices, same
+    convention as quat2mat
+    """
+    q = numpy.asarray(q, dtype=numpy.float64).reshape((-1, 4))
+    qx, qy, qz, qw = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    return numpy.stack(
+        [
+            numpy.stack(
+                [
+                    1 - 2 * qy * qy - 2 * qz * qz,
+                    2 * qx * qy - 2 * qz * qw,
+                    2 * qx * qz + 2 * qy * qw,
+                ],
+                axis=1,
+            ),
+            numpy.stack(
+                [
+                    2 * qx * qy + 2 * qz * qw,
+                    1 - 2 * qx * qx - 2 * qz * qz,
+                    2 * qy * qz - 2 * qx * qw,
+                ],
+                axis=1,
+            ),
+            numpy.stack(
+                [
+                    2 * qx * qz - 2 * qy * qw,
+                    2 * qy * qz + 2 * qx * qw,
+                    1 - 2 * qx * qx - 2 * qy * qy,
+                ],
+                axis=1,
+            ),
+        ],
+        axis=1,
+    )
+
+
+def stackPadded(arrays):
+    """
+    List of N_i x 3 arrays to one K x max(N_i) x 3 array, padded with nan
+    """
+    num = max([a.shape[0] for a in arrays] + [0])
+    res = numpy.full((len(arrays), num, 3), numpy.nan)
+    for k, a in enumerate(arrays):
+        res[k, : a.shape[0]] = a
+    return res
+
+
+def alignPointsBatch(points, regs):
+    """
+    points: K x N x 3 (mm, ROS frame), regs: K x 8 loadRegistration arrays.
+    Returns the points in the Slicer frame, i.e. R^T (x - t) for each
+    registration, K x N x 3.
+    """
+    regs = numpy.asarray(regs, dtype=numpy.float64).reshape((-1, 8))
+    rot = quat2matBatch(regs[:, :4])
+    t = regs[:, 4:7] * 1000.0
+    # row vector form of R^T (x - t)
+    return numpy.einsum("knj,kji->kni", points - t[:, None, :], rot)
+
+
+def computeErrorsBatch(dig, plan, regs):
+    """
+    Per point errors (mm) between the aligned digitized points and the planned
+    points, K x N. Padded points give nan.
+    """
+    return numpy.linalg.norm(alignPointsBatch(dig, regs) - plan, axis=2)
+
+
+def summarizeErrors(errors):
+    """
+    Statistics of each row of a K x N error array, ignoring nan.
+    Returns a dict of K arrays, plus "count".
+    """
+    errors = numpy.asarray(errors, dtype=numpy.float64)
+    valid = ~numpy.isnan(errors)
+    count = valid.sum(axis=1)
+    filled = numpy.where(valid, errors, 0.0)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=1) / count
+        rms = numpy.sqrt((filled**2).sum(axis=1) / count)
+        std = numpy.sqrt(numpy.maximum(rms**2 - mean**2, 0.0))
+    mx = numpy.where(count > 0, numpy.where(valid, errors, -numpy.inf).max(axis=1), numpy.nan)
+    return {"count": count, "mean": mean, "rms": rms, "max": mx, "std": std}
+
+
+def readManifest(path):
+    """
+    CSV manifest, one registration per row:
+    digitized landmarks, planned landmarks, registration result
+    [, digitized targets, planned targets]
+    Relative paths are relative to the manifest. Empty lines and lines
+    starting with # are skipped.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    rows = []
+    with open(path, "r", newline="") as stream:
+        for row in csv.reader(stream):
+            row = [c.strip() for c in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if len(row) not in (3, 5):
+                raise ValueError("Invalid manifest row: " + ",".join(row))
+            rows.append([os.path.join(base, c) for c in row])
+    return rows
+
+
+def writeErrorTable(path, names, fre, tre=None):
+    """
+    One row per registration: name, FRE statistics, TRE statistics if given,
+    then the FRE of each landmark
+    """
+    freStats = summarizeErrors(fre)
+    header = ["name", "n_landmarks"] + ["fre_" + s for s in ERROR_STATISTICS]
+    columns = [freStats["count"]] + [freStats[s] for s in ERROR_STATISTICS]
+    if tre is not None:
+        treStats = summarizeErrors(tre)
+        header += ["n_targets"] + ["tre_" + s for s in ERROR_STATISTICS]
+        columns += [treStats["count"]] + [treStats[s] for s in ERROR_STATISTICS]
+    header += ["fre_" + str(i) for i in range(fre.shape[1])]
+
+    with open(path, "w", newline="") as stream:
+        writer = csv.writer(stream)
+        writer.writerow(header)
+        for k, name in enumerate(names):
+            writer.writerow(
+                [name]
+                + ["%.4f" % c[k] if c.dtype.kind == "f" else str(c[k]) for c in columns]
+                + ["" if numpy.isnan(e) else "%.4f" % e for e in fre[k]]
+            )
+    return freStats
@@ -0,0 +1,173 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib
+import vtk, numpy
+from MedImgPlanLib.UtilCalculations import computeBarycentricWeights
+
+#
+# Cortex to skin projection table
+#
+
+
+class SkinProjectionTable():
+    """
+    For every cortex vertex: the skin point hit by the ray along the cortex
+    normal, the closest skin point, and the skin normals (tangent planes)
+    there. Filled chunk by chunk, queried for arbitrary cortex points by
+    interpolation within the closest cortex triangle, and persisted as npz.
+    The signature identifies the cortex / skin meshes the table belongs to.
+    """
+
+    ARRAYS = ("hit_points", "hit_normals", "closest_points", "closest_normals")
+
+    def __init__(self):
+        self._signature = None
+        self._numBuilt = 0
+        self._arrays = {}
+
+    def reset(self, numPoints, signature):
+        self._signature = signature
+        self._numBuilt = 0
+        self._arrays = {
+            name: numpy.full((numPoints, 3), numpy.nan) for name in self.ARRAYS
+        }
+
+    def signature(self):
+        return self._signature
+
+    def numPoints(self):
+        return self._arrays["hit_points"].shape[0] if self._arrays else 0
+
+    def isComplete(self):
+        return bool(self._arrays) and self._numBuilt == self.numPoints()
+
+    def buildChunk(self, cortexCache, skinCache, chunkSize=2000, ray_length=10000.0):
+        """
+        Fill the next chunkSize cortex vertices. Returns True once complete.
+        """
+        start = self._numBuilt
+        stop = min(start + chunkSize, self.numPoints())
+        cortex_points = cortexCache.points()
+        cortex_normals = cortexCache.smoothedPointNormals()
+        locator = skinCache.cellLocator()
+
+        hit_cells = numpy.full(stop - start, -1, dtype=numpy.int64)
+        closest_cells = numpy.zeros(stop - start, dtype=numpy.int64)
+        cl_t, cl_sub_id, cl_cell_id = vtk.mutable(0.0), vtk.mutable(0), vtk.mutable(0)
+        cl_pIntSect, cl_pcoords = [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
+        for i in range(start, stop):
+            p = cortex_points[i].tolist()
+            ray_point = (cortex_points[i] + ray_length * cortex_normals[i]).tolist()
+            if locator.IntersectWithLine(
+                p, ray_point, 1e-6, cl_t, cl_pIntSect, cl_pcoords, cl_sub_id, cl_cell_id
+            ):
+                self._arrays["hit_points"][i] = cl_pIntSect
+                hit_cells[i - start] = int(cl_cell_id)
+
+        # The closest point search costs most. A walk along the skin edges
+        # from the hit points, for the whole chunk at once, bounds how far
+        # each search has to look.
+        hit = hit_cells >= 0
+        radii = numpy.full(stop - start, numpy.inf)
+        if numpy.any(hit):
+            _, radii[hit] = skinCache.descendToNearestVertices(
+                cortex_points[start:stop][hit], skinCache.triangles()[hit_cells[hit], 0]
+            )
+        for i in range(start, stop):
+            p = cortex_points[i].tolist()
+            closestPoint, cellId = -1, -1
+            if numpy.isfinite(radii[i - start]):
+                closestPoint, cellId = skinCache.findClosestPointOnSurface(
+                    p, radii[i - start] * (1.0 + 1e-9) + 1e-9
+                )
+            if cellId < 0:
+                closestPoint, cellId = skinCache.findClosestPointOnSurface(p)
+            self._arrays["closest_points"][i] = closestPoint
+            closest_cells[i - start] = cellId
+
+        hit = hit_cells >= 0
+        self._arrays["hit_normals"][start:stop][hit] = skinCache.surfaceNormals(
+            hit_cells[hit], self._arrays["hit_points"][start:stop][hit]
+        )
+        self._arrays["closest_normals"][start:stop] = skinCache.surfaceNormals(
+            closest_cells, self._arrays["closest_points"][start:stop]
+        )
+        self._numBuilt = stop
+        return self.isComplete()
+
+    def query(self, cortexCache, p):
+        """
+        Interpolated table entries at the cortex point closest to p:
+        skin hit point, its normal, closest skin point, its normal.
+        Entries are None where no value could be interpolated.
+        """
+        closestPoint, cellId = cortexCache.findClosestPointOnSurface(p)
+        ids = cortexCache.triangles()[cellId]
+        weights = computeBarycentricWeights(
+            numpy.array([closestPoint]), cortexCache.points()[ids][None]
+        )[0]
+        res = []
+        for name in self.ARRAYS:
+            values = self._arrays[name][ids]
+            valid = ~numpy.isnan(values[:, 0])
+            if not numpy.any(valid) or weights[valid].sum() <= 0.0:
+                res.append(None)
+                continue
+            value = weights[valid] @ values[valid] / weights[valid].sum()
+            if name.endswith("normals"):
+                value = value / numpy.linalg.norm(value)
+            res.append(value.tolist())
+        return res
+
+    def save(self, path):
+        numpy.savez_compressed(
+            self.utilNpzPath(path), signature=self._signature, **self._arrays)
+
+    def load(self, path):
+        """
+        Replace the table with the one saved in path. The table is left
+        unchanged if the file cannot be read.
+        """
+        with numpy.load(self.utilNpzPath(path)) as data:
+            signature = str(data["signature"])
+            arrays = {name: data[name] for name in self.ARRAYS}
+        self._signature = signature
+        self._arrays = arrays
+        self._numBuilt = self.numPoints()
+
+    def utilNpzPath(self, path):
+        # numpy.savez adds the suffix when it is missing, load the same file
+        return path if path.endswith(".npz") else path + ".npz"
+
+
+def utilMeshSignature(*points):
+    """
+    Signature of a set of point arrays, to match a saved table with meshes
+    """
+    digest = hashlib.sha1()
+    for arr in points:
+        digest.update(str(arr.shape).encode())
+        digest.update(numpy.ascontiguousarray(arr, dtype=numpy.float64).tobytes())
+    return digest.hexdigest()
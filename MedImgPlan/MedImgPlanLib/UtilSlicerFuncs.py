@@ -22,7 +22,8 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import vtk, math, slicer, json
+import os, vtk, math, slicer, numpy
+from vtk.util import numpy_support
 
 def setTranslation(p, T):
     T.SetElement(0,3,p[0])
@@ -53,6 +54,162 @@ def getRotAndPFromMatrix(T):
     mat[2][0],mat[2][1],mat[2][2] = T.GetElement(2,0),T.GetElement(2,1),T.GetElement(2,2)
     return p, mat
 
+def arrayFromPolyDataPoints(polyData):
+    """
+    Zero-copy numpy view (N x 3) of the points of a vtkPolyData
+    """
+    return numpy_support.vtk_to_numpy(polyData.GetPoints().GetData())
+
+def arrayFromPolyDataTriangles(polyData):
+    """
+    Copy of the triangles of a vtkPolyData as a numpy array (M x 3) of
+    point ids. Non triangle polygons are triangulated first.
+    """
+    polys = polyData.GetPolys()
+    if polys.GetNumberOfConnectivityIds() != 3 * polys.GetNumberOfCells():
+        triangleFilter = vtk.vtkTriangleFilter()
+        triangleFilter.SetInputData(polyData)
+        triangleFilter.PassLinesOff()
+        triangleFilter.PassVertsOff()
+        triangleFilter.Update()
+        polys = triangleFilter.GetOutput().GetPolys()
+    return numpy_support.vtk_to_numpy(
+        polys.GetConnectivityArray()).astype("int64").reshape((-1, 3))
+
+def arrayFromVTKArray(vtkArray):
+    """
+    Zero-copy numpy view of a vtkDataArray. Call vtkArray.Modified()
+    after writing into the view.
+    """
+    return numpy_support.vtk_to_numpy(vtkArray)
+
+def vtkDoubleArrayFromArray(arr, name):
+    """
+    Create a named single component vtkDoubleArray holding a copy of arr
+    """
+    vtkArray = numpy_support.numpy_to_vtk(
+        arr.astype("float64").ravel(), deep=True, array_type=vtk.VTK_DOUBLE)
+    vtkArray.SetName(name)
+    return vtkArray
+
+def pointCloudPolyData(points):
+    """
+    vtkPolyData with the points (N x 3 numpy array) and one vertex cell
+    per point, filled in one call
+    """
+    points = numpy.ascontiguousarray(points, dtype=numpy.float64).reshape((-1, 3))
+    vtkPoints = vtk.vtkPoints()
+    vtkPoints.SetData(numpy_support.numpy_to_vtk(points, deep=True))
+    ids = numpy.arange(points.shape[0] + 1, dtype=numpy_support.ID_TYPE_CODE)
+    verts = vtk.vtkCellArray()
+    verts.SetData(
+        numpy_support.numpy_to_vtkIdTypeArray(ids, deep=True),
+        numpy_support.numpy_to_vtkIdTypeArray(ids[:-1], deep=True))
+    polyData = vtk.vtkPolyData()
+    polyData.SetPoints(vtkPoints)
+    polyData.SetVerts(verts)
+    return polyData
+
+def showPointCloud(parameterNode, strNode, nodeName, points, color, asMarkups=False):
+    """
+    Show the points (N x 3 numpy array) in a single node referenced as
+    strNode, filled in one call. By default a model node rendering the
+    points; asMarkups gives a fiducial node instead, with labels, which
+    is only worth it for small sets.
+    """
+    nodeClass = "vtkMRMLMarkupsFiducialNode" if asMarkups else "vtkMRMLModelNode"
+    node = parameterNode.GetNodeReference(strNode)
+    if node and not node.IsA(nodeClass):
+        slicer.mrmlScene.RemoveNode(node)
+        node = None
+    if not node:
+        node = slicer.mrmlScene.AddNewNodeByClass(nodeClass, nodeName)
+        node.CreateDefaultDisplayNodes()
+        parameterNode.SetNodeReferenceID(strNode, node.GetID())
+        displayNode = node.GetDisplayNode()
+        if asMarkups:
+            displayNode.SetSelectedColor(color)
+        else:
+            displayNode.SetColor(color)
+            displayNode.SetPointSize(5.0)
+            displayNode.SetRenderPointsAsSpheres(True)
+            displayNode.SetVisibility2D(True)
+
+    if asMarkups:
+        slicer.util.updateMarkupsControlPointsFromArray(node, numpy.asarray(points))
+    else:
+        node.SetAndObservePolyData(pointCloudPolyData(points))
+    return node
+
+def setModelScalars(node, name, values, colorNodeName, valueRange):
+    """
+    Show per point values of a model node as the named point array, in place
+    if the array already exists. valueRange is (min, max) or None for auto.
+    """
+    pointData = node.GetPolyData().GetPointData()
+    scalars = pointData.GetArray(name)
+    if scalars is None or scalars.GetNumberOfTuples() != len(values):
+        scalars = vtkDoubleArrayFromArray(numpy.asarray(values, dtype=numpy.float64), name)
+        pointData.AddArray(scalars)
+    else:
+        arrayFromVTKArray(scalars)[:] = values
+        scalars.Modified()
+    displayNode = node.GetDisplayNode()
+    displayNode.SetActiveScalarName(name)
+    displayNode.SetAndObserveColorNodeID(
+        slicer.util.getFirstNodeByName(colorNodeName).GetID()
+    )
+    if valueRange is None:
+        displayNode.AutoScalarRangeOn()
+    else:
+        displayNode.AutoScalarRangeOff()
+        displayNode.SetScalarRange(valueRange[0], valueRange[1])
+    displayNode.SetScalarVisibility(True)
+
+def getModelScalarsDisplay(node):
+    """
+    Scalar display settings of a model node and of its color legend, to give
+    them back with restoreModelScalarsDisplay after showing other scalars
+    """
+    displayNode = node.GetDisplayNode()
+    legendNode = slicer.modules.colors.logic().GetColorLegendDisplayNode(node)
+    return {
+        "name": displayNode.GetActiveScalarName(),
+        "colorNodeID": displayNode.GetColorNodeID(),
+        "autoRange": displayNode.GetAutoScalarRange(),
+        "range": displayNode.GetScalarRange(),
+        "visibility": displayNode.GetScalarVisibility(),
+        "legend": (legendNode.GetTitleText(), legendNode.GetLabelFormat(),
+                   legendNode.GetVisibility()) if legendNode else None,
+    }
+
+def restoreModelScalarsDisplay(node, state):
+    displayNode = node.GetDisplayNode()
+    displayNode.SetActiveScalarName(state["name"])
+    displayNode.SetAndObserveColorNodeID(state["colorNodeID"])
+    displayNode.SetAutoScalarRange(state["autoRange"])
+    if not state["autoRange"]:
+        displayNode.SetScalarRange(state["range"][0], state["range"][1])
+    displayNode.SetScalarVisibility(state["visibility"])
+    legendNode = slicer.modules.colors.logic().GetColorLegendDisplayNode(node)
+    if legendNode:
+        if state["legend"]:
+            legendNode.SetTitleText(state["legend"][0])
+            legendNode.SetLabelFormat(state["legend"][1])
+            legendNode.SetVisibility(state["legend"][2])
+        else:
+            legendNode.SetVisibility(False)
+
+def setPointCloudScalars(node, name, values, valueRange):
+    """
+    Color a point cloud model node by per point values, on a diverging map
+    symmetric around zero (-valueRange blue, +valueRange red). Markups
+    point clouds are left as they are.
+    """
+    if not node.IsA("vtkMRMLModelNode") or not node.GetPolyData():
+        return
+    setModelScalars(node, name, values, "DivergingBlueRed", (-valueRange, valueRange))
+
 def setColorTextByDistance( \
     view, mesh_p, p, colorchangethresh, \
     indicatorPointOnMesh, \
@@ -73,15 +230,42 @@ def setColorTextByDistance( \
     indicatorPointOnMesh.GetDisplayNode().SetColor(1.0-indx, indx, 0)
     indicatorPointPtrtip.GetDisplayNode().SetColor(1.0-indx, indx, 0)
 
-def drawAPlane(mat, p, configPath, modelName, transformName, parameterNode):
+# Indicator STL path -> polydata, loaded once per process
+_indicatorTemplates = {}
+
+def preloadIndicatorModel(path):
+    """
+    Polydata of the indicator STL at path, read on the first call only
+    (with the same coordinate handling as slicer.util.loadModel)
+    """
+    key = os.path.abspath(path)
+    polyData = _indicatorTemplates.get(key)
+    if polyData is None:
+        templateNode = slicer.util.loadModel(path)
+        polyData = templateNode.GetPolyData()
+        storageNode = templateNode.GetStorageNode()
+        slicer.mrmlScene.RemoveNode(templateNode)
+        if storageNode:
+            slicer.mrmlScene.RemoveNode(storageNode)
+        _indicatorTemplates[key] = polyData
+    return polyData
+
+def loadIndicatorModel(path):
+    """
+    New model node of the indicator STL at path. All the nodes of an
+    indicator share its polydata, which is never modified since
+    indicators are only moved by their parent transforms.
+    """
+    modelNode = slicer.modules.models.logic().AddModel(preloadIndicatorModel(path))
+    modelNode.SetName(os.path.splitext(os.path.basename(path))[0])
+    return modelNode
 
-    with open(configPath+"Config.json") as f:
-        configData = json.load(f)
+def drawAPlane(mat, p, planeModelPath, modelName, transformName, parameterNode):
 
-        if not parameterNode.GetNodeReference(modelName):
-            planeModel = slicer.util.loadModel(configPath+configData["PLANE_INDICATOR_MODEL"])
-            planeModel.GetDisplayNode().SetOpacity(0.3)
-            parameterNode.SetNodeReferenceID(modelName, planeModel.GetID())
+    if not parameterNode.GetNodeReference(modelName):
+        planeModel = loadIndicatorModel(planeModelPath)
+        planeModel.GetDisplayNode().SetOpacity(0.3)
+        parameterNode.SetNodeReferenceID(modelName, planeModel.GetID())
 
     if not parameterNode.GetNodeReference(transformName):
         transformNode = slicer.vtkMRMLTransformNode()
@@ -108,7 +292,7 @@ def initModelAndTransform(parameterNode, strTransformNode, mtxTransform, strMode
             strTransformNode, transformNode.GetID())
 
     if not parameterNode.GetNodeReference(strModelNode):
-        inputModel = slicer.util.loadModel(fModel)
+        inputModel = loadIndicatorModel(fModel)
         parameterNode.SetNodeReferenceID(
             strModelNode, inputModel.GetID())
 
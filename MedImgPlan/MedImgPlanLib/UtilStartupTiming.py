@@ -0,0 +1,90 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time, logging
+
+#
+# Startup timing
+#
+
+
+class StartupTiming():
+    """
+    Wall-clock cost of the startup stages of a module (import, module and
+    widget setup, background preparation), reported to the log so that
+    the Slicer launch time can be broken down per module.
+    """
+
+    def __init__(self, moduleName):
+        self._moduleName = moduleName
+        self._stages = []
+        self._history = []
+        self._last = time.perf_counter()
+
+    def restart(self):
+        """
+        Start timing the next stage from now
+        """
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        """
+        Record the time since the last mark (or restart) as stage
+        """
+        now = time.perf_counter()
+        self._stages.append((stage, now - self._last))
+        self._last = now
+
+    def history(self):
+        """
+        All the reported (title, [(stage, seconds), ...]) so far
+        """
+        return list(self._history)
+
+    def report(self, title):
+        """
+        Log the stages recorded since the last report under title
+        """
+        total = sum(seconds for _, seconds in self._stages)
+        detail = ", ".join(
+            "{} {:.1f} ms".format(stage, 1000.0 * seconds)
+            for stage, seconds in self._stages)
+        msg = "Startup timing [{}] {}: {:.1f} ms ({})".format(
+            self._moduleName, title, 1000.0 * total, detail)
+        logging.info(msg)
+        self._history.append((title, self._stages))
+        self._stages = []
+        return msg
+
+
+_startupTimings = {}
+
+
+def startupTiming(moduleName):
+    """
+    StartupTiming of moduleName, shared by the files of the module
+    """
+    if moduleName not in _startupTimings:
+        _startupTimings[moduleName] = StartupTiming(moduleName)
+    return _startupTimings[moduleName]
@@ -0,0 +1,205 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import os, glob, hashlib, logging, yaml
+import numpy, slicer
+from MedImgPlanLib.UtilCalculations import quat2mat
+
+# ICP dumps larger than this (bytes) are parsed line by line instead of
+# through yaml.safe_load
+STREAMING_PARSE_MIN_SIZE = 8 * 1024 * 1024
+
+#
+# Typed loaders for the ROS YAML files, with binary caches.
+#
+# The first load of a file parses the YAML into a float64 array and writes it
+# to the cache folder of the Slicer temporary path as
+# "<path digest>.<version digest>.<kind>.npy", the version being the size and
+# mtime of the file. Later loads of the unchanged file memory-map the cached
+# array instead of parsing the YAML again. Nothing is written next to the data.
+#
+
+
+def utilCacheFolder():
+    return os.path.join(slicer.app.temporaryPath, "MedImgPlanYAMLCache")
+
+
+def utilCachePrefix(path):
+    return hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+
+
+def utilCachePath(path, kind):
+    stat = os.stat(path)
+    version = hashlib.sha1(repr((stat.st_size, stat.st_mtime_ns)).encode()).hexdigest()[:16]
+    return os.path.join(
+        utilCacheFolder(), utilCachePrefix(path) + "." + version + "." + kind + ".npy"
+    )
+
+
+def loadCachedArray(path, kind, parse):
+    """
+    parse(path) -> numpy array, only called if there is no valid cached
+    array. The returned array is read-only when it comes from the cache.
+    """
+    cached = utilCachePath(path, kind)
+    if os.path.isfile(cached):
+        try:
+            return numpy.load(cached, mmap_mode="r")
+        except (OSError, ValueError) as exc:
+            logging.warning("Ignoring the YAML cache " + cached + ": " + str(exc))
+
+    arr = numpy.ascontiguousarray(parse(path), dtype=numpy.float64)
+
+    # Drop the cached older versions of the file, then write the new one.
+    # Failing to write only costs the cache.
+    stale = glob.glob(
+        os.path.join(utilCacheFolder(), utilCachePrefix(path) + ".*." + kind + ".npy")
+    )
+    try:
+        os.makedirs(utilCacheFolder(), exist_ok=True)
+        for f in stale:
+            os.remove(f)
+        tmp = cached + ".tmp"
+        with open(tmp, "wb") as f:
+            numpy.save(f, arr)
+        os.replace(tmp, cached)
+    except OSError as exc:
+        logging.warning("YAML cache not written for " + path + ": " + str(exc))
+    return arr
+
+
+def parseICPPointsYAML(path):
+    """
+    ICP digitization dump: every value is a "x,y,z,x,y,z,...," string in m.
+    Returns N x 3, mm.
+    """
+    with open(path, "r") as stream:
+        dig_dict = yaml.safe_load(stream)
+    dig = []
+    for k in dig_dict.keys():
+        # convert ROS m unit to mm
+        dig.extend([float(i) * 1000.0 for i in dig_dict[k].strip().split(",")[:-1]])
+    return numpy.array(dig).reshape((-1, 3))
+
+
+def parseICPPointsStreaming(path):
+    """
+    Same result as parseICPPointsYAML, reading the dump line by line without
+    building the YAML document. Handles quoted values and values wrapped over
+    several indented lines.
+    """
+    chunks = []
+
+    def flush(text):
+        text = text.strip().strip("'\"").strip().rstrip(",")
+        if text:
+            chunks.append(numpy.array(text.split(","), dtype=numpy.float64))
+
+    value = None
+    with open(path, "r") as stream:
+        for line in stream:
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            if line[0] in " \t" and value is not None:
+                # continuation of a wrapped value
+                value += " " + line.strip()
+                continue
+            if value is not None:
+                flush(value)
+            value = line.split(":", 1)[1] if ":" in line else ""
+    if value is not None:
+        flush(value)
+
+    if not chunks:
+        return numpy.zeros((0, 3))
+    # convert ROS m unit to mm
+    return (numpy.concatenate(chunks) * 1000.0).reshape((-1, 3))
+
+
+def loadICPPoints(path):
+    """
+    ICP digitization points, N x 3, mm
+    """
+    if os.path.getsize(path) >= STREAMING_PARSE_MIN_SIZE:
+        return loadCachedArray(path, "icp", parseICPPointsStreaming)
+    return loadCachedArray(path, "icp", parseICPPointsYAML)
+
+
+def loadLandmarks(path, section="DIGITIZED", prefix="d"):
+    """
+    Digitized (DIGITIZED/d<i>) or planned (PLANNED/p<i>) landmarks, N x 3, mm
+    """
+
+    def parse(path):
+        with open(path, "r") as stream:
+            lm = yaml.safe_load(stream)
+        return numpy.array(
+            [
+                [
+                    lm[section][prefix + str(i)]["x"] * 1000.0,
+                    lm[section][prefix + str(i)]["y"] * 1000.0,
+                    lm[section][prefix + str(i)]["z"] * 1000.0,
+                ]
+                for i in range(lm["NUM"])
+            ]
+        ).reshape((-1, 3))
+
+    return loadCachedArray(path, "lm" + prefix, parse)
+
+
+def loadRegistration(path):
+    """
+    Registration result: [qx, qy, qz, qw, tx, ty, tz, flagICP], ROS units.
+    flagICP is nan if the file has no FLAG_ICP.
+    """
+
+    def parse(path):
+        with open(path, "r") as stream:
+            reg = yaml.safe_load(stream)
+        return numpy.array(
+            [
+                reg["ROTATION"]["x"],
+                reg["ROTATION"]["y"],
+                reg["ROTATION"]["z"],
+                reg["ROTATION"]["w"],
+                reg["TRANSLATION"]["x"],
+                reg["TRANSLATION"]["y"],
+                reg["TRANSLATION"]["z"],
+                reg.get("FLAG_ICP", numpy.nan),
+            ],
+            dtype=numpy.float64,
+        )
+
+    return loadCachedArray(path, "reg", parse)
+
+
+def registrationToSlicer(reg):
+    """
+    Rotation (3 x 3) and translation (3 x 1, mm) taking the ROS points into the
+    Slicer frame, from a loadRegistration array
+    """
+    rot_ = numpy.array(quat2mat(list(reg[:4]))).transpose()
+    p_ = -numpy.matmul(rot_, numpy.array(reg[4:7]).reshape((3, 1))) * 1000.0
+    return rot_, p_
@@ -26,6 +26,7 @@ import slicer, os, json, logging, math, vtk, qt, ctk
 from MedImgPlanLib.WidgetMedImgBase import MedImgPlanWidgetBase
 from MedImgPlanLib.UtilSlicerFuncs import getRotAndPFromMatrix
 from MedImgPlanLib.UtilCalculations import quat2mat
+from MedImgPlanLib.UtilStartupTiming import startupTiming
 
 
 class MedImgPlanWidget(MedImgPlanWidgetBase):
@@ -69,6 +70,12 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
         self.ui.comboMeshSelectorBrain.connect(
             "currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI
         )
+        self.ui.comboMeshSelectorSkin.connect(
+            "currentNodeChanged(vtkMRMLNode*)", self.onMeshSelectionChanged
+        )
+        self.ui.comboMeshSelectorBrain.connect(
+            "currentNodeChanged(vtkMRMLNode*)", self.onMeshSelectionChanged
+        )
 
         self.ui.checkPlanBrain.connect("toggled(bool)", self.updateParameterNodeFromGUI)
 
@@ -100,6 +107,36 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
         self.ui.checkBoxGridPerspPlane.connect(
             "toggled(bool)", self.updateParameterNodeFromGUI
         )
+        self.ui.checkHeatMapIncremental.connect(
+            "toggled(bool)", self.updateParameterNodeFromGUI
+        )
+        self.ui.comboHeatMapAggregation.connect(
+            "currentIndexChanged(int)", self.updateParameterNodeFromGUI
+        )
+        self.ui.spinPredictedTREFLE.connect(
+            "valueChanged(double)", self.onPredictedTREOptionChanged
+        )
+        self.ui.checkPredictedTREOnBrain.connect(
+            "toggled(bool)", self.onPredictedTREOptionChanged
+        )
+        self.ui.checkPredictedTRELive.connect(
+            "toggled(bool)", self.onCheckPredictedTRELive
+        )
+        self.ui.checkSkinProjectionTable.connect(
+            "toggled(bool)", self.updateParameterNodeFromGUI
+        )
+        self.ui.checkPointCloudMarkups.connect(
+            "toggled(bool)", self.updateParameterNodeFromGUI
+        )
+        self.ui.pushBuildSkinProjectionTable.connect(
+            "clicked(bool)", self.onPushBuildSkinProjectionTable
+        )
+        self.ui.pushSaveSkinProjectionTable.connect(
+            "clicked(bool)", self.onPushSaveSkinProjectionTable
+        )
+        self.ui.pushLoadSkinProjectionTable.connect(
+            "clicked(bool)", self.onPushLoadSkinProjectionTable
+        )
 
         self.ui.radioButtonToolRotSkin.connect(
             "toggled(bool)", self.onRadioToolRotOptions
@@ -127,6 +164,15 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
         self.ui.pushStartTRE.connect("clicked(bool)", self.onPushStartTRE)
         self.ui.pushStopTRE.connect("clicked(bool)", self.onPushStopTRE)
         self.ui.pushVisFRE.connect("clicked(bool)", self.onPushVisFRE)
+        self.ui.pushBatchFRE.connect("clicked(bool)", self.onPushBatchFRE)
+        self.ui.pushLocalRegister.connect("clicked(bool)", self.onPushLocalRegister)
+        self.ui.pushPredictedTRE.connect("clicked(bool)", self.onPushPredictedTRE)
+        self.ui.pushHidePredictedTRE.connect(
+            "clicked(bool)", self.onPushHidePredictedTRE
+        )
+        self.ui.pushLocalICPRegister.connect(
+            "clicked(bool)", self.onPushLocalICPRegister
+        )
 
         # Pair-point registration
         self.ui.pushPlanLandmarks.connect("clicked(bool)", self.onPushPlanLandmarks)
@@ -188,11 +234,21 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
         self.ui.pushOverlayHeatMap.connect("clicked(bool)", self.onPushOverlayHeatMap)
         self.ui.pushResetCortex.connect("clicked(bool)", self.onPushResetCortex)
         self.ui.pushUniformColoring.connect("clicked(bool)", self.onPushUniformColoring)
+        self.ui.pushRecomputeHeatMap.connect(
+            "clicked(bool)", self.onPushRecomputeHeatMap
+        )
+        self.ui.pushSaveMEPSamples.connect("clicked(bool)", self.onPushSaveMEPSamples)
+        self.ui.pushLoadMEPSamples.connect("clicked(bool)", self.onPushLoadMEPSamples)
 
 
 
         # Make sure parameter node is initialized (needed for module reload)
         self.initializeParameterNode()
+        startupTiming("MedImgPlan").mark("widget")
+        startupTiming("MedImgPlan").report("setup")
+
+        # Locators of the selected meshes are built in idle time
+        self.logic.utilScheduleMeshPreparation()
 
     def updateGUIFromParameterNode(self, caller=None, event=None):
         """
@@ -236,6 +292,31 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
         self.ui.checkBoxGridPerspPlane.checked = (
             self._parameterNode.GetParameter("PlanGridOnPerspPlane") == "true"
         )
+        self.ui.checkHeatMapIncremental.checked = (
+            self._parameterNode.GetParameter("HeatMapIncrementalUpdate") == "true"
+        )
+        self.ui.comboHeatMapAggregation.currentText = self._parameterNode.GetParameter(
+            "HeatMapAggregation"
+        )
+        self.ui.checkSkinProjectionTable.checked = (
+            self._parameterNode.GetParameter("UseSkinProjectionTable") == "true"
+        )
+        self.ui.checkPointCloudMarkups.checked = (
+            self._parameterNode.GetParameter("PointCloudAsMarkups") == "true"
+        )
+        self.ui.spinPredictedTREFLE.value = float(
+            self._parameterNode.GetParameter("PredictedTREFLE")
+        )
+        self.ui.checkPredictedTREOnBrain.checked = (
+            self._parameterNode.GetParameter("PredictedTREOnBrain") == "true"
+        )
+        self.ui.checkPredictedTRELive.checked = (
+            self._parameterNode.GetParameter("PredictedTRELive") == "true"
+        )
+        if self._parameterNode.GetParameter("ICPResidualStats"):
+            self.ui.labelICPResiduals.text = (
+                "Residuals: " + self._parameterNode.GetParameter("ICPResidualStats")
+            )
         self.ui.radioButtonToolRotSkin.checked = (
             self._parameterNode.GetParameter("ToolRotOption") == "skin"
         )
@@ -300,6 +381,9 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
         # All the GUI updates are done
         self._updatingGUIFromParameterNode = False
 
+    def onMeshSelectionChanged(self, node=None):
+        self.logic.utilScheduleMeshPreparation()
+
     def updateParameterNodeFromGUI(self, caller=None, event=None):
         """
         This method is called when the user makes any change in the GUI.
@@ -351,6 +435,33 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
             "true" if self.ui.checkBoxGridPerspPlane.checked else "false",
         )
 
+        self._parameterNode.SetParameter(
+            "HeatMapIncrementalUpdate",
+            "true" if self.ui.checkHeatMapIncremental.checked else "false",
+        )
+        self._parameterNode.SetParameter(
+            "HeatMapAggregation", self.ui.comboHeatMapAggregation.currentText
+        )
+        self._parameterNode.SetParameter(
+            "PredictedTREFLE", str(self.ui.spinPredictedTREFLE.value)
+        )
+        self._parameterNode.SetParameter(
+            "PredictedTREOnBrain",
+            "true" if self.ui.checkPredictedTREOnBrain.checked else "false",
+        )
+        self._parameterNode.SetParameter(
+            "PredictedTRELive",
+            "true" if self.ui.checkPredictedTRELive.checked else "false",
+        )
+        self._parameterNode.SetParameter(
+            "UseSkinProjectionTable",
+            "true" if self.ui.checkSkinProjectionTable.checked else "false",
+        )
+        self._parameterNode.SetParameter(
+            "PointCloudAsMarkups",
+            "true" if self.ui.checkPointCloudMarkups.checked else "false",
+        )
+
         # Tool Orientation Options
         if self.ui.radioButtonToolRotSkin.checked:
             self._parameterNode.SetParameter("ToolRotOption", "skin")
@@ -419,6 +530,57 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
             self.ui.pathRegResult.currentPath.strip(),
         )
 
+    def onPushBatchFRE(self):
+        if not self.ui.pathBatchFREManifest.currentPath:
+            slicer.util.errorDisplay("Please select a manifest file first!")
+            return
+        if not self.ui.pathBatchFRETable.currentPath:
+            slicer.util.errorDisplay("Please select an output table file first!")
+            return
+        self.logic.processBatchFRE(
+            self.ui.pathBatchFREManifest.currentPath.strip(),
+            self.ui.pathBatchFRETable.currentPath.strip(),
+            self.ui.checkBatchFREVisualize.checked,
+        )
+
+    def onPushLocalRegister(self):
+        if not self.ui.pathDigLandmarks.currentPath:
+            slicer.util.errorDisplay("Please select digitized landmarks file first!")
+            return
+        self.updateParameterNodeFromGUI()
+        self.logic.processLocalLandmarkRegistration(
+            self.ui.pathDigLandmarks.currentPath.strip(),
+            self.ui.pathRegResult.currentPath.strip(),
+        )
+
+    def onPushLocalICPRegister(self):
+        if not self.ui.pathICPPoints.currentPath:
+            slicer.util.errorDisplay("Please select ICP point clouds file first!")
+            return
+        self.updateParameterNodeFromGUI()
+        self.logic.processLocalICPRegistration(
+            self.ui.pathICPPoints.currentPath.strip(),
+            self.ui.pathICPReg.currentPath.strip(),
+        )
+
+    def onPushPredictedTRE(self):
+        self.updateParameterNodeFromGUI()
+        self.logic.processPredictedTREMap()
+
+    def onPushHidePredictedTRE(self):
+        self.ui.checkPredictedTRELive.checked = False
+        self.updateParameterNodeFromGUI()
+        self.logic.processHidePredictedTREMap()
+
+    def onPredictedTREOptionChanged(self):
+        self.updateParameterNodeFromGUI()
+        if self.ui.checkPredictedTRELive.checked:
+            self.logic.utilSchedulePredictedTRE()
+
+    def onCheckPredictedTRELive(self, checked):
+        self.updateParameterNodeFromGUI()
+        self.logic.processSetPredictedTRELive(checked)
+
     def onPushPlanLandmarks(self):
         self.updateParameterNodeFromGUI()
         self.logic.processPushPlanLandmarks(
@@ -611,6 +773,25 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
             self.ui.pathICPPoints.currentPath.strip(),
         )
 
+    def onPushBuildSkinProjectionTable(self):
+        self.logic.processBuildSkinProjectionTable()
+
+    def onPushSaveSkinProjectionTable(self):
+        if not self.ui.pathSkinProjectionTable.currentPath:
+            slicer.util.errorDisplay("Please select a file first!")
+            return
+        self.logic.processSaveSkinProjectionTable(
+            self.ui.pathSkinProjectionTable.currentPath.strip()
+        )
+
+    def onPushLoadSkinProjectionTable(self):
+        if not self.ui.pathSkinProjectionTable.currentPath:
+            slicer.util.errorDisplay("Please select a file first!")
+            return
+        self.logic.processLoadSkinProjectionTable(
+            self.ui.pathSkinProjectionTable.currentPath.strip()
+        )
+
     def onRadioToolRotOptions(self):
         self.updateParameterNodeFromGUI()
         if self._parameterNode.GetNodeReference("TargetPoseTransform"):
@@ -651,3 +832,28 @@ class MedImgPlanWidget(MedImgPlanWidgetBase):
     def onPushUniformColoring(self):
         inmodel = self._parameterNode.GetNodeReference("InputMeshBrain")
         self.logic.processUniformColoring(inmodel)
+
+    def onPushRecomputeHeatMap(self):
+        if not self._parameterNode.GetNodeReference("InputMeshBrain"):
+            slicer.util.errorDisplay("Please select brain mesh first!")
+            return
+        inmodel = self._parameterNode.GetNodeReference("InputMeshBrain")
+        self.logic.processRecomputeHeatMap(inmodel)
+
+    def onPushSaveMEPSamples(self):
+        if not self.ui.pathMEPSamples.currentPath:
+            slicer.util.errorDisplay("Please select a file first!")
+            return
+        self.logic.processSaveMEPSamples(self.ui.pathMEPSamples.currentPath.strip())
+
+    def onPushLoadMEPSamples(self):
+        if not self.ui.pathMEPSamples.currentPath:
+            slicer.util.errorDisplay("Please select a file first!")
+            return
+        if not self._parameterNode.GetNodeReference("InputMeshBrain"):
+            slicer.util.errorDisplay("Please select brain mesh first!")
+            return
+        inmodel = self._parameterNode.GetNodeReference("InputMeshBrain")
+        self.logic.processLoadMEPSamples(
+            self.ui.pathMEPSamples.currentPath.strip(), inmodel
+        )
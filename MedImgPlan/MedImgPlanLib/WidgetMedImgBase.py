@@ -27,7 +27,7 @@ import vtk, qt, ctk, slicer
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 
-from MedImgPlanLib.LogicMedImg import MedImgPlanLogic
+from MedImgPlanLib.UtilStartupTiming import startupTiming
 
 #
 # MedImgPlanWidget
@@ -49,11 +49,13 @@ class MedImgPlanWidgetBase(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.logic = None
         self._parameterNode = None
         self._updatingGUIFromParameterNode = False
+        self._indicatorModelsPreloaded = False
 
     def setup(self):
         """
         Called when the user opens the module the first time and the widget is initialized.
         """
+        startupTiming("MedImgPlan").restart()
         ScriptedLoadableModuleWidget.setup(self)
 
         # Load widget from .ui file (created by Qt Designer).
@@ -66,10 +68,17 @@ class MedImgPlanWidgetBase(ScriptedLoadableModuleWidget, VTKObservationMixin):
         # "mrmlSceneChanged(vtkMRMLScene*)" signal in is connected to each MRML widget's.
         # "setMRMLScene(vtkMRMLScene*)" slot.
         uiWidget.setMRMLScene(slicer.mrmlScene)
+        startupTiming("MedImgPlan").mark("ui")
+
+        # Imported here and not with the module, so that Slicer starts without
+        # the planning logic and its dependencies
+        from MedImgPlanLib.LogicMedImg import MedImgPlanLogic
+        startupTiming("MedImgPlan").mark("logic import")
 
         # Create logic class. Logic implements all computations that should be possible to run
         # in batch mode, without a graphical user interface.
         self.logic = MedImgPlanLogic(self.resourcePath('Configs/'))
+        startupTiming("MedImgPlan").mark("logic")
 
     def cleanup(self):
         """
@@ -77,6 +86,9 @@ class MedImgPlanWidgetBase(ScriptedLoadableModuleWidget, VTKObservationMixin):
         """
         self.removeObservers()
         self.logic._connections.clear()
+        self.logic._offload.shutdown()
+        self.logic.utilRemoveObservations()
+        self.logic._nodes.release()
 
     def enter(self):
         """
@@ -84,6 +96,10 @@ class MedImgPlanWidgetBase(ScriptedLoadableModuleWidget, VTKObservationMixin):
         """
         # Make sure parameter node exists and observed
         self.initializeParameterNode()
+        # The indicator models are read in idle time after the first entry
+        if not self._indicatorModelsPreloaded:
+            self._indicatorModelsPreloaded = True
+            qt.QTimer.singleShot(0, self.logic.utilPreloadIndicatorModels)
 
     def exit(self):
         """
@@ -22,11 +22,17 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+from RobotControlLib.UtilStartupTiming import startupTiming
+
+# cost of the imports below, reported once Slicer has started
+startupTiming("RobotControl").restart()
+
 import os
 import json
 import logging
-import math
 import vtk
+from vtk.util import numpy_support
+import numpy
 import qt
 import ctk
 import slicer
@@ -34,7 +40,18 @@ from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 
 from RobotControlLib.UtilConnections import UtilConnections
+from RobotControlLib.UtilConfig import ConfigService
 from RobotControlLib.UtilFormat import utilNumStrFormat
+from RobotControlLib.UtilCommandScheduler import CommandScheduler
+from RobotControlLib.UtilRobotState import RobotStatePoller
+from RobotControlLib.UtilTrajectory import interpolatePoses, computeClearance
+from RobotControlLib.UtilJog import (
+    JOG_DIRECTIONS,
+    JogController,
+    utilManualAdjustCommand,
+)
+
+startupTiming("RobotControl").mark("import")
 
 #
 # RobotControl
@@ -47,6 +64,7 @@ class RobotControl(ScriptedLoadableModule):
     """
 
     def __init__(self, parent):
+        startupTiming("RobotControl").restart()
         ScriptedLoadableModule.__init__(self, parent)
         self.parent.title = "Robot Control"
         self.parent.categories = ["RoTMS"]
@@ -66,10 +84,11 @@ and Steve Pieper, Isomics, Inc. and was partially funded by NIH grant 3P41RR0132
 
         # Additional initialization step after application startup is complete
         slicer.app.connect("startupCompleted()", appStartUpPostAction)
+        startupTiming("RobotControl").mark("module")
 
 
 def appStartUpPostAction():
-    return
+    startupTiming("RobotControl").report("launch")
 
 #
 # RobotControlWidget
@@ -96,6 +115,7 @@ class RobotControlWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         """
         Called when the user opens the module the first time and the widget is initialized.
         """
+        startupTiming("RobotControl").restart()
         ScriptedLoadableModuleWidget.setup(self)
 
         # Load widget from .ui file (created by Qt Designer).
@@ -108,10 +128,12 @@ class RobotControlWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         # "mrmlSceneChanged(vtkMRMLScene*)" signal in is connected to each MRML widget's.
         # "setMRMLScene(vtkMRMLScene*)" slot.
         uiWidget.setMRMLScene(slicer.mrmlScene)
+        startupTiming("RobotControl").mark("ui")
 
         # Create logic class. Logic implements all computations that should be possible to run
         # in batch mode, without a graphical user interface.
         self.logic = RobotControlLogic(self.resourcePath('Configs/'))
+        startupTiming("RobotControl").mark("logic")
 
         # Connections
 
@@ -129,6 +151,11 @@ class RobotControlWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             "valueChanged(double)", self.updateParameterNodeFromGUI)
         self.ui.checkBoxSafe.connect(
             "toggled(bool)", self.updateParameterNodeFromGUI)
+        self.ui.checkBoxJog.connect(
+            "toggled(bool)", self.updateParameterNodeFromGUI)
+        self.ui.checkBoxPollState.connect(
+            "toggled(bool)", self.onCheckPollState)
+        self.logic._robotState.stateChanged = self.updateRobotStateLabels
 
         # Buttons
 
@@ -149,6 +176,8 @@ class RobotControlWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.ui.pushGetJntAngs.connect('clicked(bool)', self.onPushGetJntAngs)
         self.ui.pushGetEFFPose.connect('clicked(bool)', self.onPushGetEFFPose)
 
+        self.ui.pushPreviewTrajectory.connect(
+            'clicked(bool)', self.onPushPreviewTrajectory)
         self.ui.pushExecute.connect('clicked(bool)', self.onPushExecute)
         self.ui.pushConfirm.connect('clicked(bool)', self.onPushConfirm)
 
@@ -167,16 +196,28 @@ class RobotControlWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.ui.pushRoll.connect('clicked(bool)', self.onPushRoll)
         self.ui.pushYaw.connect('clicked(bool)', self.onPushYaw)
 
+        # Hold-to-jog on the same buttons
+        for direction in JOG_DIRECTIONS:
+            button = getattr(self.ui, "push" + direction.capitalize())
+            button.connect('pressed()', lambda d=direction: self.onJogPressed(d))
+            button.connect('released()', self.onJogReleased)
+
         self.ui.pushEndAndBack.connect('clicked(bool)', self.onPushEndAndBack)
 
         # Make sure parameter node is initialized (needed for module reload)
         self.initializeParameterNode()
+        startupTiming("RobotControl").mark("widget")
+        startupTiming("RobotControl").report("setup")
 
     def cleanup(self):
         """
         Called when the application closes and the module widget is destroyed.
         """
         self.removeObservers()
+        self.logic._jog.release()
+        self.logic._robotState.stop()
+        self.logic._robotState.stateChanged = None
+        self.logic._scheduler.clear()
         self.logic._connections.clear()
 
     def enter(self):
@@ -260,6 +301,10 @@ class RobotControlWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             self._parameterNode.GetParameter("TranslationAdjustmentValue"))
         self.ui.checkBoxSafe.checked = (
             self._parameterNode.GetParameter("SafeCheck") == "true")
+        self.ui.checkBoxJog.checked = (
+            self._parameterNode.GetParameter("JogMode") == "true")
+        self.ui.labelTrajectory.text = \
+            self._parameterNode.GetParameter("TrajectoryClearance")
 
         # Update buttons states and tooltips
         if self._parameterNode.GetParameter("SafeCheck") == "true":
@@ -286,6 +331,8 @@ class RobotControlWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             self.ui.pushYaw.toolTip = "Yaw tool"
             self.ui.pushYaw.enabled = True
         else:
+            # Never keep jogging with the safety unchecked
+            self.logic._jog.release()
             self.ui.pushExecute.toolTip = "Safety not checked"
             self.ui.pushExecute.enabled = False
             self.ui.pushConfirm.toolTip = "Safety not checked"
@@ -330,6 +377,8 @@ class RobotControlWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             "TranslationAdjustmentValue", str(self.ui.sliderTranslation.value))
         self._parameterNode.SetParameter(
             "SafeCheck", "true" if self.ui.checkBoxSafe.checked else "false")
+        self._parameterNode.SetParameter(
+            "JogMode", "true" if self.ui.checkBoxJog.checked else "false")
 
         self._parameterNode.EndModify(wasModified)
 
@@ -340,95 +389,133 @@ class RobotControlWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         slicer.util.selectModule("TargetVisualization")
 
     def onPushSessionReinit(self):
-        msg = self.logic._commandsData["SESSION_REINIT"]
-        self.logic._connections.utilSendCommand(msg)
+        self.logic.utilSubmit("SESSION_REINIT")
 
     def onPushConnectRob(self):
-        msg = self.logic._commandsData["ROB_CONN_ON"]
-        self.logic._connections.utilSendCommand(msg)
+        self.logic.utilSubmit("ROB_CONN_ON")
 
     def onPushDisconnectRob(self):
-        msg = self.logic._commandsData["ROB_CONN_OFF"]
-        self.logic._connections.utilSendCommand(msg)
+        self.logic.utilSubmit("ROB_CONN_OFF")
 
     def onPushGetJntAngs(self):
-        msg = self.logic._commandsData["GET_JNT_ANGS"]
-        self.logic._connections.utilSendCommand(msg)
-        data = self.logic._connections.receiveMsg()
-        print(data)
+        # The reply lands in the robot state cache and the labels
+        self.logic._robotState.request("joint_angles")
 
     def onPushGetEFFPose(self):
-        msg = self.logic._commandsData["GET_EFF_POSE"]
-        self.logic._connections.utilSendCommand(msg)
-        data = self.logic._connections.receiveMsg()
-        print(data)
+        self.logic._robotState.request("effector_pose")
 
     def onPushGetJntSetInit(self):
-        msg = self.logic._commandsData["GET_JNT_ANGS_TOINIT"]
-        self.logic._connections.utilSendCommand(msg)
-        data = self.logic._connections.receiveMsg()
-        print(data)
+        self.logic._robotState.request("joint_angles", "GET_JNT_ANGS_TOINIT")
+
+    def onCheckPollState(self, checked):
+        if checked:
+            self.logic._robotState.start()
+        else:
+            self.logic._robotState.stop()
+
+    def updateRobotStateLabels(self):
+        for kind, label, title in (
+            ("joint_angles", self.ui.labelJntAngs, "Joint angles: "),
+            ("effector_pose", self.ui.labelEFFPose, "End-effector pose: "),
+        ):
+            values = self.logic._robotState.value(kind)
+            if values is None:
+                label.text = title + "-"
+                continue
+            label.text = title + ", ".join(
+                [utilNumStrFormat(v, 4, 0) for v in values]) + (
+                " (stale)" if self.logic._robotState.isStale(kind) else "")
+
+    def onPushPreviewTrajectory(self):
+        self.logic.processPreviewTrajectory()
 
     def onPushExecute(self):
-        msg = self.logic._commandsData["EXECUTE_MOTION"]
-        self.logic._connections.utilSendCommand(msg)
+        self.logic.utilSubmit("EXECUTE_MOTION")
 
     def onPushConfirm(self):
-        msg = self.logic._commandsData["EXECUTE_MOVE_CONFIRM"]
-        self.logic._connections.utilSendCommand(msg)
+        self.logic.utilSubmit("EXECUTE_MOVE_CONFIRM")
 
     def onPushEndAndBack(self):
-        msg = self.logic._commandsData["EXECUTE_ENDBACK"]
-        self.logic._connections.utilSendCommand(msg)
+        self.logic.utilSubmit("EXECUTE_ENDBACK")
 
     def onPushRobotHoming(self):
-        msg = self.logic._commandsData["EXECUTE_ROB_HOMING"]
-        self.logic._connections.utilSendCommand(msg)
+        self.logic.utilSubmit("EXECUTE_ROB_HOMING")
 
     def onPushReInit(self):
-        msg = self.logic._commandsData["EXECUTE_BACKINIT"]
-        self.logic._connections.utilSendCommand(msg)
+        self.logic.utilSubmit("EXECUTE_BACKINIT")
 
     def onPushReOffset(self):
-        msg = self.logic._commandsData["EXECUTE_BACKOFFSET"]
-        self.logic._connections.utilSendCommand(msg)
+        self.logic.utilSubmit("EXECUTE_BACKOFFSET")
 
     def onPushBackward(self):
+        if self._parameterNode.GetParameter("JogMode") == "true":
+            return
         self.logic.utilManualAdjust("backward",
             float(self._parameterNode.GetParameter("TranslationAdjustmentValue")))
 
     def onPushCloser(self):
+        if self._parameterNode.GetParameter("JogMode") == "true":
+            return
         self.logic.utilManualAdjust("closer",
             float(self._parameterNode.GetParameter("TranslationAdjustmentValue")))
 
     def onPushFarther(self):
+        if self._parameterNode.GetParameter("JogMode") == "true":
+            return
         self.logic.utilManualAdjust("farther",
             float(self._parameterNode.GetParameter("TranslationAdjustmentValue")))
 
     def onPushForward(self):
+        if self._parameterNode.GetParameter("JogMode") == "true":
+            return
         self.logic.utilManualAdjust("forward",
             float(self._parameterNode.GetParameter("TranslationAdjustmentValue")))
 
     def onPushLeft(self):
+        if self._parameterNode.GetParameter("JogMode") == "true":
+            return
         self.logic.utilManualAdjust("left",
             float(self._parameterNode.GetParameter("TranslationAdjustmentValue")))
 
     def onPushPitch(self):
+        if self._parameterNode.GetParameter("JogMode") == "true":
+            return
         self.logic.utilManualAdjust("pitch",
             float(self._parameterNode.GetParameter("RotationAdjustmentValue")))
 
     def onPushRight(self):
+        if self._parameterNode.GetParameter("JogMode") == "true":
+            return
         self.logic.utilManualAdjust("right",
             float(self._parameterNode.GetParameter("TranslationAdjustmentValue")))
 
     def onPushRoll(self):
+        if self._parameterNode.GetParameter("JogMode") == "true":
+            return
         self.logic.utilManualAdjust("roll",
             float(self._parameterNode.GetParameter("RotationAdjustmentValue")))
 
     def onPushYaw(self):
+        if self._parameterNode.GetParameter("JogMode") == "true":
+            return
         self.logic.utilManualAdjust("yaw",
             float(self._parameterNode.GetParameter("RotationAdjustmentValue")))
 
+    def onJogPressed(self, direction):
+        if self._parameterNode.GetParameter("JogMode") != "true":
+            return
+        if self._parameterNode.GetParameter("SafeCheck") != "true":
+            return
+        # The increments of the sliders are the jog speeds, per second
+        if JOG_DIRECTIONS[direction][0] == "MAN_ADJUST_T":
+            speed = float(self._parameterNode.GetParameter("TranslationAdjustmentValue"))
+        else:
+            speed = float(self._parameterNode.GetParameter("RotationAdjustmentValue"))
+        self.logic._jog.press(direction, speed)
+
+    def onJogReleased(self):
+        self.logic._jog.release()
+
 #
 # RobotControlLogic
 #
@@ -450,11 +537,61 @@ class RobotControlLogic(ScriptedLoadableModuleLogic):
         """
         ScriptedLoadableModuleLogic.__init__(self)
         self._configPath = configPath
+        # the sockets are opened on the first command
         self._connections = UtilConnections(configPath, "RobotControl")
-        self._connections.setup()
 
         with open(self._configPath+"CommandsConfig.json") as f:
             self._commandsData = (json.load(f))["RobCtrlCmd"]
+        # parsed and validated once, reloaded when the file changes
+        self._config = ConfigService(self._configPath)
+
+        # All the commands go through the scheduler, which owns the channel
+        self._scheduler = CommandScheduler(self._connections, self._commandsData)
+        self._jog = JogController(self._scheduler, self._commandsData)
+        self._robotState = RobotStatePoller(self._scheduler)
+        self.utilApplyConfig()
+        self._config.configChanged = self.utilApplyConfig
+        # distance to the skin surface for the trajectory clearance
+        self._skinDistance = vtk.vtkImplicitPolyDataDistance()
+        self._skinDistanceKey = None
+
+    def utilApplyConfig(self):
+        """
+        Scheduler, jog and state polling settings of Config.json, applied
+        again whenever the file changes
+        """
+        self._scheduler.configure(
+            self._config["COMMAND_QUEUE_DEPTH"], self._config["COMMAND_TIMEOUT"])
+        self._jog.configure(
+            self._config["JOG_RATE"], self._config["JOG_HEARTBEAT_TIMEOUT"])
+        self._robotState.configure(
+            self._config["STATE_POLL_RATE"], self._config["STATE_STALE_AFTER"],
+            {"joint_angles": self._config["STATE_JOINT_COUNT"],
+             "effector_pose": self._config["STATE_POSE_LENGTH"]})
+
+    def getRobotState(self):
+        """
+        Last known robot state, without blocking:
+        {"joint_angles" / "effector_pose": (values, timestamp, stale)}
+        """
+        return self._robotState.state()
+
+    def getCommandMetrics(self):
+        """
+        Queue depth, wait times and counters of the command scheduler, per
+        priority class
+        """
+        return self._scheduler.metrics()
+
+    def utilSubmit(self, cmdKey, msg=None, dedupKey=None):
+        """
+        Queue a command. A command that cannot be delivered is reported.
+        """
+        def onReply(reply, status):
+            if status in ("timeout", "failed", "rejected"):
+                slicer.util.errorDisplay(
+                    "Failed to send command " + cmdKey + " (" + status + ")")
+        return self._scheduler.submit(cmdKey, msg, onReply, dedupKey)
 
     def setDefaultParameters(self, parameterNode):
         """
@@ -468,32 +605,151 @@ class RobotControlLogic(ScriptedLoadableModuleLogic):
             parameterNode.SetParameter("TranslationAdjustmentValue", "5.0")
         if not parameterNode.GetParameter("SafeCheck"):
             parameterNode.SetParameter("SafeCheck", "false")
+        if not parameterNode.GetParameter("JogMode"):
+            parameterNode.SetParameter("JogMode", "false")
+        if not parameterNode.GetParameter("TrajectoryClearance"):
+            parameterNode.SetParameter(
+                "TrajectoryClearance", "Approach trajectory not previewed")
+
+    def processPreviewTrajectory(self):
+        """
+        Preview the approach from the current coil pose to the planned
+        target pose, colored by the clearance of the coil to the skin
+        """
+        self._parameterNode = self.getParameterNode()
+
+        targetTransform = slicer.mrmlScene.GetSingletonNode(
+            "MedImgPlan.TargetPoseTransform", "vtkMRMLTransformNode")
+        if not targetTransform:
+            slicer.util.errorDisplay("Please plan a target pose first!")
+            return
+        currentTransform = slicer.mrmlScene.GetSingletonNode(
+            "TargetVisualization.CurrentPoseTransform", "vtkMRMLTransformNode")
+        if not currentTransform:
+            slicer.util.errorDisplay("Please start the target visualization first!")
+            return
+        medImgPlanParameterNode = slicer.mrmlScene.GetSingletonNode(
+            "MedImgPlan", "vtkMRMLScriptedModuleNode")
+        skinModel = medImgPlanParameterNode.GetNodeReference("InputMeshSkin") \
+            if medImgPlanParameterNode else None
+        if not skinModel:
+            slicer.util.errorDisplay("Please select the skin mesh in MedImgPlan first!")
+            return
+
+        # The whole sweep at once, (N,4,4) poses and (N,) clearances
+        poses = interpolatePoses(
+            slicer.util.arrayFromTransformMatrix(currentTransform, toWorld=True),
+            slicer.util.arrayFromTransformMatrix(targetTransform, toWorld=True),
+            self._config["TRAJECTORY_STEP_MM"],
+            self._config["TRAJECTORY_STEP_DEG"],
+            self._config["TRAJECTORY_MAX_SAMPLES"])
+        clearance = computeClearance(
+            poses, lambda points: self.utilSkinDistances(skinModel, points),
+            self._config["TRAJECTORY_COIL_RADIUS"])
+
+        self.utilShowTrajectory(poses[:, :3, 3], clearance)
+
+        closest = int(numpy.argmin(clearance))
+        where = 100.0 * closest / (clearance.shape[0] - 1)
+        if clearance[closest] < 0:
+            msg = "The coil enters the skin by {:.1f} mm at {:.0f}% of the approach".format(
+                -clearance[closest], where)
+        else:
+            msg = "Minimum clearance: {:.1f} mm at {:.0f}% of the approach".format(
+                clearance[closest], where)
+        self._parameterNode.SetParameter("TrajectoryClearance", msg)
+
+    def utilSkinDistances(self, skinModel, points):
+        """
+        Signed distance of points (M,3) to the skin surface, in world
+        coordinates, negative inside the skin. The normals are oriented
+        outwards first, so the sign does not depend on how the mesh was
+        saved. The distance function is only rebuilt when the skin mesh or
+        its transform changed.
+        """
+        polyData = skinModel.GetPolyData()
+        skinToWorld = None
+        if skinModel.GetParentTransformNode():
+            skinToWorld = slicer.util.arrayFromTransformMatrix(
+                skinModel.GetParentTransformNode(), toWorld=True)
+        key = (
+            skinModel.GetID(),
+            polyData.GetAddressAsString("vtkPolyData"),
+            polyData.GetMTime(),
+            None if skinToWorld is None else skinToWorld.tobytes())
+        if key != self._skinDistanceKey:
+            if skinToWorld is not None:
+                transform = vtk.vtkTransform()
+                transform.SetMatrix(slicer.util.vtkMatrixFromArray(skinToWorld))
+                transformFilter = vtk.vtkTransformPolyDataFilter()
+                transformFilter.SetTransform(transform)
+                transformFilter.SetInputData(polyData)
+                transformFilter.Update()
+                polyData = transformFilter.GetOutput()
+            normals = vtk.vtkPolyDataNormals()
+            normals.SetInputData(polyData)
+            normals.ComputeCellNormalsOn()
+            normals.SplittingOff()
+            normals.ConsistencyOn()
+            normals.AutoOrientNormalsOn()
+            normals.Update()
+            self._skinDistance.SetInput(normals.GetOutput())
+            self._skinDistanceKey = key
+
+        points = numpy.ascontiguousarray(points, dtype=numpy.float64).reshape((-1, 3))
+        output = vtk.vtkDoubleArray()
+        self._skinDistance.FunctionValue(
+            numpy_support.numpy_to_vtk(points, deep=True), output)
+        return numpy_support.vtk_to_numpy(output)
+
+    def utilShowTrajectory(self, points, clearance):
+        """
+        One polyline model through the coil centers, green far from the
+        skin, turning red as the clearance drops to 0. Where the coil
+        enters the skin (negative clearance) it is pure red.
+        """
+        polyData = vtk.vtkPolyData()
+        vtkPoints = vtk.vtkPoints()
+        vtkPoints.SetData(numpy_support.numpy_to_vtk(points, deep=True))
+        polyData.SetPoints(vtkPoints)
+        polyLine = vtk.vtkPolyLine()
+        polyLine.GetPointIds().SetNumberOfIds(points.shape[0])
+        for i in range(points.shape[0]):
+            polyLine.GetPointIds().SetId(i, i)
+        lines = vtk.vtkCellArray()
+        lines.InsertNextCell(polyLine)
+        polyData.SetLines(lines)
+
+        clearanceArray = numpy_support.numpy_to_vtk(clearance, deep=True)
+        clearanceArray.SetName("Clearance")
+        polyData.GetPointData().AddArray(clearanceArray)
+        indx = numpy.clip(
+            clearance / self._config["TRAJECTORY_CLEARANCE_WARN"], 0.0, 1.0)
+        colors = numpy.stack(
+            [1.0 - indx, indx, numpy.zeros_like(indx)], axis=1)
+        colorArray = numpy_support.numpy_to_vtk(
+            (255 * colors).astype(numpy.uint8), deep=True)
+        colorArray.SetName("Colors")
+        polyData.GetPointData().SetScalars(colorArray)
+
+        if not self._parameterNode.GetNodeReference("TrajectoryPreview"):
+            model = slicer.modules.models.logic().AddModel(polyData)
+            model.SetName("TrajectoryPreview")
+            self._parameterNode.SetNodeReferenceID(
+                "TrajectoryPreview", model.GetID())
+        model = self._parameterNode.GetNodeReference("TrajectoryPreview")
+        model.SetAndObservePolyData(polyData)
+        displayNode = model.GetDisplayNode()
+        displayNode.SetLineWidth(3.0)
+        displayNode.SetActiveScalarName("Colors")
+        displayNode.SetScalarRangeFlag(slicer.vtkMRMLDisplayNode.UseDirectMapping)
+        displayNode.SetScalarVisibility(True)
 
     def utilManualAdjust(self, cmdstr, value):
-        if cmdstr == "backward":
-            self._connections.utilSendCommand(
-                self._commandsData["MAN_ADJUST_T"] + "_0.0_" + utilNumStrFormat(value/1000.0, decimal=10) + "_0.0")
-        if cmdstr == "closer":
-            self._connections.utilSendCommand(
-                self._commandsData["MAN_ADJUST_T"] + "_0.0_0.0_" + utilNumStrFormat(-value/1000.0, decimal=10))
-        if cmdstr == "farther":
-            self._connections.utilSendCommand(
-                self._commandsData["MAN_ADJUST_T"] + "_0.0_0.0_" + utilNumStrFormat(value/1000.0, decimal=10))
-        if cmdstr == "forward":
-            self._connections.utilSendCommand(
-                self._commandsData["MAN_ADJUST_T"] + "_0.0_" + utilNumStrFormat(-value/1000.0, decimal=10) + "_0.0")
-        if cmdstr == "left":
-            self._connections.utilSendCommand(
-                self._commandsData["MAN_ADJUST_T"] + "_" + utilNumStrFormat(value/1000.0, decimal=10) + "_0.0_0.0")
-        if cmdstr == "pitch":
-            self._connections.utilSendCommand(
-                self._commandsData["MAN_ADJUST_R"] + "_" + utilNumStrFormat(value/180.0*math.pi, decimal=10) + "_0.0_0.0")
-        if cmdstr == "right":
-            self._connections.utilSendCommand(
-                self._commandsData["MAN_ADJUST_T"] + "_" + utilNumStrFormat(-value/1000.0, decimal=10) + "_0.0_0.0")
-        if cmdstr == "roll":
-            self._connections.utilSendCommand(
-                self._commandsData["MAN_ADJUST_R"] + "_0.0_" + utilNumStrFormat(value/180.0*math.pi, decimal=10) + "_0.0")
-        if cmdstr == "yaw":
-            self._connections.utilSendCommand(
-                self._commandsData["MAN_ADJUST_R"] + "_0.0_0.0_" + utilNumStrFormat(value/180.0*math.pi, decimal=10))
+        cmdKey, axis, sign = JOG_DIRECTIONS[cmdstr]
+        delta = [0.0, 0.0, 0.0]
+        delta[axis] = sign * value
+        # every click is an increment of its own, never superseded
+        self.utilSubmit(
+            cmdKey, utilManualAdjustCommand(self._commandsData, cmdKey, delta),
+            dedupKey=object())
@@ -0,0 +1,274 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+#
+# Command scheduler
+#
+
+import time
+from collections import deque
+import qt
+
+PRIORITY_SAFETY = 0
+PRIORITY_MOTION = 1
+PRIORITY_QUERY = 2
+PRIORITY_NAMES = ("safety", "motion", "query")
+
+# Commands that stop the robot or bring it back have to go out first
+SAFETY_COMMANDS = (
+    "MAN_ADJUST_STOP",
+    "EXECUTE_ENDBACK",
+    "EXECUTE_ROB_HOMING",
+    "EXECUTE_BACKINIT",
+    "EXECUTE_BACKOFFSET",
+    "ROB_CONN_OFF",
+)
+QUERY_COMMANDS = (
+    "GET_JNT_ANGS",
+    "GET_EFF_POSE",
+)
+
+
+def commandReplies(cmdKey):
+    """
+    Number of datagrams a command is answered with: the queries send an
+    acknowledgement, then the data
+    """
+    return 2 if cmdKey.startswith("GET_") else 1
+
+
+def commandPriority(cmdKey):
+    if cmdKey in SAFETY_COMMANDS:
+        return PRIORITY_SAFETY
+    if cmdKey in QUERY_COMMANDS:
+        return PRIORITY_QUERY
+    return PRIORITY_MOTION
+
+
+class CommandScheduler():
+    """
+    Single owner of the command channel. Commands wait in one queue per
+    priority class (safety, motion, query) and go out one at a time, the
+    next one once the previous is acknowledged or timed out.
+    - The queues are bounded (maxDepth in total). When full, a new motion or
+      query command is rejected; a safety command never is, it evicts the
+      oldest query or motion command instead.
+    - A pending command with the same dedup key (the command itself by
+      default) is superseded by the new one.
+    - A safety command preempts: pending motion commands are dropped, it is
+      sent right away, and the command in flight is not waited for anymore.
+    Replies carry no id. A command that is not waited for anymore (timed
+    out or preempted) may still be answered: what already arrived is
+    dropped, and as many datagrams as it still owed are skipped ahead of
+    the next command's reply (if they never come, that command is accepted
+    at its timeout with what it got). Leftover datagrams are dropped before
+    each send.
+    callback(reply, status) is called once per command: status is "ok" with
+    the reply string (the data datagram for a query), else "timeout",
+    "failed", "rejected", "superseded" or "preempted" with reply None.
+    """
+
+    def __init__(self, connections, commandsData, maxDepth=32, timeout=0.5):
+        self._connections = connections
+        self._commandsData = commandsData
+        self.configure(maxDepth, timeout)
+        self._queues = [deque(), deque(), deque()]
+        self._inFlight = None
+        self._owed = 0
+        self._metrics = {
+            "submitted": [0, 0, 0],
+            "sent": [0, 0, 0],
+            "superseded": [0, 0, 0],
+            "rejected": [0, 0, 0],
+            "preempted": [0, 0, 0],
+            "timeouts": [0, 0, 0],
+            "waitTotal": [0.0, 0.0, 0.0],
+            "waitMax": [0.0, 0.0, 0.0],
+            "maxDepth": 0,
+        }
+        self._timer = qt.QTimer()
+        self._timer.setInterval(10)
+        self._timer.connect("timeout()", self.tick)
+
+    def configure(self, maxDepth, timeout):
+        """
+        Queue depth and default timeout, for the commands submitted from now
+        """
+        self._maxDepth = maxDepth
+        self._timeout = timeout
+
+    def submit(self, cmdKey, msg=None, callback=None, dedupKey=None, timeout=None):
+        """
+        Queue a command (msg defaults to the plain command string).
+        Returns False if it was rejected.
+        """
+        priority = commandPriority(cmdKey)
+        entry = {
+            "cmdKey": cmdKey,
+            "msg": msg if msg is not None else self._commandsData[cmdKey],
+            "callback": callback,
+            "dedupKey": dedupKey if dedupKey is not None else cmdKey,
+            "timeout": timeout if timeout is not None else self._timeout,
+            "queuedAt": time.monotonic(),
+            "expected": commandReplies(cmdKey),
+            "replies": [],
+        }
+        self._metrics["submitted"][priority] += 1
+
+        queue = self._queues[priority]
+        for i, other in enumerate(queue):
+            if other["dedupKey"] == entry["dedupKey"]:
+                self._metrics["superseded"][priority] += 1
+                del queue[i]
+                self.utilCallback(other, None, "superseded")
+                break
+
+        if priority == PRIORITY_SAFETY:
+            while self._queues[PRIORITY_MOTION]:
+                self._metrics["preempted"][PRIORITY_MOTION] += 1
+                self.utilCallback(self._queues[PRIORITY_MOTION].popleft(), None, "preempted")
+            if self._inFlight is not None and commandPriority(
+                    self._inFlight["cmdKey"]) != PRIORITY_SAFETY:
+                self._metrics["preempted"][commandPriority(self._inFlight["cmdKey"])] += 1
+                preempted, self._inFlight = self._inFlight, None
+                self.utilAbandon(preempted)
+                self.utilCallback(preempted, None, "preempted")
+            if self.depth() >= self._maxDepth and self._queues[PRIORITY_QUERY]:
+                self._metrics["rejected"][PRIORITY_QUERY] += 1
+                self.utilCallback(self._queues[PRIORITY_QUERY].popleft(), None, "rejected")
+        elif self.depth() >= self._maxDepth:
+            self._metrics["rejected"][priority] += 1
+            self.utilCallback(entry, None, "rejected")
+            return False
+
+        queue.append(entry)
+        self._metrics["maxDepth"] = max(self._metrics["maxDepth"], self.depth())
+        self.tick()
+        return True
+
+    def depth(self, priority=None):
+        if priority is None:
+            return sum(len(q) for q in self._queues)
+        return len(self._queues[priority])
+
+    def isIdle(self):
+        return self._inFlight is None and self.depth() == 0
+
+    def clear(self):
+        """
+        Drop everything pending and in flight
+        """
+        for queue in self._queues:
+            while queue:
+                self.utilCallback(queue.popleft(), None, "preempted")
+        if self._inFlight is not None:
+            entry, self._inFlight = self._inFlight, None
+            self.utilAbandon(entry)
+            self.utilCallback(entry, None, "preempted")
+        self._timer.stop()
+
+    def metrics(self):
+        """
+        Queue depth and wait time (queued to sent, seconds) per priority
+        class, plus the counters
+        """
+        res = {}
+        for p, name in enumerate(PRIORITY_NAMES):
+            sent = self._metrics["sent"][p]
+            res[name] = {
+                "depth": len(self._queues[p]),
+                "submitted": self._metrics["submitted"][p],
+                "sent": sent,
+                "superseded": self._metrics["superseded"][p],
+                "rejected": self._metrics["rejected"][p],
+                "preempted": self._metrics["preempted"][p],
+                "timeouts": self._metrics["timeouts"][p],
+                "waitMean": self._metrics["waitTotal"][p] / sent if sent else 0.0,
+                "waitMax": self._metrics["waitMax"][p],
+            }
+        res["maxDepth"] = self._metrics["maxDepth"]
+        return res
+
+    def tick(self):
+        now = time.monotonic()
+        if self._inFlight is not None:
+            replies = self._inFlight["replies"]
+            total = self._inFlight["skip"] + self._inFlight["expected"]
+            while len(replies) < total:
+                reply = self._connections.utilPollResponse()
+                if reply is None:
+                    break
+                replies.append(reply)
+            timedOut = now - self._inFlight["sentAt"] > self._inFlight["timeout"]
+            if len(replies) == total or (
+                    timedOut and len(replies) >= self._inFlight["expected"]):
+                entry, self._inFlight = self._inFlight, None
+                self.utilCallback(entry, replies[-1], "ok")
+            elif timedOut:
+                entry, self._inFlight = self._inFlight, None
+                self.utilAbandon(entry)
+                priority = commandPriority(entry["cmdKey"])
+                self._metrics["timeouts"][priority] += 1
+                print("Command " + entry["msg"] + " was not acknowledged")
+                self.utilCallback(entry, None, "timeout")
+            else:
+                return
+
+        for priority, queue in enumerate(self._queues):
+            if not queue:
+                continue
+            entry = queue.popleft()
+            wait = now - entry["queuedAt"]
+            self._metrics["sent"][priority] += 1
+            self._metrics["waitTotal"][priority] += wait
+            self._metrics["waitMax"][priority] = max(self._metrics["waitMax"][priority], wait)
+            try:
+                drained = self._connections.utilDrainResponses()
+                if drained > self._owed:
+                    print("Dropped " + str(drained - self._owed) + " unexpected replies")
+                self._owed = max(0, self._owed - drained)
+                self._connections.utilSendCommandAsync(entry["msg"])
+            except Exception as e:
+                print("Failed to send command " + entry["msg"] + " " + str(e))
+                self.utilCallback(entry, None, "failed")
+                continue
+            entry["sentAt"] = now
+            entry["skip"], self._owed = self._owed, 0
+            self._inFlight = entry
+            self._timer.start()
+            return
+
+        self._timer.stop()
+
+    def utilAbandon(self, entry):
+        """
+        The command in flight is not waited for anymore: drop its replies
+        that already arrived, and owe the ones still to come
+        """
+        owed = self._owed + entry["skip"] + entry["expected"] - len(entry["replies"])
+        self._owed = max(0, owed - self._connections.utilDrainResponses())
+
+    def utilCallback(self, entry, reply, status):
+        if entry["callback"] is not None:
+            entry["callback"](reply, status)
@@ -0,0 +1,162 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, json, logging
+import qt
+
+#
+# Module configuration
+#
+
+# Config.json keys and their types
+CONFIG_SCHEMA = {
+    "IP_RECEIVE_RobotControl":     str,
+    "IP_SEND_RobotControl":        str,
+    "PORT_RECEIVE_RobotControl":   int,
+    "PORT_SEND_RobotControl":      int,
+    "EOM_RobotControl":            str,
+    "JOG_RATE":                    float,
+    "JOG_HEARTBEAT_TIMEOUT":       float,
+    "STATE_POLL_RATE":             float,
+    "STATE_STALE_AFTER":           float,
+    "STATE_JOINT_COUNT":           int,
+    "STATE_POSE_LENGTH":           int,
+    "COMMAND_QUEUE_DEPTH":         int,
+    "COMMAND_TIMEOUT":             float,
+    "TRAJECTORY_STEP_MM":          float,
+    "TRAJECTORY_STEP_DEG":         float,
+    "TRAJECTORY_MAX_SAMPLES":      int,
+    "TRAJECTORY_COIL_RADIUS":      float,
+    "TRAJECTORY_CLEARANCE_WARN":   float,
+}
+
+# Bounds (inclusive, None for unbounded) of the numeric Config.json values
+CONFIG_RANGES = {
+    "PORT_RECEIVE_RobotControl": (1, 65535),
+    "PORT_SEND_RobotControl":    (1, 65535),
+    "JOG_RATE":                  (0.1, 1000.0),
+    "JOG_HEARTBEAT_TIMEOUT":     (0.01, None),
+    "STATE_POLL_RATE":           (0.01, 1000.0),
+    "STATE_STALE_AFTER":         (0.0, None),
+    "STATE_JOINT_COUNT":         (1, None),
+    "STATE_POSE_LENGTH":         (1, None),
+    "COMMAND_QUEUE_DEPTH":       (1, None),
+    "COMMAND_TIMEOUT":           (0.01, None),
+    "TRAJECTORY_STEP_MM":        (0.01, None),
+    "TRAJECTORY_STEP_DEG":       (0.01, None),
+    "TRAJECTORY_MAX_SAMPLES":    (2, None),
+    "TRAJECTORY_COIL_RADIUS":    (0.0, None),
+    "TRAJECTORY_CLEARANCE_WARN": (0.01, None),
+}
+
+
+def validateConfig(data, schema, name="Config.json", ranges=None):
+    """
+    Check data against schema (key -> type) and ranges (key -> (minimum,
+    maximum)), and return a copy with the values converted to the schema
+    types. Integers are accepted for floats.
+    Raises ValueError listing all the problems.
+    """
+    problems = []
+    res = dict(data)
+    for key, kind in schema.items():
+        if key not in data:
+            problems.append(key + " is missing")
+            continue
+        value = data[key]
+        if isinstance(value, bool) or not isinstance(
+            value, (int, float) if kind is float else kind
+        ):
+            problems.append(key + " should be " + kind.__name__)
+            continue
+        res[key] = kind(value)
+        minimum, maximum = (ranges or {}).get(key, (None, None))
+        if (minimum is not None and res[key] < minimum) or (
+            maximum is not None and res[key] > maximum
+        ):
+            problems.append(
+                key + " should be in [" + str(minimum) + ", "
+                + (str(maximum) if maximum is not None else "inf") + "]"
+            )
+    if problems:
+        raise ValueError("Invalid " + name + ": " + ", ".join(problems))
+    return res
+
+
+class ConfigService():
+    """
+    Config.json of a module, parsed and validated once. The file is
+    watched and reloaded only when it changes; an invalid new version is
+    reported and the previous one kept; configChanged is then called so
+    that the logic takes the new values. Values that are only used at
+    startup (ports, worker count) still need a module reload.
+    """
+
+    def __init__(self, configPath, schema=CONFIG_SCHEMA, fileName="Config.json",
+                 ranges=CONFIG_RANGES):
+        self._configPath = configPath
+        self._fileName = fileName
+        self._schema = schema
+        self._ranges = ranges
+        self._data = self.utilLoad()
+        self.configChanged = None
+        self._watcher = qt.QFileSystemWatcher()
+        self._watcher.addPath(configPath + fileName)
+        self._watcher.connect("fileChanged(QString)", self.onFileChanged)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def path(self, key):
+        """
+        Path of a resource file named by key, relative to the config folder
+        """
+        return self._configPath + self._data[key]
+
+    def onFileChanged(self, path):
+        if not os.path.exists(path):
+            # saved by replacing the file, wait for the new one
+            qt.QTimer.singleShot(200, lambda: self.onFileChanged(path))
+            return
+        if path not in self._watcher.files():
+            self._watcher.addPath(path)
+        try:
+            data = self.utilLoad()
+        except (OSError, ValueError) as e:
+            logging.error("Configuration not reloaded: " + str(e))
+            return
+        if data == self._data:
+            return
+        self._data = data
+        logging.info("Configuration reloaded from " + path)
+        if self.configChanged:
+            self.configChanged()
+
+    def utilLoad(self):
+        with open(self._configPath + self._fileName) as f:
+            return validateConfig(
+                json.load(f), self._schema, self._fileName, self._ranges)
@@ -27,6 +27,7 @@ SOFTWARE.
 #
 
 import socket
+import select
 import json
 import slicer
 
@@ -35,6 +36,7 @@ class UtilConnections():
     """
     Connection class.
     Blocking send and receive
+    The sockets are opened on first use (or by an explicit setup())
     """
 
     def __init__(self, configPath, modulesufx):
@@ -51,6 +53,7 @@ class UtilConnections():
 
         self._sock_receive = None
         self._sock_send = None
+        self._isSetup = False
 
     def setup(self):
         self._sock_receive = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -59,17 +62,31 @@ class UtilConnections():
             (self._sock_ip_receive, self._sock_port_receive))
         self._sock_receive.settimeout(0.5)
 
+    def utilEnsureSetup(self):
+        if not self._isSetup:
+            try:
+                self.setup()
+            except Exception:
+                # e.g. port already in use, do not leave half opened sockets
+                self.clear()
+                raise
+            self._isSetup = True
+
     def clear(self):
+        self._isSetup = False
         if self._sock_receive:
             self._sock_receive.close()
+            self._sock_receive = None
         if self._sock_send:
             self._sock_send.close()
+            self._sock_send = None
 
     def utilSendCommand(self, msg, errorMsg="Failed to send command ", res=False):
         msg = msg + self._eom
         if len(msg) > 256:
             raise RuntimeError("Command contains too many characters.")
         try:
+            self.utilEnsureSetup()
             self._sock_send.sendto(
                 msg.encode('UTF-8'), (self._sock_ip_send, self._sock_port_send))
             try:
@@ -84,7 +101,43 @@ class UtilConnections():
         if res:
             return data
 
+    def utilSendCommandAsync(self, msg):
+        """
+        Send without waiting for the response. Collect it with
+        utilPollResponse.
+        """
+        msg = msg + self._eom
+        if len(msg) > 256:
+            raise RuntimeError("Command contains too many characters.")
+        self.utilEnsureSetup()
+        self._sock_send.sendto(
+            msg.encode('UTF-8'), (self._sock_ip_send, self._sock_port_send))
+
+    def utilPollResponse(self):
+        """
+        Non-blocking receive. Returns the decoded message or None.
+        """
+        self.utilEnsureSetup()
+        ready, _, _ = select.select([self._sock_receive], [], [], 0)
+        if not ready:
+            return None
+        data = self._sock_receive.recvfrom(256)
+        return data[0].decode('UTF-8')
+
+    def utilDrainResponses(self):
+        """
+        Non-blocking, drop every datagram already received. Returns how
+        many were dropped.
+        """
+        self.utilEnsureSetup()
+        drained = 0
+        while select.select([self._sock_receive], [], [], 0)[0]:
+            self._sock_receive.recvfrom(256)
+            drained += 1
+        return drained
+
     def receiveMsg(self):
+        self.utilEnsureSetup()
         try:
             data = self._sock_receive.recvfrom(256)
         except socket.error:
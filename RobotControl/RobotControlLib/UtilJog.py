@@ -0,0 +1,139 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+#
+# Hold-to-jog
+#
+
+import math
+import time
+import qt
+
+from RobotControlLib.UtilFormat import utilNumStrFormat
+
+# Jog direction -> (command, axis, sign). Same conventions as the single
+# step manual adjustment.
+JOG_DIRECTIONS = {
+    "backward": ("MAN_ADJUST_T", 1, 1.0),
+    "forward": ("MAN_ADJUST_T", 1, -1.0),
+    "closer": ("MAN_ADJUST_T", 2, -1.0),
+    "farther": ("MAN_ADJUST_T", 2, 1.0),
+    "left": ("MAN_ADJUST_T", 0, 1.0),
+    "right": ("MAN_ADJUST_T", 0, -1.0),
+    "pitch": ("MAN_ADJUST_R", 0, 1.0),
+    "roll": ("MAN_ADJUST_R", 1, 1.0),
+    "yaw": ("MAN_ADJUST_R", 2, 1.0),
+}
+
+
+def utilManualAdjustCommand(commandsData, cmdKey, delta):
+    """
+    Adjustment command for a delta vector, in mm for MAN_ADJUST_T and in
+    degrees for MAN_ADJUST_R. Sent in ROS units.
+    """
+    scale = 1.0 / 1000.0 if cmdKey == "MAN_ADJUST_T" else math.pi / 180.0
+    return commandsData[cmdKey] + "".join(
+        ["_" + utilNumStrFormat(d * scale, decimal=10) for d in delta])
+
+
+class JogController():
+    """
+    Streams incremental adjustment commands while a jog button is held.
+    The motion commanded at speed (mm/s or deg/s) accumulates every tick;
+    at most one command is in flight, so what accumulates while the robot is
+    busy goes out as one merged delta. Release sends the stop command; an
+    unanswered command (lost heartbeat) sends it too and ends the jog.
+    """
+
+    def __init__(self, scheduler, commandsData, rate=20.0, heartbeatTimeout=0.5):
+        self._scheduler = scheduler
+        self._commandsData = commandsData
+        self._direction = None
+        self._speed = 0.0
+        self._pending = [0.0, 0.0, 0.0]
+        self._cmdKey = None
+        self._lastTick = None
+        self._inFlight = False
+        self._timer = qt.QTimer()
+        self._timer.connect("timeout()", self.tick)
+        self.configure(rate, heartbeatTimeout)
+
+    def configure(self, rate, heartbeatTimeout):
+        """
+        Tick rate (Hz) and heartbeat timeout (s), also while jogging
+        """
+        self._interval = 1.0 / rate
+        self._heartbeatTimeout = heartbeatTimeout
+        self._timer.setInterval(int(self._interval * 1000))
+
+    def isJogging(self):
+        return self._direction is not None
+
+    def press(self, direction, speed):
+        if direction not in JOG_DIRECTIONS:
+            raise ValueError("Unknown jog direction: " + str(direction))
+        cmdKey = JOG_DIRECTIONS[direction][0]
+        if cmdKey != self._cmdKey:
+            self._pending = [0.0, 0.0, 0.0]
+        self._direction = direction
+        self._cmdKey = cmdKey
+        self._speed = speed
+        self._lastTick = time.monotonic()
+        self._timer.start()
+
+    def release(self):
+        if self._direction is None:
+            return
+        self.utilSafetyStop()
+
+    def tick(self):
+        now = time.monotonic()
+
+        # Accumulate the motion since the last tick
+        _, axis, sign = JOG_DIRECTIONS[self._direction]
+        self._pending[axis] += sign * self._speed * (now - self._lastTick)
+        self._lastTick = now
+
+        # Send everything accumulated as one command once the robot is free
+        if not self._inFlight and any(self._pending):
+            msg = utilManualAdjustCommand(
+                self._commandsData, self._cmdKey, self._pending)
+            self._pending = [0.0, 0.0, 0.0]
+            self._inFlight = True
+            self._scheduler.submit(
+                self._cmdKey, msg, self.onAcknowledged, "jog",
+                self._heartbeatTimeout)
+
+    def onAcknowledged(self, reply, status):
+        self._inFlight = False
+        if status in ("timeout", "failed", "rejected") and self._direction is not None:
+            print("Jog: robot not responding, stopping")
+            self.utilSafetyStop()
+
+    def utilSafetyStop(self):
+        self._direction = None
+        self._pending = [0.0, 0.0, 0.0]
+        self._timer.stop()
+        # Safety class: preempts whatever jog command is still pending
+        self._scheduler.submit("MAN_ADJUST_STOP")
@@ -0,0 +1,137 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+#
+# Robot state cache
+#
+
+import re
+import time
+import qt
+
+# Cached state -> query command
+ROBOT_STATE_QUERIES = {
+    "joint_angles": "GET_JNT_ANGS",
+    "effector_pose": "GET_EFF_POSE",
+}
+
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def parseNumbers(msg):
+    """
+    All the numbers of a reply string, as a list of floats
+    """
+    return [float(n) for n in _NUMBER.findall(msg)]
+
+
+class RobotStatePoller():
+    """
+    Polls the joint angles and the end-effector pose at a fixed rate through
+    the command scheduler (query class), and keeps the last parsed values
+    with their time. A value is stale when older than staleAfter seconds or
+    when its last query went unanswered. A reply without the expected
+    number of values (lengths, per state) counts as unanswered.
+    """
+
+    def __init__(self, scheduler, rate=2.0, staleAfter=1.0, lengths=None):
+        self._scheduler = scheduler
+        self._values = {k: None for k in ROBOT_STATE_QUERIES}
+        self._times = {k: None for k in ROBOT_STATE_QUERIES}
+        self._failed = {k: False for k in ROBOT_STATE_QUERIES}
+        self.stateChanged = None
+        self._timer = qt.QTimer()
+        self._timer.connect("timeout()", self.tick)
+        self.configure(rate, staleAfter, lengths)
+
+    def configure(self, rate, staleAfter, lengths=None):
+        """
+        Poll rate (Hz), staleness (s) and expected reply lengths, also while
+        polling
+        """
+        self._staleAfter = staleAfter
+        self._lengths = lengths or {}
+        self._timer.setInterval(int(1000.0 / rate))
+
+    def start(self):
+        self._timer.start()
+        self.tick()
+
+    def stop(self):
+        self._timer.stop()
+
+    def isPolling(self):
+        return self._timer.isActive()
+
+    def request(self, kind, cmdKey=None):
+        """
+        Query one state now (cmdKey defaults to its regular query), without
+        waiting for the response
+        """
+        cmdKey = cmdKey or ROBOT_STATE_QUERIES[kind]
+        self._scheduler.submit(
+            cmdKey, callback=lambda reply, status: self.onReply(kind, reply, status))
+
+    def value(self, kind):
+        return self._values[kind]
+
+    def timestamp(self, kind):
+        return self._times[kind]
+
+    def isStale(self, kind):
+        return (
+            self._times[kind] is None
+            or self._failed[kind]
+            or time.time() - self._times[kind] > self._staleAfter
+        )
+
+    def state(self):
+        """
+        Snapshot of the cache: {kind: (values, timestamp, stale)}
+        """
+        return {
+            k: (self._values[k], self._times[k], self.isStale(k))
+            for k in ROBOT_STATE_QUERIES
+        }
+
+    def tick(self):
+        # A query still pending is superseded by the new one in the scheduler
+        for kind in ROBOT_STATE_QUERIES:
+            self.request(kind)
+
+    def onReply(self, kind, reply, status):
+        if status == "superseded":
+            # a newer query of the same state is on its way
+            return
+        values = parseNumbers(reply) if reply is not None else []
+        if not values or len(values) != self._lengths.get(kind, len(values)):
+            if reply is not None:
+                print("Unexpected " + kind + " reply: " + reply)
+            self._failed[kind] = True
+        else:
+            self._values[kind] = values
+            self._times[kind] = time.time()
+            self._failed[kind] = False
+        if self.stateChanged is not None:
+            self.stateChanged()
@@ -0,0 +1,141 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import numpy
+
+#
+# Approach trajectory preview. Numpy only, all the poses of a sweep at once.
+#
+
+
+def rotationToQuaternion(R):
+    """
+    Unit quaternion [qx, qy, qz, qw] of a 3x3 rotation matrix
+    """
+    R = numpy.asarray(R, dtype=numpy.float64)
+    trace = numpy.trace(R)
+    if trace > 0.0:
+        s = 2.0 * numpy.sqrt(trace + 1.0)
+        q = [(R[2, 1] - R[1, 2]) / s, (R[0, 2] - R[2, 0]) / s,
+             (R[1, 0] - R[0, 1]) / s, 0.25 * s]
+    else:
+        # largest diagonal element, for numerical stability
+        i = int(numpy.argmax(numpy.diagonal(R)))
+        j, k = (i + 1) % 3, (i + 2) % 3
+        s = 2.0 * numpy.sqrt(1.0 + R[i, i] - R[j, j] - R[k, k])
+        q = [0.0, 0.0, 0.0, (R[k, j] - R[j, k]) / s]
+        q[i] = 0.25 * s
+        q[j] = (R[j, i] + R[i, j]) / s
+        q[k] = (R[k, i] + R[i, k]) / s
+    q = numpy.array(q)
+    return q / numpy.linalg.norm(q)
+
+
+def quaternionToRotationBatch(q):
+    """
+    (N,3,3) rotation matrices of (N,4) unit quaternions [qx, qy, qz, qw]
+    """
+    qx, qy, qz, qw = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    R = numpy.empty((q.shape[0], 3, 3))
+    R[:, 0, 0] = 1 - 2 * (qy * qy + qz * qz)
+    R[:, 0, 1] = 2 * (qx * qy - qz * qw)
+    R[:, 0, 2] = 2 * (qx * qz + qy * qw)
+    R[:, 1, 0] = 2 * (qx * qy + qz * qw)
+    R[:, 1, 1] = 1 - 2 * (qx * qx + qz * qz)
+    R[:, 1, 2] = 2 * (qy * qz - qx * qw)
+    R[:, 2, 0] = 2 * (qx * qz - qy * qw)
+    R[:, 2, 1] = 2 * (qy * qz + qx * qw)
+    R[:, 2, 2] = 1 - 2 * (qx * qx + qy * qy)
+    return R
+
+
+def slerpBatch(q0, q1, s):
+    """
+    Spherical linear interpolation from q0 to q1 at the fractions s (N,),
+    along the shorter arc. Returns (N,4) unit quaternions.
+    """
+    q0 = numpy.asarray(q0, dtype=numpy.float64)
+    q1 = numpy.asarray(q1, dtype=numpy.float64)
+    s = numpy.asarray(s, dtype=numpy.float64)[:, None]
+    dot = float(numpy.dot(q0, q1))
+    if dot < 0.0:
+        q1, dot = -q1, -dot
+    if dot > 0.9995:
+        # nearly the same orientation, linear interpolation is exact enough
+        q = (1.0 - s) * q0 + s * q1
+    else:
+        theta = numpy.arccos(dot)
+        q = (numpy.sin((1.0 - s) * theta) * q0 + numpy.sin(s * theta) * q1) \
+            / numpy.sin(theta)
+    return q / numpy.linalg.norm(q, axis=1, keepdims=True)
+
+
+def interpolatePoses(T0, T1, stepTranslation=1.0, stepRotation=2.0, maxSamples=500):
+    """
+    Poses (N,4,4) from T0 to T1: SLERP for the rotation and linear for the
+    translation. N is set by the finer of the two resolutions (mm and
+    degrees per step), at least 2 and at most maxSamples.
+    """
+    T0 = numpy.asarray(T0, dtype=numpy.float64)
+    T1 = numpy.asarray(T1, dtype=numpy.float64)
+    q0 = rotationToQuaternion(T0[:3, :3])
+    q1 = rotationToQuaternion(T1[:3, :3])
+    angle = numpy.degrees(2.0 * numpy.arccos(min(abs(float(numpy.dot(q0, q1))), 1.0)))
+    distance = numpy.linalg.norm(T1[:3, 3] - T0[:3, 3])
+    num = int(numpy.ceil(max(distance / stepTranslation, angle / stepRotation))) + 1
+    num = min(max(num, 2), maxSamples)
+
+    s = numpy.linspace(0.0, 1.0, num)
+    poses = numpy.zeros((num, 4, 4))
+    poses[:, :3, :3] = quaternionToRotationBatch(slerpBatch(q0, q1, s))
+    poses[:, :3, 3] = (1.0 - s)[:, None] * T0[:3, 3] + s[:, None] * T1[:3, 3]
+    poses[:, 3, 3] = 1.0
+    return poses
+
+
+def coilSweepPoints(poses, coilRadius, numRingPoints=8):
+    """
+    Points standing for the coil at each pose: its center and a ring of
+    radius coilRadius in the coil plane (x-y of the pose). Returns
+    (N, numRingPoints + 1, 3).
+    """
+    angles = numpy.linspace(0.0, 2.0 * numpy.pi, numRingPoints, endpoint=False)
+    local = numpy.zeros((numRingPoints + 1, 3))
+    local[1:, 0] = coilRadius * numpy.cos(angles)
+    local[1:, 1] = coilRadius * numpy.sin(angles)
+    return numpy.einsum("nij,kj->nki", poses[:, :3, :3], local) \
+        + poses[:, None, :3, 3]
+
+
+def computeClearance(poses, surfaceDistances, coilRadius, numRingPoints=8):
+    """
+    Clearance of the coil to the surface at each pose, the smallest distance
+    of its sweep points. surfaceDistances maps points (M,3) to their signed
+    distances (M,) to the surface, negative inside, and is called once for
+    the whole sweep. A negative clearance is a penetration.
+    Returns (N,).
+    """
+    sweep = coilSweepPoints(poses, coilRadius, numRingPoints)
+    distances = surfaceDistances(sweep.reshape((-1, 3)))
+    return numpy.asarray(distances).reshape(sweep.shape[:2]).min(axis=1)
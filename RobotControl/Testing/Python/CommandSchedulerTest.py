@@ -0,0 +1,125 @@
+import os
+import sys
+import types
+import unittest
+
+# The scheduler logic is pure Python; outside Slicer only its timer needs qt
+try:
+    import qt  # noqa: F401
+except ImportError:
+    class _Timer():
+        def setInterval(self, interval):
+            pass
+
+        def connect(self, signal, slot):
+            pass
+
+        def start(self):
+            pass
+
+        def stop(self):
+            pass
+
+    sys.modules["qt"] = types.SimpleNamespace(QTimer=_Timer)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from RobotControlLib.UtilCommandScheduler import CommandScheduler
+
+
+class FakeConnections():
+    """
+    Records the sent commands and hands out queued replies
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.replies = []
+
+    def utilSendCommandAsync(self, msg):
+        self.sent.append(msg)
+
+    def utilPollResponse(self):
+        return self.replies.pop(0) if self.replies else None
+
+    def utilDrainResponses(self):
+        drained = len(self.replies)
+        self.replies = []
+        return drained
+
+
+class CommandSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connections = FakeConnections()
+        commandsData = {
+            "EXECUTE_MOTION": "execute_motion",
+            "MAN_ADJUST_STOP": "man_adjust_stop",
+            "GET_JNT_ANGS": "get_jnt_angs",
+        }
+        self.scheduler = CommandScheduler(self.connections, commandsData, timeout=10.0)
+
+    def test_safetyPreemptsInFlightMotion(self):
+        calls = []
+        self.scheduler.submit(
+            "EXECUTE_MOTION", callback=lambda reply, status: calls.append(("motion", status)))
+        self.assertEqual(self.connections.sent, ["execute_motion"])
+
+        self.scheduler.submit(
+            "MAN_ADJUST_STOP", callback=lambda reply, status: calls.append(("stop", status)))
+        self.assertEqual(self.connections.sent, ["execute_motion", "man_adjust_stop"])
+        self.assertEqual(calls, [("motion", "preempted")])
+        self.assertEqual(self.scheduler.depth(), 0)
+
+        # the late acknowledgement of the preempted motion comes first
+        self.connections.replies.append("motion done")
+        self.scheduler.tick()
+        self.assertEqual(calls, [("motion", "preempted")])
+        self.connections.replies.append("stopped")
+        self.scheduler.tick()
+        self.assertEqual(calls, [("motion", "preempted"), ("stop", "ok")])
+        self.assertTrue(self.scheduler.isIdle())
+        self.assertEqual(self.connections.sent, ["execute_motion", "man_adjust_stop"])
+
+    def test_queryWaitsForInFlightCommand(self):
+        calls = []
+        self.scheduler.submit(
+            "EXECUTE_MOTION", callback=lambda reply, status: calls.append(("motion", status)))
+        self.scheduler.submit(
+            "GET_JNT_ANGS", callback=lambda reply, status: calls.append(("query", status)))
+        self.assertEqual(self.connections.sent, ["execute_motion"])
+
+        self.connections.replies.append("done")
+        self.scheduler.tick()
+        self.assertEqual(calls, [("motion", "ok")])
+        self.assertEqual(self.connections.sent, ["execute_motion", "get_jnt_angs"])
+
+    def test_queryReplyIsTheDataDatagram(self):
+        calls = []
+        self.scheduler.submit(
+            "GET_JNT_ANGS", callback=lambda reply, status: calls.append((reply, status)))
+        self.connections.replies.append("ack")
+        self.scheduler.tick()
+        self.assertEqual(calls, [])
+        self.connections.replies.append("0.1 0.2 0.3")
+        self.scheduler.tick()
+        self.assertEqual(calls, [("0.1 0.2 0.3", "ok")])
+
+    def test_lateReplyAfterTimeoutIsSkipped(self):
+        calls = []
+        self.scheduler.submit(
+            "EXECUTE_MOTION", callback=lambda reply, status: calls.append(("motion", reply, status)),
+            timeout=0.0)
+        self.scheduler.tick()
+        self.assertEqual(calls, [("motion", None, "timeout")])
+
+        self.scheduler.submit(
+            "GET_JNT_ANGS", callback=lambda reply, status: calls.append(("query", reply, status)))
+        for reply in ("motion done", "ack", "0.1 0.2 0.3"):
+            self.connections.replies.append(reply)
+            self.scheduler.tick()
+        self.assertEqual(calls[1:], [("query", "0.1 0.2 0.3", "ok")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,9 +22,15 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+from TargetVisualizationLib.UtilStartupTiming import startupTiming
+
+# cost of the imports below, reported once Slicer has started
+startupTiming("TargetVisualization").restart()
+
 import os
 import json
 import logging
+import time
 
 import vtk
 import qt
@@ -36,8 +42,17 @@ from slicer.util import VTKObservationMixin
 from TargetVisualizationLib.UtilConnections import UtilConnections
 from TargetVisualizationLib.UtilSlicerFuncs import setTransform
 from TargetVisualizationLib.UtilSlicerFuncs import setColorByDistance
+from TargetVisualizationLib.UtilSlicerFuncs import loadIndicatorModel
+from TargetVisualizationLib.UtilSlicerFuncs import preloadIndicatorModel
 from TargetVisualizationLib.UtilConnectionsWtNnBlcRcv import UtilConnectionsWtNnBlcRcv
 from TargetVisualizationLib.UtilCalculations import quat2mat
+from TargetVisualizationLib.UtilPoseLog import PoseRingLog
+from TargetVisualizationLib.UtilTrail import CoilTrail
+from TargetVisualizationLib.UtilTrackingError import TrackingErrorStats
+from TargetVisualizationLib.UtilNodeReferences import NodeReferenceCache
+from TargetVisualizationLib.UtilConfig import ConfigService
+
+startupTiming("TargetVisualization").mark("import")
 
 #
 # TargetVisualization
@@ -50,6 +65,7 @@ class TargetVisualization(ScriptedLoadableModule):
     """
 
     def __init__(self, parent):
+        startupTiming("TargetVisualization").restart()
         ScriptedLoadableModule.__init__(self, parent)
         self.parent.title = "Target Visualization"
         self.parent.categories = ["RoTMS"]
@@ -69,10 +85,12 @@ and Steve Pieper, Isomics, Inc. and was partially funded by NIH grant 3P41RR0132
 
         # Additional initialization step after application startup is complete
         slicer.app.connect("startupCompleted()", appStartUpPostAction)
+        startupTiming("TargetVisualization").mark("module")
 
 
 def appStartUpPostAction():
-    return
+    # the pose indicator model is only read when the module is entered
+    startupTiming("TargetVisualization").report("launch")
 
 #
 # TargetVisualizationWidget
@@ -94,11 +112,13 @@ class TargetVisualizationWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         self.logic = None
         self._parameterNode = None
         self._updatingGUIFromParameterNode = False
+        self._indicatorModelPreloaded = False
 
     def setup(self):
         """
         Called when the user opens the module the first time and the widget is initialized.
         """
+        startupTiming("TargetVisualization").restart()
         ScriptedLoadableModuleWidget.setup(self)
 
         # Load widget from .ui file (created by Qt Designer).
@@ -112,10 +132,12 @@ class TargetVisualizationWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         # "mrmlSceneChanged(vtkMRMLScene*)" signal in is connected to each MRML widget's.
         # "setMRMLScene(vtkMRMLScene*)" slot.
         uiWidget.setMRMLScene(slicer.mrmlScene)
+        startupTiming("TargetVisualization").mark("ui")
 
         # Create logic class. Logic implements all computations that should be possible to run
         # in batch mode, without a graphical user interface.
         self.logic = TargetVisualizationLogic(self.resourcePath('Configs/'))
+        startupTiming("TargetVisualization").mark("logic")
 
         # Connections
 
@@ -130,6 +152,10 @@ class TargetVisualizationWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         # self.ui.selectorModel.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
         self.ui.sliderColorThresh.connect(
             "valueChanged(double)", self.updateParameterNodeFromGUI)
+        self.ui.checkShowTrail.connect(
+            "toggled(bool)", self.onCheckShowTrail)
+        self.ui.pathPoseLogDir.connect(
+            "currentPathChanged(QString)", self.updateParameterNodeFromGUI)
 
         # Buttons
         self.ui.pushModuleRobCtrl.connect(
@@ -146,15 +172,22 @@ class TargetVisualizationWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
             'clicked(bool)', self.onPushSavePlanAndRealPose)
         self.ui.pushSaveContinuousPose.connect(
             'clicked(bool)', self.onPushSaveContinuousPose)
+        self.ui.checkPoseLog.connect('toggled(bool)', self.onCheckPoseLog)
+        self.logic._connections.trackingErrorChanged = self.updateTrackingErrorLabel
 
         # Make sure parameter node is initialized (needed for module reload)
         self.initializeParameterNode()
+        startupTiming("TargetVisualization").mark("widget")
+        startupTiming("TargetVisualization").report("setup")
 
     def cleanup(self):
         """
         Called when the application closes and the module widget is destroyed.
         """
         self.removeObservers()
+        self.logic._connections.trackingErrorChanged = None
+        self.logic.processStopPoseLog()
+        self.logic._connections._nodes.release()
         self.logic._connections.clear()
 
     def enter(self):
@@ -163,6 +196,11 @@ class TargetVisualizationWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         """
         # Make sure parameter node exists and observed
         self.initializeParameterNode()
+        # read the pose indicator model in idle time after the first entry, so
+        # that starting the visualization does not wait for it
+        if not self._indicatorModelPreloaded:
+            self._indicatorModelPreloaded = True
+            qt.QTimer.singleShot(0, self.logic.utilPreloadIndicatorModel)
 
     def exit(self):
         """
@@ -234,6 +272,12 @@ class TargetVisualizationWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         # Update node selectors and sliders
         self.ui.sliderColorThresh.value = float(
             self._parameterNode.GetParameter("ColorChangeThresh"))
+        self.ui.checkShowTrail.checked = (
+            self._parameterNode.GetParameter("ShowTrail") == "true")
+        self.ui.pathPoseLogDir.currentPath = \
+            self._parameterNode.GetParameter("PoseLogDirectory")
+        self.ui.checkPoseLog.checked = (
+            self._parameterNode.GetParameter("PoseLogging") == "true")
 
         # Update buttons states and tooltips
         if self._parameterNode.GetParameter("Visualizing") == "true":
@@ -268,6 +312,10 @@ class TargetVisualizationWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
 
         self._parameterNode.SetParameter(
             "ColorChangeThresh", str(self.ui.sliderColorThresh.value))
+        self._parameterNode.SetParameter(
+            "ShowTrail", "true" if self.ui.checkShowTrail.checked else "false")
+        self._parameterNode.SetParameter(
+            "PoseLogDirectory", self.ui.pathPoseLogDir.currentPath.strip())
 
         self._parameterNode.EndModify(wasModified)
 
@@ -309,6 +357,31 @@ class TargetVisualizationWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         except:
             return
 
+    def updateTrackingErrorLabel(self):
+        current, stats = self.logic.getTrackingError()
+        self.ui.labelTrackingError.text = \
+            "Error: {:.1f} mm, twist {:.1f} deg, tilt {:.1f} deg\n".format(*current) + \
+            "Window mean / RMS / max: {:.1f} / {:.1f} / {:.1f} mm, ".format(
+                *[stats["translation"][k] for k in ("mean", "rms", "max")]) + \
+            "within tolerance {:.0f}%".format(100.0 * stats["within"])
+
+    def onCheckShowTrail(self, checked):
+        self.updateParameterNodeFromGUI()
+        if self._parameterNode.GetParameter("Visualizing") == "true":
+            self.logic.utilSetupTrail()
+
+    def onCheckPoseLog(self, checked):
+        if self._updatingGUIFromParameterNode:
+            return
+        if checked:
+            if not self._parameterNode.GetParameter("PoseLogDirectory"):
+                slicer.util.errorDisplay("Please select a pose log directory first!")
+                self.ui.checkPoseLog.checked = False
+                return
+            self.logic.processStartPoseLog()
+        else:
+            self.logic.processStopPoseLog()
+
 
 #
 # TargetVisualizationLogic
@@ -330,13 +403,28 @@ class TargetVisualizationLogic(ScriptedLoadableModuleLogic):
         """
         ScriptedLoadableModuleLogic.__init__(self)
         self._configPath = configPath
-        self._connections = TargetVizConnections(configPath, "TARGETVIZ")
-        self._connections.setup()
+        # parsed and validated once, reloaded when the file changes
+        self._config = ConfigService(configPath)
+        self._connections = TargetVizConnections(configPath, "TARGETVIZ", self._config)
+        self._config.configChanged = self.utilApplyConfig
         self._parameterNode = self.getParameterNode()
 
         with open(self._configPath+"CommandsConfig.json") as f:
             self._commandsData = (json.load(f))["TargetVizCmd"]
 
+    def utilPreloadIndicatorModel(self):
+        # Only a warm-up: whatever fails here is done again, and reported,
+        # when the visualization is started
+        timing = startupTiming("TargetVisualization")
+        timing.restart()
+        try:
+            preloadIndicatorModel(self._config.path("POSE_INDICATOR_MODEL"))
+        except Exception as e:
+            logging.warning(
+                "TargetVisualization indicator model preloading failed: " + str(e))
+        timing.mark("indicator model")
+        timing.report("background")
+
     def setDefaultParameters(self, parameterNode):
         """
         Initialize parameter node with default settings.
@@ -345,6 +433,12 @@ class TargetVisualizationLogic(ScriptedLoadableModuleLogic):
             parameterNode.SetParameter("ColorChangeThresh", "20.0")
         if not parameterNode.GetParameter("Visualizing"):
             parameterNode.SetParameter("Visualizing", "false")
+        if not parameterNode.GetParameter("ShowTrail"):
+            parameterNode.SetParameter("ShowTrail", "false")
+        if not parameterNode.GetParameter("PoseLogDirectory"):
+            parameterNode.SetParameter("PoseLogDirectory", "")
+        # a log does not survive a module reload
+        parameterNode.SetParameter("PoseLogging", "false")
 
     def processStartTargetViz(self):
         """
@@ -352,18 +446,20 @@ class TargetVisualizationLogic(ScriptedLoadableModuleLogic):
         """
         self._parameterNode = self.getParameterNode()
         self._connections._parameterNode = self.getParameterNode()
+        self._connections._nodes.setParameterNode(self._parameterNode)
+        # the sockets are opened the first time the visualization starts
+        self._connections.utilEnsureSetup()
 
         if not self._parameterNode.GetNodeReference("CurrentPoseTransform"):
             transformNode = slicer.vtkMRMLTransformNode()
+            # so that RobotControl can preview the approach from it
+            transformNode.SetSingletonTag("TargetVisualization.CurrentPoseTransform")
             slicer.mrmlScene.AddNode(transformNode)
             self._parameterNode.SetNodeReferenceID(
                 "CurrentPoseTransform", transformNode.GetID())
 
         if not self._parameterNode.GetNodeReference("CurrentPoseIndicator"):
-            with open(self._configPath+"Config.json") as f:
-                configData = json.load(f)
-            inputModel = slicer.util.loadModel(
-                self._configPath+configData["POSE_INDICATOR_MODEL"])
+            inputModel = loadIndicatorModel(self._config.path("POSE_INDICATOR_MODEL"))
             self._parameterNode.SetNodeReferenceID(
                 "CurrentPoseIndicator", inputModel.GetID())
 
@@ -386,6 +482,9 @@ class TargetVisualizationLogic(ScriptedLoadableModuleLogic):
         self._connections._colorchangethresh = float(
             self._parameterNode.GetParameter("ColorChangeThresh"))
 
+        self.utilSetupTrail()
+        self._connections._trackingError.reset()
+
         self._connections._flag_receiving_nnblc = True
         self._connections.receiveTimerCallBack()
 
@@ -393,6 +492,61 @@ class TargetVisualizationLogic(ScriptedLoadableModuleLogic):
 
         self._connections._flag_receiving_nnblc = False
 
+    def utilSetupTrail(self):
+        """
+        Show or hide the coil trail model, which is created once and then
+        only updated in place
+        """
+        showTrail = self._parameterNode.GetParameter("ShowTrail") == "true"
+        if showTrail and not self._parameterNode.GetNodeReference("CoilTrail"):
+            trailModel = slicer.modules.models.logic().AddModel(
+                self._connections._coilTrail.polyData())
+            trailModel.SetName("CoilTrail")
+            trailModel.GetDisplayNode().SetColor(1.0, 1.0, 0.0)
+            trailModel.GetDisplayNode().SetLineWidth(2.0)
+            self._parameterNode.SetNodeReferenceID("CoilTrail", trailModel.GetID())
+        trailModel = self._parameterNode.GetNodeReference("CoilTrail")
+        if trailModel:
+            trailModel.GetDisplayNode().SetVisibility(showTrail)
+        self._connections._coilTrail.reset()
+        self._connections._showTrail = showTrail
+
+    def getTrackingError(self):
+        """
+        Errors of the last pose to the planned pose (translation in mm, twist
+        and tilt in degrees) and the statistics over the rolling window
+        """
+        trackingError = self._connections._trackingError
+        return trackingError.current(), trackingError.statistics()
+
+    def utilApplyConfig(self):
+        """
+        Take the pose log, trail, tracking and render settings of Config.json
+        again, called when the file changes and before a pose log starts
+        """
+        coilTrail = self._connections._coilTrail
+        self._connections.utilApplyConfig()
+        if self._connections._coilTrail is not coilTrail:
+            trailModel = self.getParameterNode().GetNodeReference("CoilTrail")
+            if trailModel:
+                trailModel.SetAndObservePolyData(self._connections._coilTrail.polyData())
+
+    def processStartPoseLog(self):
+        """
+        Log the received poses locally, in chunks under PoseLogDirectory
+        """
+        self._parameterNode = self.getParameterNode()
+        # settings changed while the previous log was running
+        self.utilApplyConfig()
+        prefix = self._connections._poseLog.start(
+            self._parameterNode.GetParameter("PoseLogDirectory"))
+        self._parameterNode.SetParameter("PoseLogging", "true")
+        print("Logging poses to " + prefix + "_*.npz")
+
+    def processStopPoseLog(self):
+        self._connections._poseLog.stop()
+        self.getParameterNode().SetParameter("PoseLogging", "false")
+
 #
 # Use UtilConnectionsWtNnBlcRcv and override the data handler
 #
@@ -400,11 +554,51 @@ class TargetVisualizationLogic(ScriptedLoadableModuleLogic):
 
 class TargetVizConnections(UtilConnectionsWtNnBlcRcv):
 
-    def __init__(self, configPath, modulesufx):
+    def __init__(self, configPath, modulesufx, config):
         super().__init__(configPath, modulesufx)
         self._transformMatrixCurrentPose = None
         self._transformNodeTargetPoseSingleton = None
         self._currentPoseIndicator = None
+        self._quatCurrentPose = None
+        self._nodes = NodeReferenceCache()
+        self._config = config
+        self._poseLog = None
+        self._poseLogSettings = None
+        self._coilTrail = None
+        self._trailSettings = None
+        self._showTrail = False
+        self._trackingError = None
+        self._trackingSettings = None
+        self.trackingErrorChanged = None
+        self._lastRender = 0.0
+        self.utilApplyConfig()
+
+    def utilApplyConfig(self):
+        """
+        Recreate the pose log, trail and tracking statistics whose settings
+        changed in the validated config. A running pose log keeps its
+        settings until it is started again.
+        """
+        config = self._config
+        poseLogSettings = (config["POSE_LOG_CAPACITY"], config["POSE_LOG_CHUNK_SIZE"])
+        if poseLogSettings != self._poseLogSettings and not (
+                self._poseLog and self._poseLog.isLogging()):
+            self._poseLog = PoseRingLog(*poseLogSettings)
+            self._poseLogSettings = poseLogSettings
+        trailSettings = (
+            config["TRAIL_LENGTH"], config["TRAIL_AXIS_LENGTH"], config["TRAIL_AXIS_STRIDE"])
+        if trailSettings != self._trailSettings:
+            self._coilTrail = CoilTrail(*trailSettings)
+            self._trailSettings = trailSettings
+        trackingSettings = (
+            config["TRACKING_WINDOW"], config["TRACKING_TOL_TRANSLATION"],
+            config["TRACKING_TOL_ANGLE"])
+        if trackingSettings != self._trackingSettings:
+            self._trackingError = TrackingErrorStats(*trackingSettings)
+            self._trackingSettings = trackingSettings
+        # the scene is rendered at most RENDER_MAX_FPS times per second,
+        # however fast the poses come in
+        self._renderInterval = 1.0 / config["RENDER_MAX_FPS"]
 
     def setup(self):
         super().setup()
@@ -431,6 +625,7 @@ class TargetVizConnections(UtilConnectionsWtNnBlcRcv):
         for i in num_str:
             num.append(float(i))
         p = num[0:3]
+        self._quatCurrentPose = num[3:]
         mat = quat2mat(num[3:])
         return mat, p
 
@@ -440,14 +635,30 @@ class TargetVizConnections(UtilConnectionsWtNnBlcRcv):
         """
 
         setTransform(mat, p, self._transformMatrixCurrentPose)
-        self._parameterNode.GetNodeReference(
+        self._nodes.get(
             "CurrentPoseTransform").SetMatrixTransformToParent(self._transformMatrixCurrentPose)
 
+        targetTransform = None
+        errors = None
         if self._transformNodeTargetPoseSingleton:
 
             targetTransform = \
                 self._transformNodeTargetPoseSingleton.GetMatrixTransformToParent()
             setColorByDistance(
                 self._currentPoseIndicator, targetTransform, self._transformMatrixCurrentPose, self._colorchangethresh)
-
-        slicer.app.processEvents()
+            errors = self._trackingError.update(mat, p, targetTransform)
+
+        if self._poseLog.isLogging():
+            self._poseLog.append(p, self._quatCurrentPose, targetTransform, errors)
+
+        if self._showTrail:
+            self._coilTrail.append(p, [mat[0][2], mat[1][2], mat[2][2]])
+
+        now = time.monotonic()
+        if now - self._lastRender >= self._renderInterval:
+            self._lastRender = now
+            if self._showTrail:
+                self._coilTrail.markModified()
+            if errors is not None and self.trackingErrorChanged:
+                self.trackingErrorChanged()
+            slicer.app.processEvents()
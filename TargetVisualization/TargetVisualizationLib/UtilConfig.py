@@ -0,0 +1,158 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, json, logging
+import qt
+
+#
+# Module configuration
+#
+
+# Config.json keys and their types
+CONFIG_SCHEMA = {
+    "IP_RECEIVE_TARGETVIZ":           str,
+    "IP_SEND_TARGETVIZ":              str,
+    "PORT_RECEIVE_TARGETVIZ":         int,
+    "PORT_SEND_TARGETVIZ":            int,
+    "POSE_INDICATOR_MODEL":           str,
+    "IP_RECEIVE_NNBLC_TARGETVIZ":     str,
+    "PORT_RECEIVE_NNBLC_TARGETVIZ":   int,
+    "EOM_TARGETVIZ":                  str,
+    "POSE_LOG_CAPACITY":              int,
+    "POSE_LOG_CHUNK_SIZE":            int,
+    "TRAIL_LENGTH":                   int,
+    "TRAIL_AXIS_LENGTH":              float,
+    "TRAIL_AXIS_STRIDE":              int,
+    "RENDER_MAX_FPS":                 float,
+    "TRACKING_WINDOW":                int,
+    "TRACKING_TOL_TRANSLATION":       float,
+    "TRACKING_TOL_ANGLE":             float,
+}
+
+# Bounds (inclusive, None for unbounded) of the numeric Config.json values
+CONFIG_RANGES = {
+    "PORT_RECEIVE_TARGETVIZ":       (1, 65535),
+    "PORT_SEND_TARGETVIZ":          (1, 65535),
+    "PORT_RECEIVE_NNBLC_TARGETVIZ": (1, 65535),
+    "POSE_LOG_CAPACITY":            (1, None),
+    "POSE_LOG_CHUNK_SIZE":          (1, None),
+    "TRAIL_LENGTH":                 (2, None),
+    "TRAIL_AXIS_LENGTH":            (0.0, None),
+    "TRAIL_AXIS_STRIDE":            (1, None),
+    "RENDER_MAX_FPS":               (0.1, None),
+    "TRACKING_WINDOW":              (1, None),
+    "TRACKING_TOL_TRANSLATION":     (0.0, None),
+    "TRACKING_TOL_ANGLE":           (0.0, None),
+}
+
+
+def validateConfig(data, schema, name="Config.json", ranges=None):
+    """
+    Check data against schema (key -> type) and ranges (key -> (minimum,
+    maximum)), and return a copy with the values converted to the schema
+    types. Integers are accepted for floats.
+    Raises ValueError listing all the problems.
+    """
+    problems = []
+    res = dict(data)
+    for key, kind in schema.items():
+        if key not in data:
+            problems.append(key + " is missing")
+            continue
+        value = data[key]
+        if isinstance(value, bool) or not isinstance(
+            value, (int, float) if kind is float else kind
+        ):
+            problems.append(key + " should be " + kind.__name__)
+            continue
+        res[key] = kind(value)
+        minimum, maximum = (ranges or {}).get(key, (None, None))
+        if (minimum is not None and res[key] < minimum) or (
+            maximum is not None and res[key] > maximum
+        ):
+            problems.append(
+                key + " should be in [" + str(minimum) + ", "
+                + (str(maximum) if maximum is not None else "inf") + "]"
+            )
+    if problems:
+        raise ValueError("Invalid " + name + ": " + ", ".join(problems))
+    return res
+
+
+class ConfigService():
+    """
+    Config.json of a module, parsed and validated once. The file is
+    watched and reloaded only when it changes; an invalid new version is
+    reported and the previous one kept; configChanged is then called so
+    that the logic takes the new values. Values that are only used at
+    startup (ports, worker count) still need a module reload.
+    """
+
+    def __init__(self, configPath, schema=CONFIG_SCHEMA, fileName="Config.json",
+                 ranges=CONFIG_RANGES):
+        self._configPath = configPath
+        self._fileName = fileName
+        self._schema = schema
+        self._ranges = ranges
+        self._data = self.utilLoad()
+        self.configChanged = None
+        self._watcher = qt.QFileSystemWatcher()
+        self._watcher.addPath(configPath + fileName)
+        self._watcher.connect("fileChanged(QString)", self.onFileChanged)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def path(self, key):
+        """
+        Path of a resource file named by key, relative to the config folder
+        """
+        return self._configPath + self._data[key]
+
+    def onFileChanged(self, path):
+        if not os.path.exists(path):
+            # saved by replacing the file, wait for the new one
+            qt.QTimer.singleShot(200, lambda: self.onFileChanged(path))
+            return
+        if path not in self._watcher.files():
+            self._watcher.addPath(path)
+        try:
+            data = self.utilLoad()
+        except (OSError, ValueError) as e:
+            logging.error("Configuration not reloaded: " + str(e))
+            return
+        if data == self._data:
+            return
+        self._data = data
+        logging.info("Configuration reloaded from " + path)
+        if self.configChanged:
+            self.configChanged()
+
+    def utilLoad(self):
+        with open(self._configPath + self._fileName) as f:
+            return validateConfig(
+                json.load(f), self._schema, self._fileName, self._ranges)
@@ -0,0 +1,185 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, glob, time, logging
+import concurrent.futures
+import numpy
+
+#
+# Local pose log
+#
+
+
+class PoseRingLog():
+    """
+    Log of the received coil poses, of the planned target at that time and
+    of the tracking errors (translation, twist, tilt) to it, held
+    column-wise in a preallocated ring buffer. Every chunkSize samples the
+    chunk is copied out and written to <prefix>_<chunk>.npz by a background
+    thread, so that append() only does a few array stores.
+    The ring keeps the last capacity samples for recent().
+    """
+
+    def __init__(self, capacity=65536, chunkSize=4096):
+        # whole chunks only, so that a chunk never wraps around the ring
+        self._chunkSize = chunkSize
+        self._capacity = max(1, capacity // chunkSize) * chunkSize
+        self._times = numpy.zeros(self._capacity)
+        self._positions = numpy.zeros((self._capacity, 3))
+        self._quaternions = numpy.zeros((self._capacity, 4))
+        self._targetIds = numpy.full(self._capacity, -1, dtype=numpy.int32)
+        self._errors = numpy.full((self._capacity, 3), numpy.nan)
+        # distinct planned targets seen so far, 4x4 each
+        self._targets = []
+        self._targetMatrix = None
+        self._targetMTime = None
+        self._count = 0
+        self._flushed = 0
+        self._numChunks = 0
+        self._prefix = None
+        self._executor = None
+        self._writes = []
+
+    def isLogging(self):
+        return self._prefix is not None
+
+    def start(self, directory):
+        """
+        Start a new log in directory. Returns the file prefix.
+        """
+        if self.isLogging():
+            self.stop()
+        self._count = 0
+        self._flushed = 0
+        self._numChunks = 0
+        self._targets = []
+        self._targetMatrix = None
+        self._targetMTime = None
+        self._prefix = os.path.join(
+            directory, "pose_log_" + time.strftime("%Y%m%d_%H%M%S"))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # spawn the writer thread now, not on the first chunk
+        self._executor.submit(int)
+        return self._prefix
+
+    def stop(self):
+        """
+        Write what is left and wait for the pending writes
+        """
+        if not self.isLogging():
+            return
+        if self._count > self._flushed:
+            self.utilFlush()
+        self._executor.shutdown(wait=True)
+        self.utilCheckWrites()
+        self._executor = None
+        self._prefix = None
+
+    def append(self, p, q, target=None, errors=None):
+        """
+        Add one sample: position p, quaternion q [qx, qy, qz, qw], the
+        planned target (vtkMatrix4x4 or None) and the tracking errors
+        """
+        i = self._count % self._capacity
+        self._times[i] = time.time()
+        self._positions[i] = p
+        self._quaternions[i] = q
+        self._targetIds[i] = -1 if target is None else self.utilTargetId(target)
+        self._errors[i] = numpy.nan if errors is None else errors
+        self._count += 1
+        if self._count - self._flushed >= self._chunkSize:
+            self.utilFlush()
+
+    def __len__(self):
+        return self._count
+
+    def recent(self, num):
+        """
+        Last num samples (at most capacity), oldest first:
+        times, positions, quaternions
+        """
+        num = min(num, self._count, self._capacity)
+        ids = numpy.arange(self._count - num, self._count) % self._capacity
+        return self._times[ids], self._positions[ids], self._quaternions[ids]
+
+    def utilTargetId(self, target):
+        # the target only changes when replanned, a new matrix or MTime
+        mtime = target.GetMTime()
+        if target is not self._targetMatrix or mtime != self._targetMTime:
+            self._targets.append(numpy.array(
+                [[target.GetElement(r, c) for c in range(4)] for r in range(4)]))
+            self._targetMatrix = target
+            self._targetMTime = mtime
+        return len(self._targets) - 1
+
+    def utilFlush(self):
+        start = self._flushed % self._capacity
+        stop = start + (self._count - self._flushed)
+        chunk = dict(
+            times=self._times[start:stop].copy(),
+            positions=self._positions[start:stop].copy(),
+            quaternions=self._quaternions[start:stop].copy(),
+            target_ids=self._targetIds[start:stop].copy(),
+            errors=self._errors[start:stop].copy(),
+            targets=numpy.array(self._targets).reshape((-1, 4, 4)),
+        )
+        path = "{}_{:05d}.npz".format(self._prefix, self._numChunks)
+        # uncompressed: compressing in the writer holds the GIL long enough
+        # to stall the pose stream
+        self._writes.append(self._executor.submit(numpy.savez, path, **chunk))
+        self._flushed = self._count
+        self._numChunks += 1
+        self.utilCheckWrites()
+
+    def utilCheckWrites(self):
+        pending = []
+        for future in self._writes:
+            if not future.done():
+                pending.append(future)
+            elif future.exception() is not None:
+                logging.error("Failed to write pose log: " + str(future.exception()))
+        self._writes = pending
+
+
+def loadPoseLog(prefix):
+    """
+    Concatenate the chunks of a pose log. Returns a dict of times,
+    positions, quaternions, targets (per sample 4x4, NaN if none) and
+    errors (translation, twist, tilt, NaN if no target).
+    """
+    paths = sorted(glob.glob(glob.escape(prefix) + "_[0-9][0-9][0-9][0-9][0-9].npz"))
+    res = {"times": [], "positions": [], "quaternions": [], "targets": [], "errors": []}
+    for path in paths:
+        with numpy.load(path) as data:
+            for name in ("times", "positions", "quaternions", "errors"):
+                res[name].append(data[name])
+            targets = numpy.full((data["target_ids"].shape[0], 4, 4), numpy.nan)
+            known = data["target_ids"] >= 0
+            targets[known] = data["targets"][data["target_ids"][known]]
+            res["targets"].append(targets)
+    for name, shape in (("times", (0,)), ("positions", (0, 3)),
+                        ("quaternions", (0, 4)), ("targets", (0, 4, 4)),
+                        ("errors", (0, 3))):
+        res[name] = numpy.concatenate(res[name]) if res[name] else numpy.zeros(shape)
+    return res
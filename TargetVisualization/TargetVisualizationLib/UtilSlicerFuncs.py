@@ -21,7 +21,9 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+import os
 import math
+import slicer
 
 def setTransform(rotm, p, T):
     T.SetElement(0,0,rotm[0][0])
@@ -37,6 +39,36 @@ def setTransform(rotm, p, T):
     T.SetElement(1,3,p[1])
     T.SetElement(2,3,p[2])
 
+# Indicator STL path -> polydata, loaded once per process
+_indicatorTemplates = {}
+
+def preloadIndicatorModel(path):
+    """
+    Polydata of the indicator STL at path, read on the first call only
+    (with the same coordinate handling as slicer.util.loadModel)
+    """
+    key = os.path.abspath(path)
+    polyData = _indicatorTemplates.get(key)
+    if polyData is None:
+        templateNode = slicer.util.loadModel(path)
+        polyData = templateNode.GetPolyData()
+        storageNode = templateNode.GetStorageNode()
+        slicer.mrmlScene.RemoveNode(templateNode)
+        if storageNode:
+            slicer.mrmlScene.RemoveNode(storageNode)
+        _indicatorTemplates[key] = polyData
+    return polyData
+
+def loadIndicatorModel(path):
+    """
+    New model node of the indicator STL at path. All the nodes of an
+    indicator share its polydata, which is never modified since
+    indicators are only moved by their parent transforms.
+    """
+    modelNode = slicer.modules.models.logic().AddModel(preloadIndicatorModel(path))
+    modelNode.SetName(os.path.splitext(os.path.basename(path))[0])
+    return modelNode
+
 def setColorByDistance( \
     currentPoseIndicator, targetTransform, curTransform, colorchangethresh):
 
@@ -0,0 +1,172 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import math, time, collections
+import numpy
+
+# Per sample errors of the tracked coil pose to the planned pose
+TRACKING_ERRORS = ("translation", "twist", "tilt")
+
+#
+# 6-DoF tracking error
+#
+
+
+def computePoseError(mat, p, target):
+    """
+    Errors of the pose (3x3 mat, p) to the target (4x4, nested or numpy):
+    translation (mm), twist about the coil (z) axis and tilt of the coil
+    axis (degrees)
+    """
+    dx = p[0] - target[0][3]
+    dy = p[1] - target[1][3]
+    dz = p[2] - target[2][3]
+    # relative rotation target^T * mat, only the elements needed
+    r = [[sum(target[k][i] * mat[k][j] for k in range(3)) for j in range(3)]
+         for i in range(2)]
+    r22 = sum(target[k][2] * mat[k][2] for k in range(3))
+    # swing-twist about z: twist = 2 atan2(qz, qw) of the relative rotation
+    twist = math.degrees(math.atan2(r[1][0] - r[0][1], r[0][0] + r[1][1]))
+    tilt = math.degrees(math.acos(max(-1.0, min(1.0, r22))))
+    return math.sqrt(dx * dx + dy * dy + dz * dz), twist, tilt
+
+
+class TrackingErrorStats():
+    """
+    Tracking errors of the last window samples in preallocated ring
+    columns, with running sums (mean, RMS), monotonic queues (max) and the
+    time spent within tolerance, so that update() is O(1) (amortized for
+    the max). Twist enters the statistics as its magnitude.
+    """
+
+    def __init__(self, window=1000, tolTranslation=2.0, tolAngle=5.0):
+        self._window = window
+        self._tolTranslation = tolTranslation
+        self._tolAngle = tolAngle
+        self._errors = numpy.zeros((window, 3))
+        self._durations = numpy.zeros(window)
+        self._within = numpy.zeros(window, dtype=bool)
+        self._target = None
+        self._targetMatrix = None
+        self._targetMTime = None
+        self.reset()
+
+    def reset(self):
+        self._count = 0
+        self._lastTime = None
+        self._sums = [0.0, 0.0, 0.0]
+        self._sumSquares = [0.0, 0.0, 0.0]
+        self._timeTotal = 0.0
+        self._timeWithin = 0.0
+        self._maxQueues = [collections.deque() for _ in TRACKING_ERRORS]
+        self._current = (math.nan, math.nan, math.nan)
+
+    def __len__(self):
+        return min(self._count, self._window)
+
+    def current(self):
+        return self._current
+
+    def update(self, mat, p, target, t=None):
+        """
+        Add the errors of one pose (3x3 mat, p) to the target (vtkMatrix4x4)
+        and return them
+        """
+        errors = computePoseError(mat, p, self.utilTarget(target))
+        t = time.monotonic() if t is None else t
+        duration = 0.0 if self._lastTime is None else t - self._lastTime
+        self._lastTime = t
+        within = errors[0] <= self._tolTranslation and \
+            abs(errors[1]) <= self._tolAngle and errors[2] <= self._tolAngle
+
+        slot = self._count % self._window
+        if self._count >= self._window:
+            # drop the oldest sample from the running values
+            for k in range(3):
+                old = float(self._errors[slot, k])
+                self._sums[k] -= old
+                self._sumSquares[k] -= old * old
+            self._timeTotal -= float(self._durations[slot])
+            if self._within[slot]:
+                self._timeWithin -= float(self._durations[slot])
+
+        values = (errors[0], abs(errors[1]), errors[2])
+        for k in range(3):
+            self._errors[slot, k] = values[k]
+            self._sums[k] += values[k]
+            self._sumSquares[k] += values[k] * values[k]
+            queue = self._maxQueues[k]
+            while queue and queue[-1][1] <= values[k]:
+                queue.pop()
+            queue.append((self._count, values[k]))
+            if queue[0][0] <= self._count - self._window:
+                queue.popleft()
+        self._durations[slot] = duration
+        self._within[slot] = within
+        self._timeTotal += duration
+        if within:
+            self._timeWithin += duration
+        self._count += 1
+        if self._count % self._window == 0:
+            # resum once per window, against floating point drift
+            self.utilResum()
+        self._current = errors
+        return errors
+
+    def statistics(self):
+        """
+        {error: {"mean", "rms", "max"}} over the window, plus "within"
+        (fraction of the window time within tolerance) and "timeWithin" (s)
+        """
+        num = len(self)
+        res = {}
+        for k, name in enumerate(TRACKING_ERRORS):
+            if num == 0:
+                res[name] = {"mean": math.nan, "rms": math.nan, "max": math.nan}
+                continue
+            res[name] = {
+                "mean": self._sums[k] / num,
+                "rms": math.sqrt(max(self._sumSquares[k], 0.0) / num),
+                "max": self._maxQueues[k][0][1],
+            }
+        res["within"] = self._timeWithin / self._timeTotal \
+            if self._timeTotal > 0.0 else math.nan
+        res["timeWithin"] = self._timeWithin
+        return res
+
+    def utilTarget(self, target):
+        # the target only changes when replanned, a new matrix or MTime
+        mtime = target.GetMTime()
+        if target is not self._targetMatrix or mtime != self._targetMTime:
+            self._target = [[target.GetElement(r, c) for c in range(4)] for r in range(3)]
+            self._targetMatrix = target
+            self._targetMTime = mtime
+        return self._target
+
+    def utilResum(self):
+        num = len(self)
+        self._sums = [float(v) for v in self._errors[:num].sum(axis=0)]
+        self._sumSquares = [float(v) for v in (self._errors[:num] ** 2).sum(axis=0)]
+        self._timeTotal = float(self._durations[:num].sum())
+        self._timeWithin = float(self._durations[:num][self._within[:num]].sum())
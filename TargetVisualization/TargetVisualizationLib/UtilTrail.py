@@ -0,0 +1,109 @@
+"""
+MIT License
+
+Copyright (c) 2022 Yihao Liu, Johns Hopkins University
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import vtk
+import numpy
+from vtk.util import numpy_support
+
+#
+# Coil trail
+#
+
+
+class CoilTrail():
+    """
+    The last capacity coil positions as one polyline, with a tick along the
+    coil axis every axisStride samples, in a single polydata. Samples go to
+    a circular buffer of points updated in place, append() is O(1). The
+    polyline runs from the oldest to the newest sample; it is re-ordered
+    in markModified(), i.e. once per rendered frame (O(capacity)) and not
+    once per sample.
+    """
+
+    def __init__(self, capacity=500, axisLength=20.0, axisStride=10):
+        self._capacity = capacity
+        self._axisLength = axisLength
+        self._count = 0
+        self._orderedCount = None
+
+        # points 0..capacity-1 are the positions, capacity.. the axis tips
+        points = vtk.vtkPoints()
+        points.SetNumberOfPoints(2 * capacity)
+        self._points = numpy_support.vtk_to_numpy(points.GetData())
+        self._points[:] = 0.0
+
+        # one polyline through all the position slots, then the ticks
+        self._slots = numpy.arange(capacity, dtype=numpy.int64)
+        axisIds = self._slots[::axisStride]
+        self._connectivity = numpy.concatenate([
+            self._slots,
+            numpy.stack([axisIds, axisIds + capacity], axis=1).ravel(),
+        ])
+        self._offsets = numpy.concatenate([
+            [0], capacity + 2 * numpy.arange(axisIds.shape[0] + 1)
+        ]).astype(numpy.int64)
+        # the vtk arrays reference the numpy buffers, which are kept alive here
+        self._connectivityArray = numpy_support.numpy_to_vtkIdTypeArray(
+            self._connectivity, deep=False)
+        self._offsetsArray = numpy_support.numpy_to_vtkIdTypeArray(
+            self._offsets, deep=False)
+        self._lines = vtk.vtkCellArray()
+        self._lines.SetData(self._offsetsArray, self._connectivityArray)
+
+        self._polyData = vtk.vtkPolyData()
+        self._polyData.SetPoints(points)
+        self._polyData.SetLines(self._lines)
+
+    def polyData(self):
+        return self._polyData
+
+    def reset(self):
+        self._count = 0
+
+    def append(self, p, axis):
+        """
+        Add one sample, position p and unit coil axis
+        """
+        tip = [p[0] + self._axisLength * axis[0],
+               p[1] + self._axisLength * axis[1],
+               p[2] + self._axisLength * axis[2]]
+        if self._count == 0:
+            # collapse the whole trail onto the first sample, the slots not
+            # written yet then only add zero length segments
+            self._points[: self._capacity] = p
+            self._points[self._capacity:] = tip
+        slot = self._count % self._capacity
+        self._points[slot] = p
+        self._points[self._capacity + slot] = tip
+        self._count += 1
+
+    def markModified(self):
+        if self._orderedCount != self._count:
+            # start right after the newest slot (the oldest sample, or the
+            # collapsed first sample before the buffer wraps), end at it
+            self._orderedCount = self._count
+            self._connectivity[: self._capacity] = (
+                self._slots + self._count) % self._capacity
+            self._lines.SetData(self._offsetsArray, self._connectivityArray)
+        self._polyData.GetPoints().Modified()